@@ -1,7 +1,7 @@
 # Licensed under a 3-clause BSD style license - see LICENSE
 
 
-__all__ = ["AtmoGrid", "AtmoGridPhot", "AtmoGridDoppler", "AtmoGridSpec", "Vstack", "Atmo_grid"]
+__all__ = ["AtmoGrid", "AtmoGridPhot", "AtmoGridPhotStack", "AtmoGridDoppler", "AtmoGridSpec", "AtmoGridSpecPCA", "Vstack", "Atmo_grid"]
 
 import os
 import sys
@@ -17,6 +17,9 @@ from .. import Utils
 
 logger = logging.getLogger(__name__)
 
+## Shared memory blocks created by AtmoGrid.Export_shared in this process, keyed on name
+_shared_blocks = {}
+
 
 ##-----------------------------------------------------------------------------
 ## class AtmoGrid
@@ -98,6 +101,10 @@ class AtmoGrid(Column):
             shape = tuple(col.size for col in self.cols.values())
             if self.shape != shape:
                 raise ValueError('The dimension of the data grid and the cols are not matching.')
+        ## Detect the uniformly spaced axes, for which the axis lookup is done arithmetically
+        self.uniform_axes = {}
+        for colname in self.colnames:
+            self.uniform_axes[colname] = Utils.Series.Axis_uniform(self.cols[colname])
         return self
 
     def __copy__(self):
@@ -127,6 +134,53 @@ class AtmoGrid(Column):
     def colnames(self):
         return list(self.cols.keys())
 
+    @classmethod
+    def Attach_shared(cls, handle):
+        """
+        Return an atmosphere grid whose data is a zero-copy, read-only view
+        of a grid exported with Export_shared, typically in a worker process.
+        The axes, meta-data, name and description are the same as the
+        exported grid.
+
+        Parameters
+        ----------
+        handle : dict
+            Handle returned by Export_shared.
+
+        Examples
+        ----------
+          Examples::
+            In the parent process:
+                handle = atmo.Export_shared()
+                pool = multiprocessing.Pool(4, initializer=init, initargs=(handle,))
+            In the worker initializer:
+                atmo = AtmoGridSpec.Attach_shared(handle)
+        """
+        if handle['fln'] is not None:
+            data = np.load(handle['fln'], mmap_mode='r')
+            shm = None
+        else:
+            from multiprocessing import shared_memory
+            try:
+                shm = shared_memory.SharedMemory(name=handle['shm'], create=False, track=False)
+            except TypeError:
+                ## Before Python 3.13 attaching registers the block with the
+                ## resource tracker, which would unlink it when the worker
+                ## exits. The exporting process owns it, hence we unregister.
+                shm = shared_memory.SharedMemory(name=handle['shm'], create=False)
+                if os.name == 'posix':
+                    from multiprocessing import resource_tracker
+                    resource_tracker.unregister(shm._name, 'shared_memory')
+            data = np.ndarray(handle['shape'], dtype=handle['dtype'], buffer=shm.buf)
+            data.flags.writeable = False
+        cols = TableColumns([ Column(data=val, name=key, meta=meta) for key, val, meta in handle['cols'] ])
+        if cls is AtmoGrid:
+            cls = handle['cls']
+        self = cls(data=data, name=handle['name'], unit=handle['unit'], description=handle['description'], meta=deepcopy(handle['meta']), cols=cols)
+        ## Keep a reference to the shared memory block so that it is not closed while the grid is alive
+        self._shm = shm
+        return self
+
     def copy(self, order='C', data=None, copy_data=True):
         """
         Copy of the instance. If ``data`` is supplied
@@ -139,6 +193,56 @@ class AtmoGrid(Column):
 
         return self.__class__(name=self.name, data=data, unit=self.unit, format=self.format, description=self.description, meta=deepcopy(self.meta), cols=self.cols)
 
+    def Export_shared(self, fln=None):
+        """
+        Export the data of the atmosphere grid so that other processes can
+        attach it without copying (see Attach_shared). The grid is only
+        held once in memory regardless of the number of worker processes.
+
+        By default the data is copied into a block of shared memory
+        (multiprocessing.shared_memory). Alternatively, if a filename is
+        provided, it is saved as a .npy file which is memory-mapped by the
+        processes attaching it.
+
+        The shared memory block remains allocated until Release_shared is
+        called with the handle.
+
+        Parameters
+        ----------
+        fln : str or None
+            Filename of the .npy file to write. If None, shared memory is used.
+
+        Returns
+        -------
+        handle : dict
+            A small, picklable, description of the grid to be passed to
+            the worker processes.
+
+        Examples
+        ----------
+          Examples::
+            handle = atmo.Export_shared()
+            ...
+            AtmoGrid.Release_shared(handle)
+        """
+        data = np.ascontiguousarray(self.view(np.ndarray))
+        handle = {'cls':self.__class__, 'name':self.name, 'unit':self.unit, 'description':self.description, 'meta':deepcopy(self.meta),
+                  'cols':[ (key, np.asarray(val), dict(val.meta)) for key, val in self.cols.items() ],
+                  'shape':data.shape, 'dtype':data.dtype.str, 'fln':None, 'shm':None}
+        if fln is not None:
+            if not fln.endswith('.npy'):
+                fln += '.npy'
+            np.save(fln, data)
+            handle['fln'] = fln
+        else:
+            from multiprocessing import shared_memory
+            shm = shared_memory.SharedMemory(create=True, size=max(data.nbytes,1))
+            np.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf)[...] = data
+            handle['shm'] = shm.name
+            ## The exporting process owns the shared memory block
+            _shared_blocks[shm.name] = shm
+        return handle
+
     def Fill_nan_old(self, axis=0, method='spline', bounds_error=False, fill_value=np.nan, k=1, s=1):
         """
         Fill the empty grid cells (marked as np.nan) with interpolated values
@@ -325,6 +429,7 @@ class AtmoGrid(Column):
             #print('y_interp', y_interp)
         self.data[inds_fill] = vals_fill
 
+    @Utils.Profiler.Profiled()
     def Getaxispos(self, colname, x):
         """
         Return the index and weight of the linear interpolation of the point
@@ -342,7 +447,18 @@ class AtmoGrid(Column):
           Examples::
             temp = Getaxispos('logtemp', np.log(3550.)
             logg = Getaxispos('logg', [4.11,4.13,4.02])
+
+        Notes
+        ----------
+        If the axis is uniformly spaced (see the uniform_axes attribute),
+        the index is calculated arithmetically instead of by binary search.
         """
+        try:
+            uniform = self.uniform_axes[colname]
+        except (AttributeError, KeyError):
+            uniform = Utils.Series.Axis_uniform(self.cols[colname])
+        if uniform is not None:
+            return Utils.Series.Getaxispos_uniform(self.cols[colname], x, *uniform)
         if isinstance(x, (list, tuple, np.ndarray)):
             return Utils.Series.Getaxispos_vector(self.cols[colname], x)
         else:
@@ -399,7 +515,7 @@ class AtmoGrid(Column):
             raise Exception("h5py is needed for ReadHDF5")
         f = h5py.File(fln, 'r')
 
-        flux = f['flux'].value
+        flux = f['flux'][()]
 
         meta = {}
         for key_attrs, val_attrs in f.attrs.items():
@@ -412,12 +528,44 @@ class AtmoGrid(Column):
         grp = f['cols']
         for col in colnames:
             dset = grp[col]
-            cols.append( Column(data=dset.value, name=col, meta=dict(iter(dset.attrs.items()))) )
+            cols.append( Column(data=dset[()], name=col, meta=dict(iter(dset.attrs.items()))) )
         cols = TableColumns(cols)
 
         f.close()
         return cls(data=flux, name=name, description=description, meta=meta, cols=cols)
 
+    @staticmethod
+    def Release_shared(handle):
+        """
+        Release the shared memory block (or delete the memory-mapped file)
+        of a grid exported with Export_shared. It should be called by the
+        exporting process once the workers are done with the grid.
+
+        Parameters
+        ----------
+        handle : dict
+            Handle returned by Export_shared.
+        """
+        if handle['fln'] is not None:
+            if os.path.exists(handle['fln']):
+                os.remove(handle['fln'])
+        else:
+            shm = _shared_blocks.pop(handle['shm'], None)
+            if shm is not None:
+                shm.close()
+                ## Workers sharing our resource tracker may have unregistered
+                ## the block (see Attach_shared). Registering is idempotent and
+                ## avoids a spurious error from the tracker on unlink.
+                if os.name == 'posix':
+                    from multiprocessing import resource_tracker
+                    resource_tracker.register(shm._name, 'shared_memory')
+                try:
+                    shm.unlink()
+                except FileNotFoundError:
+                    if os.name == 'posix':
+                        resource_tracker.unregister(shm._name, 'shared_memory')
+        return
+
     def SubGrid(self, *args):
         """
         Return a sub-grid of the atmosphere grid.
@@ -632,6 +780,7 @@ class AtmoGridPhot(AtmoGrid):
 
         return self
 
+    @Utils.Profiler.Profiled()
     def Get_flux(self, val_logtemp, val_logg, val_mu, val_area, **kwargs):
         """
         Return the flux interpolated from the atmosphere grid.
@@ -654,6 +803,7 @@ class AtmoGridPhot(AtmoGrid):
         flux = Utils.Grid.Interp_photometry(self.data, w1logtemp, w1logg, w1mu, jlogtemp, jlogg, jmu, val_area, val_mu)
         return flux
 
+    @Utils.Profiler.Profiled()
     def Get_flux_details(self, val_logtemp, val_logg, val_mu, val_area, val_v, **kwargs):
         """
         Returns the flux interpolated from the atmosphere grid.
@@ -677,6 +827,7 @@ class AtmoGridPhot(AtmoGrid):
         flux, Keff, vsini, temp = Utils.Grid.Interp_photometry_details(self.data, w1logtemp, w1logg, w1mu, jlogtemp, jlogg, jmu, val_area, val_mu, val_v, val_logtemp)
         return flux, Keff, vsini, temp
 
+    @Utils.Profiler.Profiled()
     def Get_flux_doppler(self, val_logtemp, val_logg, val_mu, val_area, val_vel, atmo_doppler, **kwargs):
         """
         Return the flux interpolated from the atmosphere grid.
@@ -704,6 +855,7 @@ class AtmoGridPhot(AtmoGrid):
         flux = Utils.Grid.Interp_photometry_doppler(self.data, w1logtemp, w1logg, w1mu, jlogtemp, jlogg, jmu, val_area, val_mu, val_vel, atmo_doppler.data)
         return flux
 
+    @Utils.Profiler.Profiled()
     def Get_flux_doppler_nosum(self, val_logtemp, val_logg, val_mu, val_area, val_vel, atmo_doppler, **kwargs):
         """
         Return the flux interpolated from the atmosphere grid.
@@ -732,6 +884,7 @@ class AtmoGridPhot(AtmoGrid):
         flux = Utils.Grid.Interp_photometry_doppler_nosum(self.data, w1logtemp, w1logg, w1mu, jlogtemp, jlogg, jmu, val_area, val_mu, val_vel, atmo_doppler.data)
         return flux
 
+    @Utils.Profiler.Profiled()
     def Get_flux_Keff(self, val_logtemp, val_logg, val_mu, val_area, val_v, **kwargs):
         """
         Returns the flux interpolated from the atmosphere grid.
@@ -755,6 +908,7 @@ class AtmoGridPhot(AtmoGrid):
         flux, Keff = Utils.Grid.Interp_photometry_Keff(self.data, w1logtemp, w1logg, w1mu, jlogtemp, jlogg, jmu, val_area, val_mu, val_v)
         return flux, Keff
 
+    @Utils.Profiler.Profiled()
     def Get_flux_nosum(self, val_logtemp, val_logg, val_mu, val_area, **kwargs):
         """
         Returns the flux interpolated from the atmosphere grid.
@@ -778,6 +932,166 @@ class AtmoGridPhot(AtmoGrid):
         return flux
 
 
+##-----------------------------------------------------------------------------
+## class AtmoGridPhotStack
+class AtmoGridPhotStack(AtmoGrid):
+    """
+    Define a subclass of AtmoGrid which stacks several photometric bands
+    sharing the same (logtemp, logg, mu) axes into a single grid having
+    axes (logtemp, logg, mu, band).
+
+    The axis positions and interpolation weights are calculated once per
+    surface element and the fluxes of all the bands are returned in a
+    single pass, which is much cheaper than evaluating each AtmoGridPhot
+    separately.
+
+    The meta data should contain:
+
+    Parameters
+    ----------
+    zp: ndarray
+        The zeropoint of each band for conversion from flux to mag
+    ext: ndarray
+        The Aband/Av extinction ratio of each band
+    bands: list
+        The name of each band
+
+    Examples
+    --------
+    A AtmoGridPhotStack is most easily created from a list of AtmoGridPhot:
+
+      Examples::
+
+        atmo_stack = AtmoGridPhotStack.From_grids([atmo_g, atmo_r, atmo_i])
+        fluxes = atmo_stack.Get_flux(val_logtemp, val_logg, val_mu, val_area)
+
+    The individual bands can be extracted back:
+
+        atmo_r = atmo_stack.Band(1)
+
+    Notes
+    --------------
+    The interpolation is always performed using the numpy backend of
+    Utils.Grid. The flux methods return an extra trailing dimension having
+    the size of the number of bands.
+    """
+    def __new__(cls, *args, **kwargs):
+        self = super(AtmoGridPhotStack, cls).__new__(cls, *args, **kwargs)
+
+        if self.ndim != 4:
+            raise ValueError('The data grid must have the dimensions (logtemp, logg, mu, band).')
+        nbands = self.shape[-1]
+
+        ## This class requires a certain number of keywords in the meta field
+        if 'zp' not in self.meta:
+            self.meta['zp'] = np.zeros(nbands, dtype=float)
+        if 'ext' not in self.meta:
+            self.meta['ext'] = np.ones(nbands, dtype=float)
+        if 'bands' not in self.meta:
+            self.meta['bands'] = [str(i) for i in range(nbands)]
+        self.meta['zp'] = np.asarray(self.meta['zp'], dtype=float)
+        self.meta['ext'] = np.asarray(self.meta['ext'], dtype=float)
+
+        return self
+
+    def Band(self, i):
+        """
+        Return the AtmoGridPhot instance of a given band.
+
+        Parameters
+        ----------
+        i : int
+            Index of the band in the stack.
+
+        Examples
+        ----------
+          Examples::
+            atmo_r = atmo_stack.Band(1)
+        """
+        meta = deepcopy(self.meta)
+        meta['zp'] = self.meta['zp'][i]
+        meta['ext'] = self.meta['ext'][i]
+        meta.pop('bands')
+        cols = [ self.cols[colname] for colname in self.colnames[:3] ]
+        return AtmoGridPhot(name=self.meta['bands'][i], data=self.data[...,i].copy(), unit=self.unit, format=self.format, description=self.description, meta=meta, cols=cols)
+
+    @classmethod
+    def From_grids(cls, grids):
+        """
+        Stack a list of AtmoGridPhot instances having the same axes.
+
+        Parameters
+        ----------
+        grids : list
+            List of AtmoGridPhot instances.
+
+        Examples
+        ----------
+          Examples::
+            atmo_stack = AtmoGridPhotStack.From_grids([atmo_g, atmo_r, atmo_i])
+        """
+        colnames = grids[0].colnames
+        for grid in grids[1:]:
+            if grid.colnames != colnames:
+                raise Exception("Grids must all have the same dimension quantities")
+            for colname in colnames:
+                if not np.array_equal(grid.cols[colname], grids[0].cols[colname]):
+                    raise Exception("Grids must all have the same axis values for {}".format(colname))
+        data = np.stack([grid.data for grid in grids], axis=-1)
+        cols = [ grids[0].cols[colname] for colname in colnames ] + [ ('band', np.arange(len(grids), dtype=float)) ]
+        meta = {'zp': np.array([grid.meta['zp'] for grid in grids]),
+                'ext': np.array([grid.meta['ext'] for grid in grids]),
+                'bands': [grid.name if grid.name is not None else str(i) for i,grid in enumerate(grids)]}
+        return cls(data=data, name='+'.join(meta['bands']), description='Stack of photometric bands', cols=cols, meta=meta)
+
+    @Utils.Profiler.Profiled()
+    def Get_flux(self, val_logtemp, val_logg, val_mu, val_area, **kwargs):
+        """
+        Return the flux of all the bands interpolated from the atmosphere grid.
+
+        Parameters
+        ----------
+        val_logtemp: log effective temperature
+        val_logg: log surface gravity
+        val_mu: cos(angle) of angle of emission
+        val_area: area of the surface element
+
+        Examples
+        ----------
+          Examples::
+            fluxes = Get_flux(val_logtemp, val_logg, val_mu, val_area)
+        """
+        return self.Get_flux_nosum(val_logtemp, val_logg, val_mu, val_area).sum(axis=-2)
+
+    @Utils.Profiler.Profiled()
+    def Get_flux_nosum(self, val_logtemp, val_logg, val_mu, val_area, **kwargs):
+        """
+        Returns the flux of all the bands interpolated from the atmosphere
+        grid, not summed over the surface elements. The returned array has
+        a shape (nsurf, nbands).
+
+        Parameters
+        ----------
+        val_logtemp: log of effective temperature
+        val_logg: log of surface gravity
+        val_mu: cos(angle) of angle of emission
+        val_area: area of the surface element
+
+        Examples
+        ----------
+          Examples::
+            fluxes = Get_flux_nosum(val_logtemp, val_logg, val_mu, val_area)
+        """
+        w1logtemp, jlogtemp = self.Getaxispos('logtemp', val_logtemp)
+        w1logg, jlogg = self.Getaxispos('logg', val_logg)
+        w1mu, jmu = self.Getaxispos('mu', val_mu)
+        tmp_flux = Utils.Grid.Interp_3Dgrid_numpy(self.data, w1logtemp, w1logg, w1mu, jlogtemp, jlogg, jmu)
+        ## Same order of operations as Utils.Grid.Interp_photometry_nosum_numpy
+        ## so that each band is identical to its AtmoGridPhot
+        flux = np.exp(tmp_flux) * np.asarray(val_area)[...,None] * np.asarray(val_mu)[...,None]
+        return flux
+
+
 ##-----------------------------------------------------------------------------
 ## class AtmoGridSpec
 class AtmoGridSpec(AtmoGrid):
@@ -800,6 +1114,13 @@ class AtmoGridSpec(AtmoGrid):
         Spacing between wavelength points in v/c units. The assumption is that
         it is constant throughout the array (in log(wav) space). If not
         provided, will use (wav[1]-wav[0])/wav[0].
+    linear : bool
+        Whether the grid contains flux (True) or log(flux) (False, default)
+        values. See To_linear.
+    binned : bool
+        Whether Get_flux_doppler uses the velocity-binned synthesis (True)
+        or interpolates a spectrum for each surface element (False, default).
+        See Utils.Grid.Interp_doppler_binned.
 
     Also recommended would be:
     units: str
@@ -837,10 +1158,15 @@ class AtmoGridSpec(AtmoGrid):
             self.meta['zp'] = 0.0
         if 'delta_v' not in self.meta:
             self.meta['delta_v'] = (self.cols['wav'][1]-self.cols['wav'][0]) / self.cols['wav'][0]
+        if 'linear' not in self.meta:
+            self.meta['linear'] = False
+        if 'binned' not in self.meta:
+            self.meta['binned'] = False
 
         return self
 
-    def Get_flux_doppler(self, val_logtemp, val_logg, val_mu, val_area, val_vel, **kwargs):
+    @Utils.Profiler.Profiled()
+    def Get_flux_doppler(self, val_logtemp, val_logg, val_mu, val_area, val_vel, binned=None, **kwargs):
         """
         Return the spectrum interpolated from the atmosphere grid.
 
@@ -854,6 +1180,10 @@ class AtmoGridSpec(AtmoGrid):
         val_mu: cos(angle) of angle of emission
         val_area: area of the surface element
         val_vel: velocity in v/c units.
+        binned: whether to use the velocity-binned synthesis, whose cost
+            is nearly independent of the number of surface elements. It
+            interpolates linearly in flux, as in the linear mode. If None,
+            uses self.meta['binned'].
 
         Examples
         ----------
@@ -866,36 +1196,47 @@ class AtmoGridSpec(AtmoGrid):
         #w1wav, jwav = self.Getaxispos('wav', val_vel/self.meta['delta_v'])
         w1wav, jwav = np.modf(val_vel/self.meta['delta_v'])
         jwav = jwav.astype(int)
-        logger.log(5, '-'*20)
-        logger.log(5, 'w1logtemp')
-        logger.log(5, w1logtemp)
-        logger.log(5, '-'*20)
-        logger.log(5, 'jlogtemp')
-        logger.log(5, jlogtemp)
-        logger.log(5, '-'*20)
-        logger.log(5, 'w1logg')
-        logger.log(5, w1logg)
-        logger.log(5, '-'*20)
-        logger.log(5, 'jlogg')
-        logger.log(5, jlogg)
-        logger.log(5, '-'*20)
-        logger.log(5, 'w1mu')
-        logger.log(5, w1mu)
-        logger.log(5, '-'*20)
-        logger.log(5, 'jmu')
-        logger.log(5, jmu)
-        logger.log(5, '-'*20)
-        logger.log(5, 'w1wav')
-        logger.log(5, w1wav)
-        logger.log(5, '-'*20)
-        logger.log(5, 'jwav')
-        logger.log(5, jwav)
-        logger.log(5, '-'*20)
-
-        spectrum = Utils.Grid.Interp_doppler(self.data, w1logtemp, w1logg, w1mu, w1wav, jlogtemp, jlogg, jmu, jwav, val_area, val_mu)
+        Utils.Tracer.Record('AtmoGridSpec.Get_flux_doppler', w1logtemp=w1logtemp, jlogtemp=jlogtemp, w1logg=w1logg, jlogg=jlogg, w1mu=w1mu, jmu=jmu, w1wav=w1wav, jwav=jwav)
+
+        if binned is None:
+            binned = self.meta.get('binned', False)
+        if binned:
+            spectrum = Utils.Grid.Interp_doppler_binned(self.data, w1logtemp, w1logg, w1mu, w1wav, jlogtemp, jlogg, jmu, jwav, val_area, val_mu, linear=self.meta['linear'])
+        else:
+            spectrum = Utils.Grid.Interp_doppler(self.data, w1logtemp, w1logg, w1mu, w1wav, jlogtemp, jlogg, jmu, jwav, val_area, val_mu, linear=self.meta['linear'])
 
         return spectrum
 
+    def To_linear(self):
+        """
+        Return a copy of the atmosphere grid in which the log(flux) values
+        have been exponentiated. The interpolation in Get_flux_doppler is
+        then performed linearly in flux, which avoids the evaluation of an
+        exponential for each surface element and wavelength.
+
+        Notes
+        ----------
+        Interpolating linearly in flux rather than in log(flux) between two
+        grid values f0 and f1 with weight w overestimates the flux by a
+        relative amount of about w*(1-w)/2 * ln(f1/f0)**2, i.e. at most
+        ln(f1/f0)**2/8 halfway between grid points. For instance, adjacent
+        grid values differing by 10% (20%) lead to errors smaller than 0.11%
+        (0.42%). The error is largest in deep lines and along the
+        temperature axis of coarse grids. The benchmarks module reports the
+        difference between the two modes for a synthetic grid.
+
+        Examples
+        ----------
+          Examples::
+            atmo_linear = atmo.To_linear()
+            spectrum = atmo_linear.Get_flux_doppler(val_logtemp, val_logg, val_mu, val_area, val_vel)
+        """
+        if self.meta['linear']:
+            return self.copy()
+        meta = deepcopy(self.meta)
+        meta['linear'] = True
+        return self.__class__(name=self.name, data=np.exp(self.data), unit=self.unit, format=self.format, description=self.description, meta=meta, cols=self.cols)
+
     @classmethod
     def ReadHDF5(cls, flns, verbose=True):
         ## If a single file is requested, we call the parent class reader
@@ -948,6 +1289,190 @@ class AtmoGridSpec(AtmoGrid):
         return cls(data=flux, name=name, description=description, meta=meta, cols=cols)
 
 
+##-----------------------------------------------------------------------------
+## class AtmoGridSpecPCA
+class AtmoGridSpecPCA(AtmoGrid):
+    """
+    Define a subclass of AtmoGrid containing a spectroscopic grid compressed
+    by principal component analysis.
+
+    The spectra (in flux) of the (logtemp, logg, mu) nodes of an AtmoGridSpec
+    are decomposed as the mean spectrum plus a linear combination of K
+    eigen-spectra. The grid data contains the coefficients, with axes
+    (logtemp, logg, mu, pc), the first coefficient being that of the mean
+    spectrum (i.e. 1). The basis spectra, with dimensions (K+1, nwav), are
+    stored in self.basis and the wavelengths in self.wav.
+
+    Because the spectra are linear in the coefficients, the flux of the
+    surface elements can be accumulated in coefficient space and the
+    disk-integrated spectrum is only reconstructed once per velocity bin.
+
+    The meta data should contain:
+
+    Parameters
+    ----------
+    zp : float
+        The zeropoint of the band for conversion from flux to mag
+    delta_v : float
+        Spacing between wavelength points in v/c units.
+    error : float
+        Relative rms reconstruction error of the compressed grid.
+
+    Examples
+    --------
+    A AtmoGridSpecPCA is created from an AtmoGridSpec:
+
+      Examples::
+
+        atmo_pca = AtmoGridSpecPCA.From_grid(atmo, tol=1e-3)
+        spectrum = atmo_pca.Get_flux_doppler(val_logtemp, val_logg, val_mu, val_area, val_vel)
+
+    To read/save a file (same layout as AtmoGrid, with the extra datasets
+    'basis' and 'wav'):
+
+        atmo_pca.WriteHDF5('spectrum_pca.h5')
+        atmo_pca = AtmoGridSpecPCA.ReadHDF5('spectrum_pca.h5')
+    """
+    def __new__(cls, *args, **kwargs):
+        basis = kwargs.pop('basis', None)
+        wav = kwargs.pop('wav', None)
+        self = super(AtmoGridSpecPCA, cls).__new__(cls, *args, **kwargs)
+
+        if self.ndim != 4:
+            raise ValueError('The data grid must have the dimensions (logtemp, logg, mu, pc).')
+        if basis is None or wav is None:
+            raise ValueError('The basis spectra and the wavelengths must be provided.')
+        self.basis = np.asarray(basis, dtype=float)
+        self.wav = np.asarray(wav, dtype=float)
+        if self.basis.shape != (self.shape[-1], self.wav.size):
+            raise ValueError('The basis must have the dimensions (pc, wav).')
+
+        ## This class requires a certain number of keywords in the meta field
+        if 'zp' not in self.meta:
+            self.meta['zp'] = 0.0
+        if 'delta_v' not in self.meta:
+            self.meta['delta_v'] = (self.wav[1]-self.wav[0]) / self.wav[0]
+
+        return self
+
+    @classmethod
+    def From_grid(cls, atmo, ncomp=None, tol=1e-3):
+        """
+        Compress an AtmoGridSpec.
+
+        Parameters
+        ----------
+        atmo : AtmoGridSpec
+            Spectroscopic grid to compress.
+        ncomp : int
+            Number of eigen-spectra to keep. If None, the smallest number
+            such that the relative rms reconstruction error is below tol.
+        tol : float
+            Maximum relative rms reconstruction error, i.e.
+            ||flux - flux_reconstructed|| / ||flux|| over the whole grid.
+
+        Examples
+        ----------
+          Examples::
+            atmo_pca = AtmoGridSpecPCA.From_grid(atmo, tol=1e-3)
+        """
+        flux = atmo.data if atmo.meta['linear'] else np.exp(atmo.data)
+        nwav = flux.shape[-1]
+        flux = flux.reshape(-1, nwav)
+        mean = flux.mean(axis=0)
+        u, sv, vt = np.linalg.svd(flux - mean, full_matrices=False)
+        norm2 = (flux**2).sum()
+        ## Residual squared norm when keeping the first k components
+        residual2 = np.r_[np.cumsum((sv**2)[::-1])[::-1], 0.]
+        if ncomp is None:
+            ncomp = int(np.nonzero(residual2 <= tol**2 * norm2)[0][0])
+        ncomp = min(ncomp, sv.size)
+        coeffs = np.empty((flux.shape[0], ncomp+1), dtype=float)
+        coeffs[:,0] = 1.
+        coeffs[:,1:] = u[:,:ncomp] * sv[:ncomp]
+        basis = np.vstack([mean, vt[:ncomp]])
+        meta = deepcopy(atmo.meta)
+        meta.pop('linear', None)
+        meta.pop('binned', None)
+        meta['error'] = float(np.sqrt(residual2[ncomp] / norm2))
+        logger.info("Kept {} eigen-spectra out of {}, relative rms error {:.3g}".format(ncomp, sv.size, meta['error']))
+        cols = [ atmo.cols[colname] for colname in atmo.colnames[:3] ] + [ ('pc', np.arange(ncomp+1, dtype=float)) ]
+        return cls(data=coeffs.reshape(atmo.shape[:3]+(ncomp+1,)), name=atmo.name, description=atmo.description, meta=meta, cols=cols, basis=basis, wav=atmo.cols['wav'])
+
+    @Utils.Profiler.Profiled()
+    def Get_flux_doppler(self, val_logtemp, val_logg, val_mu, val_area, val_vel, **kwargs):
+        """
+        Return the spectrum interpolated from the compressed atmosphere grid.
+
+        Same as AtmoGridSpec.Get_flux_doppler in linear mode, except that the
+        coefficients are interpolated and accumulated per velocity bin,
+        and the spectrum reconstructed at the end.
+
+        Parameters
+        ----------
+        val_logtemp: log effective temperature
+        val_logg: log surface gravity
+        val_mu: cos(angle) of angle of emission
+        val_area: area of the surface element
+        val_vel: velocity in v/c units.
+
+        Examples
+        ----------
+          Examples::
+            spectrum = Get_flux_doppler(val_logtemp, val_logg, val_mu, val_area, val_vel)
+        """
+        w1logtemp, jlogtemp = self.Getaxispos('logtemp', val_logtemp)
+        w1logg, jlogg = self.Getaxispos('logg', val_logg)
+        w1mu, jmu = self.Getaxispos('mu', val_mu)
+        w1wav, jwav = np.modf(val_vel/self.meta['delta_v'])
+        jwav = jwav.astype(int)
+        Utils.Tracer.Record('AtmoGridSpecPCA.Get_flux_doppler', w1logtemp=w1logtemp, jlogtemp=jlogtemp, w1logg=w1logg, jlogg=jlogg, w1mu=w1mu, jmu=jmu, w1wav=w1wav, jwav=jwav)
+
+        spectrum = Utils.Grid.Interp_doppler_pca(self.data, self.basis, w1logtemp, w1logg, w1mu, w1wav, jlogtemp, jlogg, jmu, jwav, val_area, val_mu)
+
+        return spectrum
+
+    def Reconstruct(self):
+        """
+        Return the AtmoGridSpec (in linear mode) reconstructed from the
+        compressed grid.
+
+        Examples
+        ----------
+          Examples::
+            atmo_linear = atmo_pca.Reconstruct()
+        """
+        meta = deepcopy(self.meta)
+        meta.pop('error', None)
+        meta['linear'] = True
+        cols = [ self.cols[colname] for colname in self.colnames[:3] ] + [ ('wav', self.wav) ]
+        return AtmoGridSpec(data=np.dot(self.data, self.basis), name=self.name, description=self.description, meta=meta, cols=cols)
+
+    @classmethod
+    def ReadHDF5(cls, fln):
+        try:
+            import h5py
+        except ImportError:
+            raise Exception("h5py is needed for ReadHDF5")
+        atmo = AtmoGrid.ReadHDF5(fln)
+        f = h5py.File(fln, 'r')
+        basis = f['basis'][()]
+        wav = f['wav'][()]
+        f.close()
+        return cls(data=atmo.data, name=atmo.name, description=atmo.description, meta=atmo.meta, cols=atmo.cols, basis=basis, wav=wav)
+
+    def WriteHDF5(self, fln, overwrite=False):
+        try:
+            import h5py
+        except ImportError:
+            raise Exception("h5py is needed for WriteHDF5")
+        super(AtmoGridSpecPCA, self).WriteHDF5(fln, overwrite=overwrite)
+        f = h5py.File(fln, 'a')
+        f.create_dataset(name='basis', data=self.basis)
+        f.create_dataset(name='wav', data=self.wav)
+        f.close()
+
+
 ##-----------------------------------------------------------------------------
 ## Vstack function
 def Vstack(grids, verbose=False):
@@ -1060,6 +1585,10 @@ class Atmo_grid:
         self.mu = mu
         self.leff = leff
         self.h = h
+        ## Detect the uniformly spaced axes
+        self.uniform_axes = []
+        for xx in (self.logtemp, self.logg, self.mu):
+            self._Axis_uniform(xx)
         return
 
     def Get_flux(self, val_logtemp, val_logg, val_mu, val_area, **kwargs):
@@ -1150,12 +1679,32 @@ class Atmo_grid:
 
     def Getaxispos(self, xx, x):
         """
+        Returns the weight and index of the linear interpolation of x
+        along the axis xx. Uniformly spaced axes are detected once and
+        looked up arithmetically instead of by binary search.
         """
+        uniform = self._Axis_uniform(xx)
+        if uniform is not None:
+            return Utils.Series.Getaxispos_uniform(xx, x, *uniform)
         if isinstance(x, (list, tuple, np.ndarray)):
             return Utils.Series.Getaxispos_vector(xx, x)
         else:
             return Utils.Series.Getaxispos_scalar(xx, x)
 
+    def _Axis_uniform(self, xx):
+        """
+        Returns the (x0, dx) of the axis xx if it is uniformly spaced, None
+        otherwise. The result is cached for each axis array.
+        """
+        if not hasattr(self, 'uniform_axes'):
+            self.uniform_axes = []
+        for axis, uniform in self.uniform_axes:
+            if axis is xx:
+                return uniform
+        uniform = Utils.Series.Axis_uniform(xx)
+        self.uniform_axes.append( (xx, uniform) )
+        return uniform
+
     def Getaxispos_old(self, xx, x):
         """
         OBSOLETE!
@@ -241,8 +241,7 @@ class Atmo_spectro_BTSettl7(Atmo_grid):
         logg = self.logg
         mu = self.mu
         logger.log(9, "Getting temp indices")
-        logger.log(5, "logtemp.min() {}, logtemp.max() {}".format(np.min(logtemp),np.max(logtemp)) )
-        logger.log(5, "val_logtemp.min() {}, val_logtemp.max() {}".format(np.min(val_logtemp),np.max(val_logtemp)) )
+        Utils.Tracer.Record(self.__class__.__name__+'.Get_flux_doppler', logtemp=logtemp, val_logtemp=val_logtemp, val_logg=val_logg, val_mu=val_mu, val_vel=val_vel)
         wtemp, jtemp = self.Getaxispos(logtemp,val_logtemp)
         logger.log(9, "Getting logg indices")
         wlogg, jlogg = self.Getaxispos(logg,val_logg)
@@ -3,6 +3,8 @@
 
 __all__ = ["Star"]
 
+import os
+
 from ..Utils.import_modules import *
 from .. import Utils
 from .Star_base import Star_base
@@ -26,8 +28,13 @@ class Star(Star_base):
         y: Along the orbital plane along the orbital motion.
         z: Along the orbital angular momentum.
     """
+    ## Attributes computed by self._Surface, which are stored in the surface cache
+    _surface_attrs = ['qp1by2om2', 'L1', 'rc_l1', 'psi0', 'rc_pole', 'logg_pole', 'rc_eq', 'logg_eq', 'r_vertices', 'rc', 'rx', 'coschi', 'area', 'logg', 'gradx', 'grady', 'gradz']
+
     def __init__(self, ndiv, atmo_grid=None, read=False, oldchi=False):
         Star_base.__init__(self, ndiv, atmo_grid=atmo_grid)
+        # Whether the faces follow the subdivision hierarchy of Utils.Tessellation.Make_geodesic
+        self.hierarchical = False
         if read:
             self._Read_geodesic()
         else:
@@ -50,8 +57,12 @@ class Star(Star_base):
         except:
             print( "You likely don't have the PyGTS package installed on your computer." )
             print( "It is impossible to create the surface vertices from scratch." )
-            print( "Will trying reading them from the restart file instead." )
-            self._Read_geodesic()
+            if os.path.isfile(os.path.join(Utils.Tessellation._Geodesic_path(), 'geodesic_n%i.txt' %self.ndiv)):
+                print( "Will trying reading them from the restart file instead." )
+                self._Read_geodesic()
+            else:
+                print( "Will generate the surface vertices using numpy instead." )
+                self._Initialization()
             return
         # Generate the geodesic primitives
         s = gts.sphere(self.ndiv)
@@ -72,6 +83,9 @@ class Star(Star_base):
         # The cosine of x,y,z for the center of the faces. shape = n_faces, 3
         print( "calculating the angles" )
         self.cosx, self.cosy, self.cosz = mesh.mean(axis=1).T
+        # The mirror images of the faces and vertices under y -> -y and z -> -z
+        self.mirror_faces = Utils.Tessellation.Mirror_symmetry(self.cosx, self.cosy, self.cosz)
+        self.mirror_vertices = Utils.Tessellation.Mirror_symmetry(self.vertices[:,0], self.vertices[:,1], self.vertices[:,2])
         return
 
     def _Initialization(self):
@@ -85,8 +99,9 @@ class Star(Star_base):
             Note: when only 5 faces associated, 6th value is equal to -99
         """
         print( "Generating the geodesic surface" )
-        # Generate the geodesic primitives
-        self.n_faces, self.n_vertices, self.faces, self.vertices, self.assoc = Utils.Tessellation.Make_geodesic(self.ndiv)
+        # Generate the geodesic primitives. Note that ndiv-1 subdivisions match the PyGTS and precalculated surfaces.
+        self.n_faces, self.n_vertices, self.faces, self.vertices, self.assoc = Utils.Tessellation.Make_geodesic(self.ndiv-1)
+        self.hierarchical = True
         # We will pre-calculate the surface areas. They will need to be multiplied by rc^2.
         # The calculation is simply the Pythagorean sum of the areas of the respective projections on the x,y,z planes.
         print( "meshing the surface" )
@@ -96,6 +111,9 @@ class Star(Star_base):
         # The cosine of x,y,z for the center of the faces. shape = n_faces, 3
         print( "calculating the angles" )
         self.cosx, self.cosy, self.cosz = mesh.mean(axis=1).T
+        # The mirror images of the faces and vertices under y -> -y and z -> -z
+        self.mirror_faces = Utils.Tessellation.Mirror_symmetry(self.cosx, self.cosy, self.cosz)
+        self.mirror_vertices = Utils.Tessellation.Mirror_symmetry(self.vertices[:,0], self.vertices[:,1], self.vertices[:,2])
         return
 
     def Outline(self, ntheta=100, debug=False):
@@ -125,33 +143,33 @@ class Star(Star_base):
         The information about the geodesic surface on the unit
         sphere has already been precalculated. We simply load the
         one have the desired precision.
+
+        The primitives are read from a binary cache and shared
+        (read-only) by all the Star instances of the process. See
+        Utils.Tessellation.Read_geodesic.
         """
-        #f = open('geodesic/geodesic_n%i.txt'%self.ndiv, 'r')
-        f = open(Utils.__path__[0][:-5]+'geodesic/geodesic_n%i.txt'%self.ndiv, 'r')
-        lines = f.readlines()
+        prim = Utils.Tessellation.Read_geodesic(self.ndiv)
 
         # We store the number of vertices, faces and edges as class variables.
-        tmp, self.n_vertices, self.n_faces, self.n_edges = lines[0].split()
-        self.n_vertices = int(self.n_vertices)
-        self.n_faces = int(self.n_faces)
-        self.n_edges = int(self.n_edges)
+        self.n_vertices = prim['n_vertices']
+        self.n_faces = prim['n_faces']
+        self.n_edges = prim['n_edges']
 
         # Vertice information contains coordinate x,y,z of vertices. shape = n_vertices,3
-        self.vertices = np.array([l.split() for l in lines[1:1+self.n_vertices]], dtype=float)
+        self.vertices = prim['vertices']
 
         # Face information contains indices of vertices forming faces. shape = n_faces,3
-        self.faces = np.array([l.split() for l in lines[1+self.n_vertices:1+self.n_vertices+self.n_faces]], dtype=int)
-        self.faces = self.faces[:,1:]
+        self.faces = prim['faces']
 
-        # We calculate the associations
-        self.assoc = Utils.Tessellation.Match_assoc(self.faces, self.n_vertices)
+        # The associations
+        self.assoc = prim['assoc']
 
-        # We will pre-calculate the surface areas. They will need to be multiplied by rc^2.
-        # The calculation is simply the Pythagorean sum of the areas of the respective projections on the x,y,z planes.
-        mesh = self.vertices[self.faces]
-        self.pre_area = 0.5 *np.sqrt( ((mesh[:,0,0]*mesh[:,1,1]+mesh[:,1,0]*mesh[:,2,1]+mesh[:,2,0]*mesh[:,0,1]) - (mesh[:,0,1]*mesh[:,1,0]+mesh[:,1,1]*mesh[:,2,0]+mesh[:,2,1]*mesh[:,0,0]))**2 + ((mesh[:,0,1]*mesh[:,1,2]+mesh[:,1,1]*mesh[:,2,2]+mesh[:,2,1]*mesh[:,0,2]) - (mesh[:,0,2]*mesh[:,1,1]+mesh[:,1,2]*mesh[:,2,1]+mesh[:,2,2]*mesh[:,0,1]))**2 + ((mesh[:,0,2]*mesh[:,1,0]+mesh[:,1,2]*mesh[:,2,0]+mesh[:,2,2]*mesh[:,0,0]) - (mesh[:,0,0]*mesh[:,1,2]+mesh[:,1,0]*mesh[:,2,2]+mesh[:,2,0]*mesh[:,0,2]))**2 )
-        # The cosine of x,y,z for the center of the faces. shape = n_faces, 3
-        self.cosx, self.cosy, self.cosz = mesh.mean(axis=1).T
+        # The pre-calculated surface areas. They will need to be multiplied by rc^2.
+        self.pre_area = prim['pre_area']
+        # The cosine of x,y,z for the center of the faces. shape = n_faces
+        self.cosx, self.cosy, self.cosz = prim['cosx'], prim['cosy'], prim['cosz']
+        # The mirror images of the faces and vertices under y -> -y and z -> -z
+        self.mirror_faces, self.mirror_vertices = prim['mirror_faces'], prim['mirror_vertices']
         return
 
     def Radius(self):
@@ -182,6 +200,7 @@ class Star(Star_base):
         self.Make_surface(filling=filling)
         return radius
 
+    @Utils.Profiler.Profiled()
     def _Surface(self, debug=False):
         """_Surface(debug=False)
         Calculates the surface grid values of surface gravity
@@ -206,6 +225,8 @@ class Star(Star_base):
         if debug: print( 'Potential psil1 %f' %psil1 )
 
         ## rc_l1 is the stellar radius on the near side, i.e. the nose of the star
+        ## We keep the previous value, if any, in order to warm start the radius solver
+        rc_l1_old = getattr(self, 'rc_l1', None)
         self.rc_l1 = self.filling*xl1
         if debug: print( 'rc_l1 %f' %self.rc_l1 )
         ## Potential at rc_l1, the nose of the star
@@ -226,21 +247,53 @@ class Star(Star_base):
         ## log surface gravity at the pole of the star
         self.logg_eq = np.log10(np.sqrt(dpsidx**2+dpsidy**2+dpsidz**2))
 
-        ## r_vertices are the radii of the vertices. shape = n_vertices
-        self.r_vertices = self._Radius(self.vertices[:,0], self.vertices[:,1], self.vertices[:,2], self.psi0, self.rc_l1)
+        ## The previous surface solution, rescaled by the ratio of the nose radii, is used as initial guess
+        ## Elements which do not converge from it are solved again from rc_l1
+        if rc_l1_old is not None and getattr(self, 'rc', None) is not None:
+            scale = self.rc_l1/rc_l1_old
+            rtry_vertices = np.where(self.r_vertices > 0, self.r_vertices*scale, self.rc_l1)
+            rtry_faces = np.where(self.rc > 0, self.rc*scale, self.rc_l1)
+        else:
+            rtry_vertices = self.rc_l1
+            rtry_faces = self.rc_l1
+
+        ## The Roche potential is symmetric under y -> -y and z -> -z, hence the radius, rx and
+        ## surface gravity of mirror images are equal, and their gradients differ by the sign of
+        ## their y and z components. We solve only one element per group of mirror images.
+        if self.mirror_vertices is not None:
+            unique, src, sy, sz = self.mirror_vertices
+            rtry = rtry_vertices[unique] if np.ndim(rtry_vertices) > 0 else rtry_vertices
+            ## r_vertices are the radii of the vertices. shape = n_vertices
+            self.r_vertices = self._Radius(self.vertices[unique,0], self.vertices[unique,1], self.vertices[unique,2], self.psi0, rtry, rfallback=self.rc_l1)[src]
+        else:
+            ## r_vertices are the radii of the vertices. shape = n_vertices
+            self.r_vertices = self._Radius(self.vertices[:,0], self.vertices[:,1], self.vertices[:,2], self.psi0, rtry_vertices, rfallback=self.rc_l1)
 
         ### Calculate useful quantities for all surface elements
+        if self.mirror_faces is not None:
+            unique, src, sy, sz = self.mirror_faces
+            cosx, cosy, cosz = self.cosx[unique], self.cosy[unique], self.cosz[unique]
+            rtry = rtry_faces[unique] if np.ndim(rtry_faces) > 0 else rtry_faces
+        else:
+            cosx, cosy, cosz = self.cosx, self.cosy, self.cosz
+            rtry = rtry_faces
         ## rc corresponds to r1 from Tjemkes et al., the distance from the center of mass of the pulsar companion. shape = n_faces
-        self.rc = self._Radius(self.cosx, self.cosy, self.cosz, self.psi0, self.rc_l1)
+        rc = self._Radius(cosx, cosy, cosz, self.psi0, rtry, rfallback=self.rc_l1)
         ## rx corresponds to r2 from Tjemkes et al., the distance from the center of mass of the pulsar. shape = n_faces
-        trc, self.rx, dpsi, dpsidx, dpsidy, dpsidz, psi = self._Potential(self.rc*self.cosx,self.rc*self.cosy,self.rc*self.cosz)
+        trc, rx, dpsi, dpsidx, dpsidy, dpsidz, psi = self._Potential(rc*cosx,rc*cosy,rc*cosz)
         ## log surface gravity. shape = n_faces
         geff = self._Geff(dpsidx, dpsidy, dpsidz)
-        self.logg = np.log10(geff)
+        logg = np.log10(geff)
         ## gradient of the gravitational potential in x,y,z. shape = n_faces
-        self.gradx = -dpsidx/geff
-        self.grady = -dpsidy/geff
-        self.gradz = -dpsidz/geff
+        gradx = -dpsidx/geff
+        grady = -dpsidy/geff
+        gradz = -dpsidz/geff
+        if self.mirror_faces is not None:
+            self.rc, self.rx, self.logg = rc[src], rx[src], logg[src]
+            self.gradx, self.grady, self.gradz = gradx[src], grady[src]*sy, gradz[src]*sz
+        else:
+            self.rc, self.rx, self.logg = rc, rx, logg
+            self.gradx, self.grady, self.gradz = gradx, grady, gradz
         if self.oldchi:
             ## coschi is the cosine angle between the rx and the surface element. shape = n_faces
             ## A value of 1 means that the companion's surface element is directly facing the pulsar, 0 is at the limb and -1 on the back.
@@ -261,4 +314,17 @@ class Star(Star_base):
         logger.log(9, "end")
         return
 
+    def _Symmetric(self):
+        """_Symmetric()
+        Returns True if the flux of the star is symmetric about phase 0,
+        i.e. F(phase) = F(1-phase). This is the case when the surface was
+        solved using its mirror symmetry (see Utils.Tessellation.Mirror_symmetry),
+        in which case the surface quantities of mirror images are identical
+        but for the sign of grady.
+
+        >>> self._Symmetric()
+        True
+        """
+        return self.mirror_faces is not None
+
 ######################## class Star ########################
@@ -27,6 +27,11 @@ class Star_base(object):
         luminosity of the star. It is taken into account that some energy received
         from the companion heats up the exposed side of the star.
     """
+    ## Attributes computed by self._Surface, which are stored in the surface cache
+    _surface_attrs = ['qp1by2om2', 'L1', 'rc_l1', 'logg_pole', 'logg_eq', 'nbet', 'rc', 'rx', 'cosx', 'cosy', 'cosz', 'coschi', 'area', 'logg', 'gradx', 'grady', 'gradz']
+    ## Default memory budget of the surface cache, in MB
+    surface_cache_budget = 64.
+
     def __init__(self, ndiv, atmo_grid=None):
         """__init__
         Initialize the class instance.
@@ -57,6 +62,10 @@ class Star_base(object):
         self.porb = None
         self.k1 = None
         self.incl = None
+        # Cumulative statistics of the Newton solver used in self._Radius
+        self.radius_stats = {'ncalls':0, 'nelements':0, 'niter':0, 'nfailed':0}
+        # Cache of the surface geometry, keyed on (q, omega, filling)
+        self.Set_surface_cache(self.surface_cache_budget)
         logger.log(9, "end")
 
     def _Area(self, arl, r):
@@ -135,6 +144,7 @@ class Star_base(object):
         self.qp1by2om2 = (self.q+1.)/2.*self.omega**2
         return
 
+    @Utils.Profiler.Profiled()
     def _Calc_teff(self, temp=None, tirr=None):
         """_Calc_teff(temp=None, tirr=None)
         Calculates the log of the effective temperature on the
@@ -206,25 +216,62 @@ class Star_base(object):
             print( "Problem with the test for the Doppler boosting range!!!" )
             return 0.
 
+        ### Here we use a shortcut by taking the average
+        return self._Doppler_boosting_lookup(case, logteff.mean(), logg.mean())
+
+    def Doppler_boosting_segments(self, logteff, logg, bounds):
+        """ Doppler_boosting_segments(logteff, logg, bounds)
+        Returns the Doppler boosting factor of several sets of surface
+        elements at once, i.e. Doppler_boosting(logteff[i0:i1], logg[i0:i1])
+        for each contiguous segment i0,i1 of bounds (e.g. the visible
+        elements of each phase, see _Visible). The averages are reduced
+        per segment, hence the factors agree with Doppler_boosting to
+        rounding. Empty segments have a factor of 0.
+
+        logteff: log of temperature.
+        logg: log of surface gravity.
+        bounds: boundaries of the segments. shape = nsegments+1
+        """
+        logteff = np.asarray(logteff, dtype=float)
+        logg = np.asarray(logg, dtype=float)
+        bounds = np.asarray(bounds, dtype=int)
+        doppler = np.zeros(bounds.size-1, dtype=float)
+        nonempty = (bounds[1:] > bounds[:-1]).nonzero()[0]
+        if nonempty.size == 0:
+            return doppler
+        i0 = bounds[:-1][nonempty]
+        n = np.diff(bounds)[nonempty]
+        logteff_mean = np.add.reduceat(logteff, i0) / n
+        logg_mean = np.add.reduceat(logg, i0) / n
+        ## The range is selected by the first element of each segment, as in Doppler_boosting
+        hot = logteff[i0] >= np.log(10000.)
+        for case, sel in ((1, ~hot), (2, hot)):
+            if sel.any():
+                doppler[nonempty[sel]] = self._Doppler_boosting_lookup(case, logteff_mean[sel], logg_mean[sel])
+        return doppler
+
+    def _Doppler_boosting_lookup(self, case, logteff, logg):
+        """ _Doppler_boosting_lookup(case, logteff, logg)
+        Returns the Doppler boosting factor interpolated from the lookup
+        table of a given range (1: cool, 2: hot) for the averaged values of
+        logteff and logg (scalars or vectors). See Doppler_boosting.
+        """
         if case == 1:
             logg_vec = np.r_[3.5, 4.0]
             logteff_vec = np.log(np.r_[6250., 6500.])
             lookup = np.array([[3.591, 3.428],[3.618, 3.460]])
-        elif case == 2:
+        else:
             logg_vec = np.r_[6.0, 7.0]
             logteff_vec = np.log(np.r_[14000., 15000.])
             lookup = np.array([[1.93, 1.87],[2.05, 1.98]])
-        else:
-            print( "Problem with the test for the Doppler boosting range!!!" )
-            return 0.
 
         #lookup.shape = logg_vec.size, logteff_vec.size
-        ### Here we use a shortcut by taking the average
-        w_logg, j_logg = Utils.Series.Getaxispos_scalar(logg_vec, logg.mean())
-        w_logteff, j_logteff = Utils.Series.Getaxispos_scalar(logteff_vec, logteff.mean())
-        ### here we use the full blown version
-        #w_logg, j_logg = Utils.Series.Getaxispos_vector(logg_vec, logg)
-        #w_logteff, j_logteff = Utils.Series.Getaxispos_vector(logteff_vec, logteff)
+        if np.ndim(logteff) == 0:
+            w_logg, j_logg = Utils.Series.Getaxispos_scalar(logg_vec, logg)
+            w_logteff, j_logteff = Utils.Series.Getaxispos_scalar(logteff_vec, logteff)
+        else:
+            w_logg, j_logg = Utils.Series.Getaxispos_vector(logg_vec, logg)
+            w_logteff, j_logteff = Utils.Series.Getaxispos_vector(logteff_vec, logteff)
         doppler = (1-w_logg) * ( (1-w_logteff)*lookup[j_logg,j_logteff] + w_logteff*lookup[j_logg,1+j_logteff] ) + w_logg * ( (1-w_logteff)*lookup[1+j_logg,j_logteff] + w_logteff*lookup[1+j_logg,1+j_logteff] )
         return doppler
 
@@ -291,6 +338,7 @@ class Star_base(object):
         radius = self.Radius()
         return radius/radius_RL
 
+    @Utils.Profiler.Profiled()
     def Flux(self, phase, atmo_grid=None, gravscale=None, proj=None, nosum=False, details=False, mu=None, inds=None):
         """
         Return the flux interpolated from the atmosphere grid.
@@ -330,6 +378,8 @@ class Star_base(object):
         logg = self.logg[inds]+gravscale
         mu = mu[inds]
         area = self.area[inds]
+        Utils.Profiler.Count('phases')
+        Utils.Profiler.Count('visible_faces', logteff.size)
 
         if details:
             v = self._Velocity_surface(phase)[inds]
@@ -351,6 +401,7 @@ class Star_base(object):
         logger.log(9, "end")
         return
 
+    @Utils.Profiler.Profiled()
     def Flux_doppler(self, phase, atmo_grid=None, gravscale=None, proj=None, nosum=False, mu=None, inds=None, velocity=0., atmo_doppler=None):
         """
         Return the flux interpolated from the atmosphere grid.
@@ -393,40 +444,164 @@ class Star_base(object):
         if inds is None:
             inds = mu > 0
 
-        v = self._Velocity_surface(phase, velocity=velocity)
+        logteff = self.logteff[inds]
+        logg = self.logg[inds]+gravscale
+        mu = mu[inds]
+        area = self.area[inds]
+        v = self._Velocity_surface(phase, velocity=velocity)[inds]
+        Utils.Profiler.Count('phases')
+        Utils.Profiler.Count('visible_faces', logteff.size)
+        Utils.Tracer.Record('Star_base.Flux_doppler', phase=phase, logteff=logteff, logg=logg, mu=mu, area=area, v=v)
 
         if atmo_doppler is not None:
             if nosum:
-                fsum = atmo_grid.Get_flux_doppler_nosum(self.logteff[inds], self.logg[inds]+gravscale, mu[inds], self.area[inds], v[inds], atmo_doppler)
+                fsum = atmo_grid.Get_flux_doppler_nosum(logteff, logg, mu, area, v, atmo_doppler)
             else:
-                fsum = atmo_grid.Get_flux_doppler(self.logteff[inds], self.logg[inds]+gravscale, mu[inds], self.area[inds], v[inds], atmo_doppler)
+                fsum = atmo_grid.Get_flux_doppler(logteff, logg, mu, area, v, atmo_doppler)
         else:
             if nosum:
-                fsum = atmo_grid.Get_flux_doppler_nosum(self.logteff[inds], self.logg[inds]+gravscale, mu[inds], self.area[inds], v[inds])
+                fsum = atmo_grid.Get_flux_doppler_nosum(logteff, logg, mu, area, v)
             else:
-                logger.log(5, '-'*20)
-                logger.log(5, 'logteff yo')
-                logger.log(5, self.logteff[inds])
-                logger.log(5, '-'*20)
-                logger.log(5, 'logg')
-                logger.log(5, self.logg[inds]+gravscale)
-                logger.log(5, '-'*20)
-                logger.log(5, 'mu')
-                logger.log(5, mu[inds])
-                logger.log(5, '-'*20)
-                logger.log(5, 'area')
-                logger.log(5, self.area[inds])
-                logger.log(5, '-'*20)
-                logger.log(5, 'v')
-                logger.log(5, v[inds])
-                logger.log(5, '-'*20)
-                fsum = atmo_grid.Get_flux_doppler(self.logteff[inds], self.logg[inds]+gravscale, mu[inds], self.area[inds], v[inds])
+                fsum = atmo_grid.Get_flux_doppler(logteff, logg, mu, area, v)
 
         if proj != 1:
             fsum *= proj
         logger.log(9, "stop")
         return fsum
 
+    @Utils.Profiler.Profiled()
+    def Flux_doppler_phases(self, phases, atmo_grid=None, gravscale=None, proj=None, velocity=0., atmo_doppler=None, chunksize=2**22):
+        """
+        Return the flux interpolated from the atmosphere grid at several
+        orbital phases at once. Takes into account the Doppler shift of the
+        different surface elements due to the orbital velocity.
+
+        The (nphases, nfaces) matrices of mu and velocity are built at once
+        and all the visible surface elements are interpolated in a single
+        call to the atmosphere grid, instead of one call per phase.
+
+        phases: vector of orbital phases (in orbital fraction; 0: companion
+            in front, 0.5: companion behind).
+        atmo_grid (optional): atmosphere grid instance used to
+            calculate the flux.
+        gravscale (optional): gravitational scaling parameter.
+        proj (optional): projection effect to scale the flux to real flux
+            units. If None is provided, will call _Proj with the current
+            orbital separation as input parameter.
+        velocity (optional): extra velocity in m/s to be added.
+        atmo_doppler (optional): AtmoGridDoppler instance containing a grid of Doppler
+            boosting factors. Must be the same dimensions as the atmosphere grid.
+            If None, the atmosphere grid is assumed to be a spectroscopic
+            one and each phase is evaluated with Flux_doppler.
+        chunksize (optional): maximum number of phases*faces elements to
+            process at once, in order to bound the memory usage.
+
+        >>> self.Flux_doppler_phases(phases)
+        fluxes
+        """
+        logger.log(9, "start")
+        if atmo_grid is None:
+            atmo_grid = self.atmo_grid
+        if gravscale is None:
+            gravscale = self._Gravscale()
+        if proj is None:
+            proj = self._Proj(self.separation)
+        phases = np.atleast_1d(phases).ravel()
+
+        ## The spectroscopic grids return a spectrum per phase, hence we simply loop
+        if atmo_doppler is None:
+            fsum = np.array([self.Flux_doppler(phase, atmo_grid=atmo_grid, gravscale=gravscale, proj=proj, velocity=velocity) for phase in phases])
+            logger.log(9, "end")
+            return fsum
+
+        fsum = np.empty(phases.size, dtype=float)
+        nchunk = max(1, chunksize//self.area.size)
+        for i in range(0, phases.size, nchunk):
+            s = slice(i, i+nchunk)
+            mu = self._Mu(phases[s,None])
+            v = self._Velocity_surface(phases[s,None], velocity=velocity)
+            iphase, iface = (mu > 0).nonzero()
+            Utils.Profiler.Count('phases', mu.shape[0])
+            Utils.Profiler.Count('visible_faces', iface.size)
+            fl = atmo_grid.Get_flux_doppler_nosum(self.logteff[iface], self.logg[iface]+gravscale, mu[iphase,iface], self.area[iface], v[iphase,iface], atmo_doppler)
+            fsum[s] = np.bincount(iphase, weights=fl, minlength=mu.shape[0])
+        if proj != 1:
+            fsum *= proj
+        logger.log(9, "end")
+        return fsum
+
+    @Utils.Profiler.Profiled()
+    def Flux_phases(self, phases, atmo_grid=None, gravscale=None, proj=None, chunksize=2**22, fold=False):
+        """
+        Return the flux interpolated from the atmosphere grid at several
+        orbital phases at once.
+
+        The (nphases, nfaces) matrix of mu is built at once and all the
+        visible surface elements are interpolated in a single call to the
+        atmosphere grid, instead of one call per phase. The result is
+        equivalent to [self.Flux(phase) for phase in phases].
+
+        When fold is True and the flux is symmetric about phase 0 (see
+        _Symmetric), the phases are folded onto [0, 0.5] using
+        F(phase) = F(1-phase) and each folded phase is evaluated only once.
+        The result then only matches Flux to rounding, since the phase
+        1-phase is evaluated in place of phase.
+
+        phases: vector of orbital phases (in orbital fraction; 0: companion
+            in front, 0.5: companion behind).
+        atmo_grid (optional): atmosphere grid instance used to
+            calculate the flux. If it is a multi-band grid (e.g.
+            AtmoGridPhotStack), the returned array has a shape
+            (nphases, nbands).
+        gravscale (optional): gravitational scaling parameter.
+        proj (optional): projection effect to scale the flux to real flux
+            units. If None is provided, will call _Proj with the current
+            orbital separation as input parameter.
+        chunksize (optional): maximum number of phases*faces elements to
+            process at once, in order to bound the memory usage.
+        fold (False): if True, fold symmetric lightcurves onto [0, 0.5].
+
+        >>> self.Flux_phases(phases)
+        fluxes
+        """
+        logger.log(9, "start")
+        if atmo_grid is None:
+            atmo_grid = self.atmo_grid
+        if gravscale is None:
+            gravscale = self._Gravscale()
+        if proj is None:
+            proj = self._Proj(self.separation)
+        phases = np.atleast_1d(phases).ravel()
+        if fold and self._Symmetric():
+            phases = np.mod(phases, 1.)
+            phases, inverse = np.unique(np.minimum(phases, 1.-phases), return_inverse=True)
+        else:
+            inverse = None
+
+        fsum = []
+        nchunk = max(1, chunksize//self.area.size)
+        for i in range(0, phases.size, nchunk):
+            s = slice(i, i+nchunk)
+            mu = self._Mu(phases[s,None])
+            ivis, iface, bounds = self._Visible(mu)
+            Utils.Profiler.Count('phases', mu.shape[0])
+            Utils.Profiler.Count('visible_faces', iface.size)
+            fl = atmo_grid.Get_flux_nosum(self.logteff[iface], self.logg[iface]+gravscale, mu.ravel()[ivis], self.area[iface])
+            ## The visible elements of each phase are summed separately, as
+            ## contiguous segments, using the same pairwise summation as in
+            ## Flux so that the results are identical. Multi-band grids (e.g.
+            ## AtmoGridPhotStack) return one flux per band, hence the surface
+            ## elements are moved to the last, contiguous, axis beforehand.
+            fl = np.ascontiguousarray(np.moveaxis(fl, 0, -1))
+            fsum.append( np.array([fl[...,i0:i1].sum(axis=-1) for i0,i1 in zip(bounds[:-1], bounds[1:])]) )
+        fsum = np.concatenate(fsum)
+        if inverse is not None:
+            fsum = fsum[inverse.ravel()]
+        if proj != 1:
+            fsum *= proj
+        logger.log(9, "end")
+        return fsum
+
     def _Geff(self, dpsidx, dpsidy, dpsidz):
         """_Geff(dpsidx, dpsidy, dpsidz)
         Returns the effective gravity at a given point having
@@ -490,6 +665,54 @@ class Star_base(object):
         fsum, Keff = atmo_grid.Get_flux_Keff(self.logteff[inds],self.logg[inds]+gravscale,mu[inds],self.area[inds],v[inds])
         return Keff*cts.c
 
+    def Keff_phases(self, phases, gravscale=None, atmo_grid=None, chunksize=2**22):
+        """Keff_phases(phases, gravscale=None, atmo_grid=None, chunksize=2**22)
+        Return the effective velocity of the star in m/s (i.e. averaged over
+        the visible surface and flux intensity weighted) at several orbital
+        phases at once.
+
+        The (nphases, nfaces) matrices of mu and velocity are built at once
+        and all the visible surface elements are interpolated in a single
+        call to the atmosphere grid. The result is equivalent, to rounding,
+        to [self.Keff(phase) for phase in phases]. A phase without any
+        visible surface element has a Keff of 0.
+
+        phases: vector of orbital phases (in orbital fraction; 0: companion
+            in front, 0.5: companion behind).
+        gravscale (optional): gravitational scaling parameter.
+        atmo_grid (optional): atmosphere grid instance used to
+            calculate the flux.
+        chunksize (optional): maximum number of phases*faces elements to
+            process at once, in order to bound the memory usage.
+
+        >>> self.Keff_phases(phases)
+        Keffs
+        """
+        if atmo_grid is None:
+            atmo_grid = self.atmo_grid
+        if gravscale is None:
+            gravscale = self._Gravscale()
+        phases = np.atleast_1d(phases).ravel()
+
+        Keff = np.zeros(phases.size, dtype=float)
+        nchunk = max(1, chunksize//self.area.size)
+        for i in range(0, phases.size, nchunk):
+            s = slice(i, i+nchunk)
+            mu = self._Mu(phases[s,None])
+            v = self._Velocity_surface(phases[s,None])
+            ivis, iface, bounds = self._Visible(mu)
+            fl = atmo_grid.Get_flux_nosum(self.logteff[iface], self.logg[iface]+gravscale, mu.ravel()[ivis], self.area[iface])
+            vfl = v.ravel()[ivis] * fl
+            ## The visible elements of each phase are contiguous segments,
+            ## which are reduced at once. Since reduceat returns fl[i0] for
+            ## an empty phase (i0 == i1), only the non-empty ones are
+            ## reduced and the others are left to zero.
+            nonempty = (bounds[1:] > bounds[:-1]).nonzero()[0]
+            if nonempty.size:
+                i0 = bounds[:-1][nonempty]
+                Keff[i+nonempty] = np.add.reduceat(vfl, i0) / np.add.reduceat(fl, i0)
+        return Keff*cts.c
+
     def Mag_bbody_flux(self, phase, limbdark, proj=None, atmo_grid=None):
         """Mag_flux(phase)
         Returns the blackbody magnitude of a star.
@@ -585,6 +808,65 @@ class Star_base(object):
             gravscale = self._Gravscale()
         return -2.5*np.log10(self.Flux_doppler(phase, gravscale=gravscale, proj=proj, atmo_grid=atmo_grid, velocity=velocity, atmo_doppler=atmo_doppler)) + atmo_grid.meta['zp']
 
+    def Mag_flux_doppler_phases(self, phases, gravscale=None, proj=None, atmo_grid=None, velocity=0., atmo_doppler=None):
+        """
+        Returns the magnitudes interpolated from the atmosphere grid at
+        several orbital phases at once. Takes into account the Doppler
+        shift of the different surface elements due to the orbital velocity.
+        See Flux_doppler_phases.
+
+        phases: vector of orbital phases (in orbital fraction; 0: companion
+            in front, 0.5: companion behind).
+        gravscale (optional): gravitational scaling parameter.
+        proj (optional): projection effect to scale the flux to real flux
+            units. If None is provided, will call _Proj with the current
+            orbital separation as input parameter.
+        atmo_grid (optional): atmosphere grid instance to work from to
+            calculate the flux.
+        velocity (optional): extra velocity in m/s to be added.
+        atmo_doppler (optional): AtmoGridDoppler instance containing a grid of Doppler
+            boosting factors. Must be the same dimensions as the atmosphere grid.
+
+        >>> self.Mag_flux_doppler_phases(phases)
+        mag_flux_doppler
+        """
+        if atmo_grid is None:
+            atmo_grid = self.atmo_grid
+        if proj is None:
+            proj = self._Proj(self.separation)
+        if gravscale is None:
+            gravscale = self._Gravscale()
+        return -2.5*np.log10(self.Flux_doppler_phases(phases, gravscale=gravscale, proj=proj, atmo_grid=atmo_grid, velocity=velocity, atmo_doppler=atmo_doppler)) + atmo_grid.meta['zp']
+
+    def Mag_flux_phases(self, phases, gravscale=None, proj=None, atmo_grid=None, chunksize=2**22, fold=False):
+        """
+        Returns the magnitudes interpolated from the atmosphere grid at
+        several orbital phases at once. See Flux_phases.
+
+        phases: vector of orbital phases (in orbital fraction; 0: companion
+            in front, 0.5: companion behind).
+        gravscale (optional): gravitational scaling parameter.
+        proj (optional): projection effect to scale the flux to real flux
+            units. If None is provided, will call _Proj with the current
+            orbital separation as input parameter.
+        atmo_grid (optional): atmosphere grid instance to work from to
+            calculate the flux.
+        chunksize (optional): maximum number of phases*faces elements to
+            process at once, in order to bound the memory usage.
+        fold (False): if True, fold symmetric lightcurves onto [0, 0.5].
+
+        >>> self.Mag_flux_phases(phases)
+        mag_flux
+        """
+        if atmo_grid is None:
+            atmo_grid = self.atmo_grid
+        if proj is None:
+            proj = self._Proj(self.separation)
+        if gravscale is None:
+            gravscale = self._Gravscale()
+        return -2.5*np.log10(self.Flux_phases(phases, gravscale=gravscale, proj=proj, atmo_grid=atmo_grid, chunksize=chunksize, fold=fold)) + atmo_grid.meta['zp']
+
+    @Utils.Profiler.Profiled()
     def Make_surface(self, q=None, omega=None, filling=None, temp=None, tempgrav=None, tirr=None, porb=None, k1=None, incl=None):
         """Make_surface(q=None, omega=None, filling=None, temp=None, tempgrav=None, tirr=None, porb=None, k1=None, incl=None)
         Provided some basic parameters about the binary system,
@@ -670,7 +952,7 @@ class Star_base(object):
                 redo_orbital = True
         if redo_surface:
             #print('Going to _Surface()')
-            self._Surface()
+            self._Surface_cached()
         if redo_teff:
             #print('Going to _Calc_teff()')
             self._Calc_teff()
@@ -694,6 +976,25 @@ class Star_base(object):
         """
         return -np.sin(self.incl)*(np.cos(cts.TWOPI*phase)*self.gradx+np.sin(cts.TWOPI*phase)*self.grady)+np.cos(self.incl)*self.gradz
 
+    def _Visible(self, mu):
+        """_Visible(mu)
+        Returns the visible surface elements of several phases at once.
+
+        mu: (nphases, nfaces) matrix of the cos(angle) of the emission angle,
+            as returned by _Mu for a vector of phases.
+
+        Returns (ivis, iface, bounds), where ivis are the indices of the
+        visible elements in the flattened mu matrix and iface their face
+        index. The visible elements of phase i are ivis[bounds[i]:bounds[i+1]].
+
+        >>> ivis, iface, bounds = self._Visible(mu)
+        """
+        ivis = (mu.ravel() > 0).nonzero()[0]
+        iface = ivis % mu.shape[1]
+        bounds = np.searchsorted(ivis, np.arange(mu.shape[0]+1)*mu.shape[1])
+        return ivis, iface, bounds
+
+    @Utils.Profiler.Profiled()
     def _Orbital_parameters(self):
         """_Orbital_parameters()
         This function uses the class variables q, k1, porb
@@ -741,21 +1042,41 @@ class Star_base(object):
         # the factor 100 is to convert from m to cm
         return ((r*100)/10./parsec)**2
 
-    def _Radius(self, cosx, cosy, cosz, psi0, rtry):
-        """_Radius(cosx, cosy, cosz, psi0, rtry)
+    def _Radius(self, cosx, cosy, cosz, psi0, rtry, rfallback=None):
+        """_Radius(cosx, cosy, cosz, psi0, rtry, rfallback=None)
         Determines the radius of the star at a given angular position.
         If cosx,cosy,cosz are vectors, will return a vector of radii.
 
         cosx, cosy, cosz: angular position (scalar or vector)
         psi0: gravitational potential of the star (scalar)
-        rtry: guess radius (scalar)
+        rtry: guess radius (scalar, or vector if cosx,cosy,cosz are vectors)
+        rfallback (None): guess radius (scalar) used to solve again the
+            elements which did not converge from rtry. Useful when rtry
+            is a warm start from a previous solution.
+
+        The iteration count and number of elements which did not converge
+        are accumulated in self.radius_stats.
 
         >>> self._Radius(cosx, cosy, cosz, psi0, rtry)
         radius
         """
         logger.log(9, "start")
         if isinstance(cosx, np.ndarray):
-            radius = Utils.Binary.Radii(cosx, cosy, cosz, psi0, rtry, self.q, self.qp1by2om2)
+            radius, info = Utils.Binary.Radii(cosx, cosy, cosz, psi0, rtry, self.q, self.qp1by2om2, full_output=True)
+            self.radius_stats['niter'] += info['niter'].sum()
+            Utils.Profiler.Count('newton_iterations', int(info['niter'].sum()))
+            Utils.Profiler.Count('radius_elements', cosx.size)
+            failed = info['failed']
+            if rfallback is not None and failed.size > 0:
+                logger.log(9, "solving {} elements again from the fallback guess".format(failed.size))
+                radius[failed], info = Utils.Binary.Radii(cosx[failed], cosy[failed], cosz[failed], psi0, rfallback, self.q, self.qp1by2om2, full_output=True)
+                self.radius_stats['niter'] += info['niter'].sum()
+                Utils.Profiler.Count('newton_iterations', int(info['niter'].sum()))
+            self.radius_stats['ncalls'] += 1
+            self.radius_stats['nelements'] += cosx.size
+            self.radius_stats['nfailed'] += info['nfailed']
+            if info['nfailed'] > 0:
+                logger.warning("_Radius: {} out of {} elements did not converge.".format(info['nfailed'], cosx.size))
         else:
             radius = Utils.Binary.Radius(cosx, cosy, cosz, psi0, rtry, self.q, self.qp1by2om2)
         logger.log(9, "end")
@@ -852,6 +1173,26 @@ class Star_base(object):
         saddle = scipy.optimize.newton(get_saddle, xtry)
         return saddle
 
+    def Set_surface_cache(self, budget):
+        """Set_surface_cache(budget)
+        Set the memory budget of the surface geometry cache. The
+        surface quantities calculated by self._Surface for a given
+        set of (q, omega, filling) are kept in a least-recently-used
+        cache so that revisiting a geometry, as often happens when
+        fitting or sampling, does not require solving the potential
+        equation again. The cache content is discarded.
+
+        budget: memory budget in MB. A value of 0 disables the cache.
+
+        >>> self.Set_surface_cache(128.)
+        """
+        if budget > 0:
+            self.surface_cache = Utils.Misc.Cache_lru(int(budget*2**20))
+        else:
+            self.surface_cache = None
+        return
+
+    @Utils.Profiler.Profiled()
     def _Surface(self):
         """_Surface()
         Calculates the surface grid values of surface gravity
@@ -1004,6 +1345,44 @@ class Star_base(object):
         logger.log(9, "end")
         return
 
+    def _Surface_cached(self):
+        """_Surface_cached()
+        Same as self._Surface, but the surface quantities are
+        retrieved from the surface cache when the geometry
+        (q, omega, filling) has already been calculated.
+
+        The hits and misses are recorded in self.surface_cache, as
+        well as in the active profiler, if any.
+
+        >>> self._Surface_cached()
+        """
+        if self.surface_cache is None:
+            self._Surface()
+            return
+        key = (self.ndiv, self.q, self.omega, self.filling, getattr(self, 'oldchi', None))
+        values = self.surface_cache.Get(key)
+        if values is None:
+            Utils.Profiler.Count('surface_cache_misses')
+            self._Surface()
+            self.surface_cache.Put(key, dict([(attr, getattr(self, attr)) for attr in self._surface_attrs]))
+        else:
+            Utils.Profiler.Count('surface_cache_hits')
+            for attr in self._surface_attrs:
+                setattr(self, attr, values[attr])
+        return
+
+    def _Symmetric(self):
+        """_Symmetric()
+        Returns True if the flux of the star is symmetric about phase 0,
+        i.e. F(phase) = F(1-phase), which requires the surface quantities
+        to be exactly mirror symmetric under y -> -y. This is not
+        guaranteed for the latitude slices surface of Star_base.
+
+        >>> self._Symmetric()
+        False
+        """
+        return False
+
     def _Velocity_surface(self, phase, velocity=0.):
         """_Velocity_surface(phase, velocity=0.)
         Returns the velocity (in v/c) of each surface element
@@ -5,6 +5,7 @@ __all__ = ["Star_temperature"]
 
 from ..Utils.import_modules import *
 from ..Utils import Spherical_harmonics
+from ..Utils import Profiler
 from .Star import Star
 
 
@@ -26,6 +27,7 @@ class Star_temperature(Star):
         self.theta = np.arccos(self.cosz)
         self.phi = np.arctan2(self.cosy,self.cosx)
 
+    @Profiler.Profiled()
     def _Calc_teff(self, temp=None, tirr=None):
         """_Calc_teff(temp=None, tirr=None)
         Calculates the log of the effective temperature on the
@@ -99,4 +101,21 @@ class Star_temperature(Star):
             Spherical_harmonics.Pretty_print_alm(alm)
         return alm
 
+    def _Symmetric(self):
+        """_Symmetric()
+        Returns True if the flux of the star is symmetric about phase 0,
+        i.e. F(phase) = F(1-phase). In addition to the surface symmetry
+        (see Star._Symmetric), the spherical harmonic temperature profile
+        must be even in y, i.e. the coefficients A_{lm} with m < 0 must be
+        zero.
+
+        >>> self._Symmetric()
+        """
+        if not Star._Symmetric(self):
+            return False
+        temp = np.atleast_1d(self.temp)
+        lmax = np.sqrt(temp.size).astype(int) - 1
+        m = np.hstack([np.arange(-l,l+1) for l in range(lmax+1)])
+        return not np.any(temp[:m.size][m < 0])
+
 ######################## class Star_temperature ########################
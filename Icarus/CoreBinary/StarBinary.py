@@ -58,6 +58,8 @@ class StarBinary(object):
         # We set the class attributes
         if atmo_grid is not None:
            self.atmo_grid = atmo_grid
+        # Outlines of the stars, see _Outline
+        self._outlines = {}
 
         print( "Instantiating the primary star" )
         # Single resolution for the primary
@@ -78,26 +80,7 @@ class StarBinary(object):
             # If high resolution is required, we will keep track of the association between the high resolution triangle and the low resolution ones
             else:
                 print( " ...calculating the surface subsampling" )
-                if read:
-                    self.primary_hd = Core.Star(self.ndiv1_hd, atmo_grid=atmo_grid, read=read)
-                    #self.ind_subsampling1 = np.loadtxt('geodesic/ind_subsampling_n%i_n%i.txt'%(self.ndiv1, self.ndiv1_hd), dtype='int')
-                    self.ind_subsampling1 = np.loadtxt(Utils.__path__[0][:-5]+'geodesic/ind_subsampling_n%i_n%i.txt'%(self.ndiv1, self.ndiv1_hd), dtype='int')
-                else:
-                    triangle_assoc = []
-                    x, y, z = self.primary.cosx, self.primary.cosy, self.primary.cosz
-                    # For each extra subdivision, we calculate the surface and determine the association between the triangle of this refinement level and the one just before
-                    for i in np.arange(self.ndiv1,self.ndiv1_hd)+1:
-                        print( " ...subsampling from %s to %s" %(i-1,i) )
-                        self.primary_hd = Core.Star(i, atmo_grid=atmo_grid, read=read)
-                        x_high, y_high, z_high = self.primary_hd.cosx, self.primary_hd.cosy, self.primary_hd.cosz
-                        triangle_assoc.append( Utils.Tessellation.Match_triangles(x_high, y_high, z_high, x, y, z) )
-                        x, y, z = x_high, y_high, z_high
-                    # Now we go backward and associate the triangles from the highest resolution down to the lowest resolution. Results are stored in self.ind_subsampling.
-                    print( " ...almost done" )
-                    self.ind_subsampling1 = triangle_assoc.pop()
-                    while triangle_assoc:
-                        print( " ...associations..." )
-                        self.ind_subsampling1 = Utils.Tessellation.Match_subtriangles(self.ind_subsampling1, triangle_assoc.pop())
+                self.primary_hd, self.ind_subsampling1 = self._Subsampling(self.primary, self.ndiv1, self.ndiv1_hd, atmo_grid=atmo_grid, read=read)
                 # We also store the total weight, which is 3 vertices * 4**(ndiv_hd-ndiv) for the normalization
                 self.total_weight1 = 3 * 4**(self.ndiv1_hd-self.ndiv1)
         # In case of problem for the primary's resolution
@@ -123,26 +106,7 @@ class StarBinary(object):
             # If high resolution is required, we will keep track of the association between the high resolution triangle and the low resolution ones
             else:
                 print( " ...calculating the surface subsampling" )
-                if read:
-                    self.secondary_hd = Core.Star(self.ndiv2_hd, atmo_grid=atmo_grid, read=read)
-                    #self.ind_subsampling2 = np.loadtxt('geodesic/ind_subsampling_n%i_n%i.txt'%(self.ndiv2, self.ndiv2_hd), dtype='int')
-                    self.ind_subsampling2 = np.loadtxt(Utils.__path__[0][:-5]+'geodesic/ind_subsampling_n%i_n%i.txt'%(self.ndiv2, self.ndiv2_hd), dtype='int')
-                else:
-                    triangle_assoc = []
-                    x, y, z = self.secondary.cosx, self.secondary.cosy, self.secondary.cosz
-                    # For each extra subdivision, we calculate the surface and determine the association between the triangle of this refinement level and the one just before
-                    for i in np.arange(self.ndiv2,self.ndiv2_hd)+1:
-                        print( " ...subsampling from %s to %s" %(i-1,i) )
-                        self.secondary_hd = Core.Star(i, atmo_grid=atmo_grid, read=read)
-                        x_high, y_high, z_high = self.secondary_hd.cosx, self.secondary_hd.cosy, self.secondary_hd.cosz
-                        triangle_assoc.append( Utils.Tessellation.Match_triangles(x_high, y_high, z_high, x, y, z) )
-                        x, y, z = x_high, y_high, z_high
-                    # Now we go backward and associate the triangles from the highest resolution down to the lowest resolution. Results are stored in self.ind_subsampling.
-                    print( " ...almost done" )
-                    self.ind_subsampling2 = triangle_assoc.pop()
-                    while triangle_assoc:
-                        print( " ...associations..." )
-                        self.ind_subsampling2 = Utils.Tessellation.Match_subtriangles(self.ind_subsampling2, triangle_assoc.pop())
+                self.secondary_hd, self.ind_subsampling2 = self._Subsampling(self.secondary, self.ndiv2, self.ndiv2_hd, atmo_grid=atmo_grid, read=read)
                 # We also store the total weight, which is 3 vertices * 4**(ndiv_hd-ndiv) for the normalization
                 self.total_weight2 = 3 * 4**(self.ndiv2_hd-self.ndiv2)
         # In case of problem for the secondary's resolution
@@ -151,6 +115,44 @@ class StarBinary(object):
         # This is the end of the initialization function
         return
 
+    def _Subsampling(self, star, ndiv, ndiv_hd, atmo_grid=None, read=False):
+        """_Subsampling(star, ndiv, ndiv_hd, atmo_grid=None, read=False)
+        Return the high resolution star and the index of the face of the
+        low resolution star associated with each of its faces.
+
+        star: low resolution star.
+        ndiv: number of subdivisions of the low resolution star.
+        ndiv_hd: number of subdivisions of the high resolution star.
+        atmo_grid (None): atmosphere grid of the stars.
+        read (False): if true, the geodesic primitives are read instead of
+            generated from scratch.
+
+        When the geodesic primitives are generated by Utils.Tessellation.Make_geodesic,
+        the association is given by the subdivision hierarchy. Otherwise it is
+        read from (or calculated and cached alongside) the geodesic files, or
+        calculated going through the intermediate resolutions.
+
+        >>> star_hd, ind_subsampling = self._Subsampling(self.primary, 5, 7)
+        """
+        star_hd = Core.Star(ndiv_hd, atmo_grid=atmo_grid, read=read)
+        if read:
+            ind_subsampling = Utils.Tessellation.Read_subsampling(ndiv, ndiv_hd)
+        elif star.hierarchical and star_hd.hierarchical:
+            ind_subsampling = Utils.Tessellation.Parent_faces(ndiv_hd-1, ndiv-1)
+        else:
+            x, y, z = star.cosx, star.cosy, star.cosz
+            ind_subsampling = None
+            # For each extra subdivision, we determine the association between the triangle of this refinement level and the one just before
+            for i in np.arange(ndiv,ndiv_hd)+1:
+                print( " ...subsampling from %s to %s" %(i-1,i) )
+                star_i = star_hd if i == ndiv_hd else Core.Star(i, read=read)
+                x_high, y_high, z_high = star_i.cosx, star_i.cosy, star_i.cosz
+                tmp = Utils.Tessellation.Match_triangles(x_high, y_high, z_high, x, y, z)
+                # We associate the triangles from the highest resolution down to the lowest resolution.
+                ind_subsampling = tmp if ind_subsampling is None else Utils.Tessellation.Match_subtriangles(tmp, ind_subsampling)
+                x, y, z = x_high, y_high, z_high
+        return star_hd, ind_subsampling
+
     def Flux(self, phase, atmo_grid=None, nosum=False):
         """Flux(phase, atmo_grid=None, nosum=False)
         Return the flux interpolated from the atmosphere grid.
@@ -173,6 +175,53 @@ class StarBinary(object):
             return fsum1, fsum2
         return fsum1+fsum2
 
+    def _Flux_boosted(self, star, phase, atmo_grid=None, nosum=False, mu=None, inds=None, doppler=0.):
+        """_Flux_boosted(star, phase, atmo_grid=None, nosum=False, mu=None, inds=None, doppler=0.)
+        Return the flux of one of the stars, calculated by star.Flux,
+        including the Doppler boosting of the surface elements, i.e.
+        flux * (1 - doppler * v/c), with v positive away from the observer.
+
+        star: the star instance (e.g. self.primary).
+        phase: orbital phase of the star.
+        atmo_grid, nosum, mu, inds: see Star.Flux.
+        doppler (0.): coefficient for the Doppler boosting. If 0., no
+            Doppler boosting is performed. If None, will use the value
+            returned by star.Doppler_boosting() for the visible elements.
+
+        >>> self._Flux_boosted(self.primary, phase, doppler=3.5)
+        flux
+        """
+        if doppler is not None and doppler == 0:
+            return star.Flux(phase, atmo_grid=atmo_grid, nosum=nosum, mu=mu, inds=inds)
+        if mu is None:
+            mu = star._Mu(phase)
+        if inds is None:
+            inds = mu > 0
+        if doppler is None:
+            doppler = star.Doppler_boosting(star.logteff[inds], star.logg[inds])
+        fsum = star.Flux(phase, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds)
+        fsum *= 1 - doppler*star._Velocity_surface(phase)[inds]
+        if nosum:
+            return fsum
+        return fsum.sum()
+
+    def _Outline(self, star, ntheta):
+        """_Outline(star, ntheta)
+        Return the radii of the outline of a star (see Star.Outline).
+        The outline only depends on the surface, hence it is calculated
+        once per surface and ntheta and reused until the next call to
+        Make_surface.
+
+        star: the star instance (e.g. self.secondary).
+        ntheta: number of points defining the outline.
+
+        >>> radii = self._Outline(self.secondary, 100)
+        """
+        key = (id(star), ntheta)
+        if key not in self._outlines:
+            self._outlines[key] = star.Outline(ntheta)
+        return self._outlines[key]
+
     def Flux_eclipse_old(self, phase, atmo_grid=None, ntheta=100, doppler1=0., doppler2=0.):
         """Flux_eclipse(phase, atmo_grid=None, ntheta=100, doppler1=0., doppler2=0.)
         Return the flux interpolated from the atmosphere grid.
@@ -201,44 +250,44 @@ class StarBinary(object):
         if type1 == "full":
             fsum1 = 0.
         elif type1 == "partial":
-            radii = self.secondary.Outline(ntheta)
+            radii = self._Outline(self.secondary, ntheta)
             weights1 = Eclipse.Occultation_approx(self.primary.vertices, self.primary.r_vertices, self.primary.assoc, self.primary.n_faces, self.primary.incl, phase*cts.TWOPI, self.primary.q, ntheta, radii)
             mu = self.primary._Mu(phase)
             inds = (mu>0)*(weights1<3)
-            fsum1 = self.primary.Flux(phase, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler1)
+            fsum1 = self._Flux_boosted(self.primary, phase, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler1)
             fsum1 *= 1 - weights1[inds]/3
             fsum1 = fsum1.sum() * self.normalize1
         elif type1 == "partial_hd":
-            radii = self.secondary.Outline(ntheta)
+            radii = self._Outline(self.secondary, ntheta)
             weights1 = Eclipse.Occultation_approx(self.primary_hd.vertices, self.primary_hd.r_vertices, self.primary_hd.assoc, self.primary_hd.n_faces, self.primary_hd.incl, phase*cts.TWOPI, self.primary_hd.q, ntheta, radii)
             mu = self.primary_hd._Mu(phase)
             inds = (mu>0)*(weights1<3)
-            fsum1 = self.primary_hd.Flux(phase, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler1)
+            fsum1 = self._Flux_boosted(self.primary_hd, phase, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler1)
             fsum1 *= 1 - weights1[inds]/3
             fsum1 = fsum1.sum()
         else:
-            fsum1 = self.primary.Flux(phase, atmo_grid=atmo_grid, nosum=False, doppler=doppler1) * self.normalize1
+            fsum1 = self._Flux_boosted(self.primary, phase, atmo_grid=atmo_grid, nosum=False, doppler=doppler1) * self.normalize1
 
         if type2 == "full":
             fsum2 = 0.
         elif type2 == "partial":
-            radii = self.primary.Outline(ntheta)
+            radii = self._Outline(self.primary, ntheta)
             weights2 = Eclipse.Occultation_approx(self.secondary.vertices, self.secondary.r_vertices, self.secondary.assoc, self.secondary.n_faces, self.secondary.incl, ((phase+0.5)%1)*cts.TWOPI, self.secondary.q, ntheta, radii)
             mu = self.secondary._Mu((phase+0.5)%1)
             inds = (mu>0)*(weights2<3)
-            fsum2 = self.secondary.Flux((phase+0.5)%1, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler2)
+            fsum2 = self._Flux_boosted(self.secondary, (phase+0.5)%1, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler2)
             fsum2 *= 1 - weights2[inds]/3
             fsum2 = fsum2.sum() * self.normalize2
         elif type2 == "partial_hd":
-            radii = self.primary.Outline(ntheta)
+            radii = self._Outline(self.primary, ntheta)
             weights2 = Eclipse.Occultation_approx(self.secondary_hd.vertices, self.secondary_hd.r_vertices, self.secondary_hd.assoc, self.secondary_hd.n_faces, self.secondary_hd.incl, ((phase+0.5)%1)*cts.TWOPI, self.secondary_hd.q, ntheta, radii)
             mu = self.secondary_hd._Mu((phase+0.5)%1)
             inds = (mu>0)*(weights2<3)
-            fsum2 = self.secondary_hd.Flux((phase+0.5)%1, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler2)
+            fsum2 = self._Flux_boosted(self.secondary_hd, (phase+0.5)%1, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler2)
             fsum2 *= 1 - weights2[inds]/3
             fsum2 = fsum2.sum()
         else:
-            fsum2 = self.secondary.Flux((phase+0.5)%1, atmo_grid=atmo_grid, nosum=False, doppler=doppler2) * self.normalize2
+            fsum2 = self._Flux_boosted(self.secondary, (phase+0.5)%1, atmo_grid=atmo_grid, nosum=False, doppler=doppler2) * self.normalize2
 
         return fsum1+fsum2#, fsum1, fsum2
 
@@ -284,7 +333,7 @@ class StarBinary(object):
         elif type1.find("partial") != -1:
             if type1 == "partial" or invert:
                 #print( "partial1" )
-                radii = self.secondary.Outline(ntheta)
+                radii = self._Outline(self.secondary, ntheta)
                 vertices = self.primary.vertices.T * self.primary.r_vertices
                 mu = self.primary._Mu(phase)
                 inds =  (mu>0).nonzero()[0]
@@ -292,13 +341,13 @@ class StarBinary(object):
                 inds1 = weights1>0
                 inds = inds[inds1]
                 weights1 = weights1[inds1]
-                fsum1 = self.primary.Flux(phase, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler1)
+                fsum1 = self._Flux_boosted(self.primary, phase, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler1)
                 fsum1 *= weights1
                 fsum1 = fsum1.sum() * self.normalize1
                 #print( "    partial phase: {}".format(phase) )
             else:
                 #print( "partial_hd1" )
-                radii = self.secondary.Outline(ntheta)
+                radii = self._Outline(self.secondary, ntheta)
                 vertices = self.primary_hd.vertices.T * self.primary_hd.r_vertices
                 mu = self.primary_hd._Mu(phase)
                 inds = (mu>0).nonzero()[0]
@@ -306,17 +355,17 @@ class StarBinary(object):
                 weights1 = Eclipse.Weights_transit(self.ind_subsampling1[inds], weights_highres, self.primary.n_faces) / (self.total_weight1/3.)
                 mu = self.primary._Mu(phase)
                 inds = (mu>0)*(weights1>0)
-                fsum1 = self.primary.Flux(phase, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler1)
+                fsum1 = self._Flux_boosted(self.primary, phase, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler1)
                 fsum1 *= weights1[inds]
                 fsum1 = fsum1.sum() * self.normalize1
                 #print( "    partial HD phase: {}".format(phase) )
         else:
             if self.primary_hd is None or not invert:
                 #print( "out1" )
-                fsum1 = self.primary.Flux(phase, atmo_grid=atmo_grid, nosum=False, doppler=doppler1) * self.normalize1
+                fsum1 = self._Flux_boosted(self.primary, phase, atmo_grid=atmo_grid, nosum=False, doppler=doppler1) * self.normalize1
             else:
                 #print( "out hd1" )
-                fsum1 = self.primary_hd.Flux(phase, atmo_grid=atmo_grid, nosum=False, doppler=doppler1) #* self.normalize1 ## not needed here
+                fsum1 = self._Flux_boosted(self.primary_hd, phase, atmo_grid=atmo_grid, nosum=False, doppler=doppler1) #* self.normalize1 ## not needed here
             #print( "    regular phase: {}".format(phase) )
 
         if type2 == "full":
@@ -325,7 +374,7 @@ class StarBinary(object):
         elif type2.find("partial") != -1:
             if type2 == "partial" or invert:
                 #print( "partial2" )
-                radii = self.primary.Outline(ntheta)
+                radii = self._Outline(self.primary, ntheta)
                 vertices = self.secondary.vertices.T * self.secondary.r_vertices
                 mu = self.secondary._Mu((phase+0.5)%1)
                 inds = (mu>0).nonzero()[0]
@@ -333,13 +382,13 @@ class StarBinary(object):
                 inds2 = weights2>0
                 inds = inds[inds2]
                 weights2 = weights2[inds2]
-                fsum2 = self.secondary.Flux((phase+0.5)%1, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler2)
+                fsum2 = self._Flux_boosted(self.secondary, (phase+0.5)%1, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler2)
                 fsum2 *= weights2
                 fsum2 = fsum2.sum() * self.normalize2
                 #print( "    partial phase: {}".format(phase) )
             else:
                 #print( "partial_hd2" )
-                radii = self.primary.Outline(ntheta)
+                radii = self._Outline(self.primary, ntheta)
                 vertices = self.secondary_hd.vertices.T * self.secondary_hd.r_vertices
                 mu = self.secondary_hd._Mu((phase+0.5)%1)
                 inds = (mu>0).nonzero()[0]
@@ -347,17 +396,17 @@ class StarBinary(object):
                 weights2 = Eclipse.Weights_transit(self.ind_subsampling2[inds], weights_highres, self.secondary.n_faces) / (self.total_weight2/3.)
                 mu = self.secondary._Mu((phase+0.5)%1)
                 inds = (mu>0)*(weights2>0)
-                fsum2 = self.secondary.Flux((phase+0.5)%1, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler2)
+                fsum2 = self._Flux_boosted(self.secondary, (phase+0.5)%1, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler2)
                 fsum2 *= weights2[inds]
                 fsum2 = fsum2.sum() * self.normalize2
                 #print( "    partial HD phase: {}".format(phase) )
         else:
             if self.secondary_hd is None or not invert:
                 #print( "out2" )
-                fsum2 = self.secondary.Flux((phase+0.5)%1, atmo_grid=atmo_grid, nosum=False, doppler=doppler2) * self.normalize2
+                fsum2 = self._Flux_boosted(self.secondary, (phase+0.5)%1, atmo_grid=atmo_grid, nosum=False, doppler=doppler2) * self.normalize2
             else:
                 #print( "out hd2" )
-                fsum2 = self.secondary_hd.Flux((phase+0.5)%1, atmo_grid=atmo_grid, nosum=False, doppler=doppler2) #* self.normalize2 ## not needed here
+                fsum2 = self._Flux_boosted(self.secondary_hd, (phase+0.5)%1, atmo_grid=atmo_grid, nosum=False, doppler=doppler2) #* self.normalize2 ## not needed here
             #print( "    regular phase: {}".format(phase) )
 
         #t2 = time.time()
@@ -399,51 +448,182 @@ class StarBinary(object):
         if type1 == "full":
             fsum1 = 0.
         elif type1 == "partial":
-            radii = self.secondary.Outline(ntheta)
+            radii = self._Outline(self.secondary, ntheta)
             weights1 = Eclipse.Occultation_approx(self.primary.vertices, self.primary.r_vertices, self.primary.assoc, self.primary.n_faces, self.primary.incl, phase*cts.TWOPI, self.primary.q, ntheta, radii)
             mu = self.primary._Mu(phase)
             inds = (mu>0)*(weights1<3)
-            fsum1 = self.primary.Flux(phase, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler1)
+            fsum1 = self._Flux_boosted(self.primary, phase, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler1)
             fsum1 *= 1 - weights1[inds]/3
             fsum1 = fsum1.sum() * self.normalize1
         elif type1 == "partial_hd":
-            radii = self.secondary.Outline(ntheta)
+            radii = self._Outline(self.secondary, ntheta)
             weights_highres = Eclipse.Occultation_approx(self.primary_hd.vertices, self.primary_hd.r_vertices, self.primary_hd.assoc, self.primary_hd.n_faces, self.primary_hd.incl, phase*cts.TWOPI, self.primary_hd.q, ntheta, radii)
             weights1 = Eclipse.Weights_transit(self.ind_subsampling1, weights_highres, self.primary.n_faces)
             mu = self.primary._Mu(phase)
             inds = (mu>0)*(weights1<self.total_weight1)
-            fsum1 = self.primary.Flux(phase, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler1)
+            fsum1 = self._Flux_boosted(self.primary, phase, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler1)
             fsum1 *= 1 - weights1[inds]/self.total_weight1
             fsum1 = fsum1.sum() * self.normalize1
         else:
-            fsum1 = self.primary.Flux(phase, atmo_grid=atmo_grid, nosum=False, doppler=doppler1) * self.normalize1
+            fsum1 = self._Flux_boosted(self.primary, phase, atmo_grid=atmo_grid, nosum=False, doppler=doppler1) * self.normalize1
 
         if type2 == "full":
             fsum2 = 0.
         elif type2 == "partial":
-            radii = self.primary.Outline(ntheta)
+            radii = self._Outline(self.primary, ntheta)
             weights2 = Eclipse.Occultation_approx(self.secondary.vertices, self.secondary.r_vertices, self.secondary.assoc, self.secondary.n_faces, self.secondary.incl, ((phase+0.5)%1)*cts.TWOPI, self.secondary.q, ntheta, radii)
             mu = self.secondary._Mu((phase+0.5)%1)
             inds = (mu>0)*(weights2<3)
-            fsum2 = self.secondary.Flux((phase+0.5)%1, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler2)
+            fsum2 = self._Flux_boosted(self.secondary, (phase+0.5)%1, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler2)
             fsum2 *= 1 - weights2[inds]/3
             fsum2 = fsum2.sum() * self.normalize2
         elif type2 == "partial_hd":
-            radii = self.primary.Outline(ntheta)
+            radii = self._Outline(self.primary, ntheta)
             weights_highres = Eclipse.Occultation_approx(self.secondary_hd.vertices, self.secondary_hd.r_vertices, self.secondary_hd.assoc, self.secondary_hd.n_faces, self.secondary_hd.incl, ((phase+0.5)%1)*cts.TWOPI, self.secondary_hd.q, ntheta, radii)
             weights2 = Eclipse.Weights_transit(self.ind_subsampling2, weights_highres, self.secondary.n_faces)
             mu = self.secondary._Mu((phase+0.5)%1)
             inds = (mu>0)*(weights2<self.total_weight2)
-            fsum2 = self.secondary.Flux((phase+0.5)%1, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler2)
+            fsum2 = self._Flux_boosted(self.secondary, (phase+0.5)%1, atmo_grid=atmo_grid, nosum=True, mu=mu, inds=inds, doppler=doppler2)
             fsum2 *= 1 - weights2[inds]/self.total_weight2
             fsum2 = fsum2.sum() * self.normalize2
         else:
-            fsum2 = self.secondary.Flux((phase+0.5)%1, atmo_grid=atmo_grid, nosum=False, doppler=doppler2) * self.normalize2
+            fsum2 = self._Flux_boosted(self.secondary, (phase+0.5)%1, atmo_grid=atmo_grid, nosum=False, doppler=doppler2) * self.normalize2
 
         if nosum:
             return fsum1, fsum2
         return fsum1+fsum2
 
+    def Flux_eclipse_phases(self, phases, atmo_grid=None, ntheta=100, doppler1=0., doppler2=0., nosum=False, chunksize=2**22):
+        """Flux_eclipse_phases(phases, atmo_grid=None, ntheta=100, doppler1=0., doppler2=0., nosum=False, chunksize=2**22)
+        Return the flux interpolated from the atmosphere grid at several
+        orbital phases at once. The result is equivalent, to rounding, to
+        [self.Flux_eclipse(phase) for phase in phases].
+
+        The phases are first classified (see Occultation_phases). For each
+        star, the uneclipsed phases are evaluated at once (see
+        Star.Flux_phases), the outline of the eclipsing star is calculated
+        once, and the occultation weights and fluxes of all the partially
+        eclipsed phases are calculated together.
+
+        phases: vector of orbital phases (in orbital fraction; 0: companion
+            in front, 0.5: companion behind).
+        atmo_grid (optional): atmosphere grid instance used to
+            calculate the flux.
+        ntheta (100): number of points defining the outline of the
+            eclipsing star.
+        doppler1,2 (0.): coefficient for the Doppler boosting. If 0., no
+            Doppler boosting is performed. If None, will use the value
+            returned by self.primary.Doppler_boosting() or
+            self.secondary.Doppler_boosting().
+        nosum (False): if true, will return (fsum1, fsum2), the fluxes
+            of each star, instead of their sum.
+        chunksize (optional): maximum number of phases*faces elements to
+            process at once, in order to bound the memory usage.
+
+        >>> self.Flux_eclipse_phases(phases)
+        fluxes
+        """
+        phases = np.atleast_1d(phases).ravel() % 1
+
+        if atmo_grid is None:
+            atmo_grid = self.atmo_grid
+
+        type1, type2 = self.Occultation_phases(phases)
+        fsum1 = self._Flux_eclipse_phases(self.primary, self.primary_hd, self.secondary, phases, type1, atmo_grid, ntheta, doppler1, self.normalize1, getattr(self, 'ind_subsampling1', None), getattr(self, 'total_weight1', 3), chunksize)
+        fsum2 = self._Flux_eclipse_phases(self.secondary, self.secondary_hd, self.primary, (phases+0.5)%1, type2, atmo_grid, ntheta, doppler2, self.normalize2, getattr(self, 'ind_subsampling2', None), getattr(self, 'total_weight2', 3), chunksize)
+
+        if nosum:
+            return fsum1, fsum2
+        return fsum1+fsum2
+
+    def _Flux_eclipse_phases(self, star, star_hd, star_front, phases, types, atmo_grid, ntheta, doppler, normalize, ind_subsampling, total_weight, chunksize):
+        """_Flux_eclipse_phases(star, star_hd, star_front, phases, types, atmo_grid, ntheta, doppler, normalize, ind_subsampling, total_weight, chunksize)
+        Return the flux of one of the stars at several orbital phases,
+        given the type of occultation at each phase. See Flux_eclipse_phases.
+
+        star: the star instance (e.g. self.primary).
+        star_hd: its high resolution instance, or None.
+        star_front: the other (possibly eclipsing) star.
+        phases: orbital phases of the star.
+        types: the type of occultation of the star at each phase (see
+            Occultation_phases).
+        atmo_grid: atmosphere grid instance used to calculate the flux.
+        ntheta: number of points defining the outline of the eclipsing star.
+        doppler: coefficient for the Doppler boosting (see Flux_eclipse).
+        normalize: normalization factor of the star.
+        ind_subsampling: index of the low resolution face associated with
+            each high resolution face of star_hd.
+        total_weight: weight of a fully eclipsed face of star_hd.
+        chunksize: maximum number of phases*faces elements to process at once.
+        """
+        fsum = np.zeros(phases.size, dtype=float)
+        none = (types == "none").nonzero()[0]
+        partial = ((types == "partial") | (types == "partial_hd")).nonzero()[0]
+        ## The uneclipsed phases
+        if none.size > 0:
+            if doppler is not None and doppler == 0:
+                fsum[none] = star.Flux_phases(phases[none], atmo_grid=atmo_grid, chunksize=chunksize) * normalize
+            else:
+                fsum[none] = self._Flux_weighted_phases(star, phases[none], None, 3, atmo_grid, doppler, chunksize) * normalize
+        ## The partially eclipsed phases
+        if partial.size > 0:
+            radii = self._Outline(star_front, ntheta)
+            if star_hd is None:
+                weights = Eclipse.Occultation_approx(star.vertices, star.r_vertices, star.assoc, star.n_faces, star.incl, phases[partial]*cts.TWOPI, star.q, ntheta, radii)
+                total_weight = 3
+            else:
+                weights_highres = Eclipse.Occultation_approx(star_hd.vertices, star_hd.r_vertices, star_hd.assoc, star_hd.n_faces, star_hd.incl, phases[partial]*cts.TWOPI, star_hd.q, ntheta, radii)
+                weights = Eclipse.Weights_transit(ind_subsampling, weights_highres, star.n_faces)
+            fsum[partial] = self._Flux_weighted_phases(star, phases[partial], weights, total_weight, atmo_grid, doppler, chunksize) * normalize
+        return fsum
+
+    def _Flux_weighted_phases(self, star, phases, weights, total_weight, atmo_grid, doppler, chunksize):
+        """_Flux_weighted_phases(star, phases, weights, total_weight, atmo_grid, doppler, chunksize)
+        Return the flux of a star at several orbital phases, each surface
+        element being weighted by (1 - weights/total_weight), i.e. its
+        uneclipsed fraction.
+
+        The per-element operations are the same as in Flux_eclipse, but the
+        visible elements of each phase are reduced at once as contiguous
+        segments, hence the results agree with Flux_eclipse to rounding.
+
+        star: the star instance (e.g. self.primary).
+        phases: orbital phases of the star.
+        weights: occultation weights of the faces, or None if the star is
+            not eclipsed. shape = nphases, n_faces
+        total_weight: weight of a fully eclipsed face.
+        atmo_grid: atmosphere grid instance used to calculate the flux.
+        doppler: coefficient for the Doppler boosting (see Flux_eclipse).
+        chunksize: maximum number of phases*faces elements to process at once.
+        """
+        gravscale = star._Gravscale()
+        proj = star._Proj(star.separation)
+        fsum = np.zeros(phases.size, dtype=float)
+        nchunk = max(1, chunksize//star.n_faces)
+        for i in range(0, phases.size, nchunk):
+            s = slice(i, i+nchunk)
+            mu = star._Mu(phases[s,None])
+            if weights is None:
+                ivis, iface, bounds = star._Visible(mu)
+            else:
+                ivis, iface, bounds = star._Visible(np.where(weights[s] < total_weight, mu, 0.))
+            fl = atmo_grid.Get_flux_nosum(star.logteff[iface], star.logg[iface]+gravscale, mu.ravel()[ivis], star.area[iface])
+            if proj != 1:
+                fl *= proj
+            if doppler is None:
+                doppler_vis = star.Doppler_boosting_segments(star.logteff[iface], star.logg[iface], bounds).repeat(np.diff(bounds))
+                fl *= 1 - doppler_vis*star._Velocity_surface(phases[s,None]).ravel()[ivis]
+            elif doppler != 0:
+                fl *= 1 - doppler*star._Velocity_surface(phases[s,None]).ravel()[ivis]
+            if weights is not None:
+                fl *= 1 - weights[s].ravel()[ivis]/total_weight
+            ## Since reduceat returns fl[i0] for an empty phase (i0 == i1),
+            ## only the non-empty ones are reduced and the others are left to zero
+            nonempty = (bounds[1:] > bounds[:-1]).nonzero()[0]
+            if nonempty.size:
+                fsum[i+nonempty] = np.add.reduceat(fl, bounds[:-1][nonempty])
+        return fsum
+
     def Flux_doppler(self, phase, atmo_grid=None, velocity1=0., velocity2=0.):
         """Flux_doppler(phase, atmo_grid=None, velocity1=0., velocity2=0.)
         Return the flux interpolated from the atmosphere grid.
@@ -493,6 +673,8 @@ class StarBinary(object):
 
         >>> self.Make_surface(q, omega1, omega2, filling1, filling2, temp1, temp2, tempgrav1, tempgrav2, tirr1, tirr2, porb, k1, incl)
         """
+        # The outlines of the previous surfaces are discarded
+        self._outlines = {}
         # Making the surface of the primary
         self.primary.Make_surface(q=q, omega=omega1, filling=filling1, temp=temp1, tempgrav=tempgrav1, tirr=tirr1, porb=porb, k1=k1, incl=incl)
         self.normalize1 = 1.
@@ -612,4 +794,37 @@ class StarBinary(object):
 
         return type1, type2
 
+    def Occultation_phases(self, phases):
+        """Occultation_phases(phases)
+        Given a vector of orbital phases, calculates the type of occultation
+        for each star at once. Vectorized version of Occultation.
+
+        phases: the orbital phases (in the range [0,1]).
+
+        Returns for each star a vector of:
+            "none": Fully visible
+            "full": Fully eclipsed
+            "partial": Partially eclipsed
+            "partial_hd": Partially eclipsed (high definition surface available)
+
+        >>> type1, type2 = self.Occultation_phases(phases)
+        """
+        phases = np.atleast_1d(phases)
+        type1 = np.full(phases.shape, "none", dtype='<U10')
+        type2 = np.full(phases.shape, "none", dtype='<U10')
+        # if no overlap is possible
+        if self.overlap is None or self.overlap == False:
+            return type1, type2
+        # the secondary star is in the back
+        back2 = (phases <= self.overlap_phs) | (phases >= 1-self.overlap_phs)
+        # the primary star is in the back
+        back1 = ~back2 & ((0.5-self.overlap_phs) <= phases) & (phases <= (0.5+self.overlap_phs))
+        type2[back2] = "partial_hd" if self.secondary_hd else "partial"
+        type1[back1] = "partial_hd" if self.primary_hd else "partial"
+        if self.full_eclipse2:
+            type2[back2 & ((phases <= self.full_eclipse_phs2) | (phases >= 1-self.full_eclipse_phs2))] = "full"
+        if self.full_eclipse1:
+            type1[back1 & ((0.5-self.full_eclipse_phs1) <= phases) & (phases <= (0.5+self.full_eclipse_phs1))] = "full"
+        return type1, type2
+
 ######################## class StarBinary ########################
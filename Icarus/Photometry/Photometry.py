@@ -73,6 +73,31 @@ def Post_plot(influx=False, ncol=1):
     pylab.draw()
 
 
+######################## Process pool functions ########################
+## Model instance used by the worker processes of Photometry.Calc_chi2_batch
+_pool_model = None
+
+def _Pool_init(model):
+    """_Pool_init(model)
+    Initializer of the worker processes. Sets the model instance
+    of the worker. With the 'fork' start method the model is None,
+    in which case the instance inherited from the parent is used.
+    """
+    global _pool_model
+    if model is not None:
+        _pool_model = model
+    return
+
+def _Pool_calc_chi2(args):
+    """_Pool_calc_chi2(args)
+    Evaluates the chi-square of one parameter set in a worker process.
+
+    args: tuple of (par, kwargs) passed to Calc_chi2.
+    """
+    par, kwargs = args
+    return _pool_model.Calc_chi2(par, **kwargs)
+
+
 ######################## class Photometry ########################
 class Photometry(object):
     """Photometry
@@ -85,8 +110,8 @@ class Photometry(object):
     calculate the predicted flux of the model at every data point (i.e.
     for a given orbital phase).
     """
-    def __init__(self, atmo_fln, data_fln, ndiv, read=True, oldchi=False):
-        """__init__(atmo_fln, data_fln, ndiv, read=True)
+    def __init__(self, atmo_fln, data_fln, ndiv, read=True, oldchi=False, chunksize=2**16, fold=False):
+        """__init__(atmo_fln, data_fln, ndiv, read=True, oldchi=False, chunksize=2**16, fold=False)
         This class allows to fit the flux from the primary star
         of a binary system, assuming it is heated by the secondary
         (which in most cases will be a pulsar).
@@ -151,6 +176,13 @@ class Photometry(object):
         read (bool): If True, Icarus will use the pre-calculated geodesic
             primitives. This is the recommended option, unless you have the
             pygts package installed to calculate it on the spot.
+        chunksize (int): Maximum number of phases*faces elements evaluated
+            at once by the lightcurve calculation. It bounds the memory
+            usage, and the default keeps the temporary arrays small enough
+            to remain in cache.
+        fold (bool): If True, symmetric lightcurves are only evaluated over
+            the phases [0, 0.5] (see Star_base.Flux_phases). The results
+            then match the unfolded ones to rounding only.
 
         >>> fit = Photometry(atmo_fln, data_fln, ndiv, read=True)
         """
@@ -169,9 +201,12 @@ class Photometry(object):
             # We keep in mind the number of datasets
             self.ndataset = len(self.atmo_grid)
         # We initialize some important class attributes.
+        self.chunksize = chunksize
+        self.fold = fold
         self._Init_lightcurve(ndiv, read=read, oldchi=oldchi)
         self._Setup()
 
+    @Utils.Profiler.Profiled()
     def Calc_chi2(self, par, do_offset=True, nsamples=None, influx=False, full_output=False, verbose=False):
         """
         Returns the chi-square of the fit of the data to the model.
@@ -300,6 +335,123 @@ class Photometry(object):
         else:
             return chi2
 
+    def Calc_chi2_batch(self, pars, workers=None, do_offset=True, nsamples=None, influx=False):
+        """
+        Returns the chi-square of the fit of the data to the model for
+        a population of parameter sets, such as the walkers of an
+        ensemble sampler or the members of a differential evolution.
+
+        The evaluations are distributed over a persistent pool of worker
+        processes, each holding its own copy of the star model. With the
+        'fork' start method the atmosphere grids are inherited from the
+        parent process and shared read-only. The pool is created on the
+        first call and reused afterwards; see Close_pool.
+
+        Note: the workers hold a snapshot of the model taken when the pool
+            is created. The pool is created again if self.chunksize,
+            self.fold, self.star, its surface cache (Set_surface_cache),
+            self.atmo_grid, self.atmo_stack or self.data are replaced (see
+            _Pool_key). Any other change to the model, e.g. modifying the
+            data or the grids in place, is not seen by the workers unless
+            Close_pool is called first.
+
+        pars: Sequence of parameter lists (or 2d array of shape (npars, ndim)),
+            or of dictionaries. See Calc_chi2 for the format.
+        workers (None): Number of worker processes. If None, the number of
+            CPUs is used. If 1, the evaluation is done serially in the
+            current process.
+        do_offset, nsamples, influx: See Calc_chi2.
+
+        Note: unlike Calc_chi2, the best-fit DM and AV are not written back
+            in the parameter lists when workers are used.
+
+        The results are returned as an array in the same order as pars,
+        which makes it usable as a vectorized likelihood, e.g. for emcee:
+        >>> lnprob = lambda pars: -0.5*self.Calc_chi2_batch(pars, workers=8)
+        >>> sampler = emcee.EnsembleSampler(nwalkers, ndim, lnprob, vectorize=True)
+
+        >>> chi2 = self.Calc_chi2_batch(pars, workers=4)
+        """
+        kwargs = {'do_offset':do_offset, 'nsamples':nsamples, 'influx':influx}
+        if workers is None:
+            import multiprocessing
+            workers = multiprocessing.cpu_count()
+        if workers <= 1 or len(pars) <= 1:
+            return np.array([self.Calc_chi2(par, **kwargs) for par in pars], dtype=float)
+        pool = self._Get_pool(workers)
+        chunksize = max(1, len(pars) // (4*workers))
+        chi2 = pool.map(_Pool_calc_chi2, [(par, kwargs) for par in pars], chunksize=chunksize)
+        return np.array(chi2, dtype=float)
+
+    def Close_pool(self):
+        """
+        Terminates the worker processes used by Calc_chi2_batch, if any.
+
+        >>> self.Close_pool()
+        """
+        pool = getattr(self, '_pool', None)
+        if pool is not None:
+            pool.close()
+            pool.join()
+        self._pool = None
+        self._pool_workers = 0
+        self._pool_key = ((), ())
+        return
+
+    def _Get_pool(self, workers):
+        """
+        Returns the persistent pool of worker processes used by
+        Calc_chi2_batch, creating it if needed, if the number of
+        workers has changed or if the model has changed (see _Pool_key).
+
+        workers (int): Number of worker processes.
+
+        >>> pool = self._Get_pool(4)
+        """
+        global _pool_model
+        settings, objects = self._Pool_key()
+        if getattr(self, '_pool', None) is not None and self._pool_workers == workers and self._pool_key[0] == settings and len(self._pool_key[1]) == len(objects) and all(a is b for a,b in zip(self._pool_key[1], objects)):
+            return self._pool
+        self.Close_pool()
+        import multiprocessing
+        try:
+            ctx = multiprocessing.get_context('fork')
+            _pool_model = self
+            initargs = (None,)
+        except ValueError:
+            ## The 'fork' start method is not available, so the model is pickled to the workers
+            ctx = multiprocessing.get_context()
+            initargs = (self,)
+        try:
+            self._pool = ctx.Pool(workers, initializer=_Pool_init, initargs=initargs)
+        finally:
+            _pool_model = None
+        self._pool_workers = workers
+        self._pool_key = (settings, objects)
+        return self._pool
+
+    def _Pool_key(self):
+        """
+        Returns the settings and the objects making up the model state
+        copied by the worker processes of Calc_chi2_batch. The pool is
+        created again when a setting changes or an object is replaced. The
+        objects are compared by identity, and are kept referenced so that
+        their identity cannot be reused.
+
+        >>> settings, objects = self._Pool_key()
+        """
+        settings = (self.chunksize, getattr(self, 'fold', False))
+        objects = (self.star, getattr(self.star, 'surface_cache', None), self.atmo_grid, getattr(self, 'atmo_stack', None), self.data) + tuple(self.atmo_grid)
+        return settings, objects
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        state['_pool_workers'] = 0
+        state['_pool_key'] = ((), ())
+        return state
+
+    @Utils.Profiler.Profiled()
     def Get_flux(self, par, DM=None, AV=None, flat=False, nsamples=None, influx=False, verbose=False):
         """
         Returns the predicted flux (in magnitude) by the model evaluated
@@ -365,17 +517,7 @@ class Photometry(object):
             offsets = 10**(-0.4*offsets)
 
         # Calculate the actual lightcurves
-        flux = []
-        for i in np.arange(self.ndataset):
-            # If we use the interpolation method and if the filter is the same as a previously
-            # calculated one, we do not recalculate the fluxes and simply copy them.
-            if nsamples is not None and self.grouping[i] < i:
-                flux.append(flux[self.grouping[i]])
-            else:
-                if influx:
-                    flux.append( np.array([self.star.Flux(phase, atmo_grid=self.atmo_grid[i]) for phase in phases[i]]) * offsets[i] )
-                else:
-                    flux.append( np.array([self.star.Mag_flux(phase, atmo_grid=self.atmo_grid[i]) for phase in phases[i]]) + offsets[i] )
+        flux = self._Lightcurves(phases, offsets, influx=influx)
 
         # If nsamples is set, we interpolate the lightcurve at nsamples.
         if nsamples is not None:
@@ -389,6 +531,7 @@ class Photometry(object):
         else:
             return flux
 
+    @Utils.Profiler.Profiled()
     def Get_flux_theoretical(self, par, phases, DM=None, AV=None, influx=False, verbose=False):
         """
         Returns the predicted flux (in magnitude) by the model evaluated at the
@@ -448,20 +591,10 @@ class Photometry(object):
         if influx:
             offsets = 10**(-0.4*offsets)
 
-        flux = []
-        for i in np.arange(self.ndataset):
-            # If the filter is the same as a previously calculated one
-            # we do not recalculate the fluxes and simply copy them.
-            if self.grouping[i] < i:
-                flux.append( flux[self.grouping[i]] )
-            else:
-                if influx:
-                    flux.append( np.array([self.star.Flux(phase, atmo_grid=self.atmo_grid[i]) for phase in phases[i]]) * offsets[i] )
-                else:
-                    flux.append( np.array([self.star.Mag_flux(phase, atmo_grid=self.atmo_grid[i]) for phase in phases[i]]) + offsets[i] )
+        flux = self._Lightcurves(phases, offsets, influx=influx)
         return flux
 
-    def Get_Keff(self, par, nphases=20, atmo_grid=0, make_surface=False, verbose=False):
+    def Get_Keff(self, par, nphases=20, atmo_grid=0, make_surface=False, closed_form=False, verbose=False):
         """
         Returns the effective projected velocity semi-amplitude of the star in m/s.
         The luminosity-weighted average velocity of the star is returned for
@@ -491,18 +624,25 @@ class Photometry(object):
         make_surface (bool): Whether lightcurve.make_surface should be called
             or not. If the flux has been evaluate before and the parameters have
             not changed, False is fine.
+        closed_form (bool): If True, the sin wave is fitted using the closed-form
+            least-squares solution (Utils.Misc.Fit_sin) instead of Fit_linear.
+            It is cheaper when Keff is evaluated many times, e.g. as a
+            constraint in the likelihood.
         verbose (bool): Verbosity. Will plot the velocities and the sin fit.
         """
         # If it is required to recalculate the stellar surface.
         if make_surface:
-            self.Make_surface(par, func_par=func_par, verbose=verbose)
+            self.Make_surface(par, verbose=verbose)
         # Deciding which atmosphere grid we use to evaluate Keff
         if isinstance(atmo_grid, int):
             atmo_grid = self.atmo_grid[atmo_grid]
-        # Get the Keffs and fluxes
+        # Get the Keffs of all the phases at once
         phases = np.arange(nphases)/float(nphases)
-        Keffs = np.array( [self.star.Keff(phase, atmo_grid=atmo_grid) for phase in phases] )
-        tmp = Utils.Misc.Fit_linear(Keffs, np.sin(cts.TWOPI*(phases)), inline=True)
+        Keffs = self.star.Keff_phases(phases, atmo_grid=atmo_grid, chunksize=self.chunksize)
+        if closed_form:
+            tmp = Utils.Misc.Fit_sin(Keffs, phases)
+        else:
+            tmp = Utils.Misc.Fit_linear(Keffs, np.sin(cts.TWOPI*(phases)), inline=True)
         if verbose:
             pylab.plot(np.linspace(0.,1.), tmp[1]*np.sin(np.linspace(0.,1.)*cts.TWOPI)+tmp[0])
             pylab.scatter(phases, Keffs)
@@ -521,6 +661,60 @@ class Photometry(object):
         logger.log(9, "end")
         return
 
+    def _Lightcurves(self, phases, offsets, influx=False):
+        """_Lightcurves(phases, offsets, influx=False)
+        Returns the list of lightcurves of the data sets evaluated at
+        the given phases, for the current surface.
+
+        If the atmosphere grids share the same axes, they are stacked in
+        self.atmo_stack (see _Read_atmo) and all the bands are evaluated
+        by a single call to Flux_phases over the union of the phases.
+        Otherwise, the data sets in the same filter are evaluated only once,
+        over the union of their phases, and all the phases of a filter are
+        evaluated at once by Flux_phases. In both cases, the phases*faces
+        elements are processed in chunks of self.chunksize. The fluxes are
+        then scattered back to each data set. If self.fold is True, Flux_phases further folds
+        symmetric lightcurves onto [0, 0.5] (see Star_base._Symmetric).
+
+        phases: list of the orbital phases of each data set.
+        offsets: offset of each data set, i.e. the flux scaling if influx
+            is True, or the magnitude offset otherwise.
+        influx (bool): If true, will return flux instead of magnitude.
+
+        >>> flux = self._Lightcurves(self.data['phase'], offsets)
+        """
+        flux = [None]*self.ndataset
+        if getattr(self, 'atmo_stack', None) is not None:
+            uphases, inverse = np.unique(np.hstack(phases), return_inverse=True)
+            if influx:
+                fl = self.star.Flux_phases(uphases, atmo_grid=self.atmo_stack, chunksize=self.chunksize, fold=self.fold)
+            else:
+                fl = self.star.Mag_flux_phases(uphases, atmo_grid=self.atmo_stack, chunksize=self.chunksize, fold=self.fold)
+            fl = np.split(fl[inverse.ravel()], np.cumsum([np.size(phase) for phase in phases])[:-1])
+            ## The columns of the stack are the bands, in the order of the groups
+            band = np.searchsorted(np.unique(self.grouping), self.grouping)
+            for i in np.arange(self.ndataset):
+                if influx:
+                    flux[i] = fl[i][:,band[i]] * offsets[i]
+                else:
+                    flux[i] = fl[i][:,band[i]] + offsets[i]
+            return flux
+        for j in np.unique(self.grouping):
+            inds = (self.grouping == j).nonzero()[0]
+            uphases, inverse = np.unique(np.hstack([phases[i] for i in inds]), return_inverse=True)
+            if influx:
+                fl = self.star.Flux_phases(uphases, atmo_grid=self.atmo_grid[j], chunksize=self.chunksize, fold=self.fold)
+            else:
+                fl = self.star.Mag_flux_phases(uphases, atmo_grid=self.atmo_grid[j], chunksize=self.chunksize, fold=self.fold)
+            fl = np.split(fl[inverse.ravel()], np.cumsum([np.size(phases[i]) for i in inds])[:-1])
+            for i, fl_i in zip(inds, fl):
+                if influx:
+                    flux[i] = fl_i * offsets[i]
+                else:
+                    flux[i] = fl_i + offsets[i]
+        return flux
+
+    @Utils.Profiler.Profiled()
     def Make_surface(self, par, verbose=False):
         """
         This function gets the parameters to construct to companion
@@ -788,6 +982,16 @@ class Photometry(object):
             if (line[0] != '#') and (line[0] != '\n'):
                 tmp = line.split()
                 self.atmo_grid.append(Atmosphere.AtmoGridPhot.ReadHDF5(tmp[1]))
+        ## The grids of the distinct bands (i.e. the first data set of each
+        ## band, see grouping in _Setup) are stacked if their axes match, so
+        ## that _Lightcurves evaluates all the bands at once.
+        ids = list(self.data['id'])
+        bands = [i for i in range(len(ids)) if ids[i] not in ids[:i]]
+        try:
+            self.atmo_stack = Atmosphere.AtmoGridPhotStack.From_grids([self.atmo_grid[i] for i in bands])
+        except Exception:
+            logger.info("The atmosphere grids do not share the same axes; the bands will be evaluated separately.")
+            self.atmo_stack = None
         return
 
     def _Read_data(self, data_fln):
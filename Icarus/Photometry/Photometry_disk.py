@@ -439,7 +439,7 @@ class Photometry_disk(object):
                 flux.append(np.array([self.star.Mag_flux_disk(phases[i][n], atmo_grid=self.atmo_grid[i], disk=disk[n]) for n in range(len(phases[i]))]) + self.atmo_grid[i].ext*par[8] + par[7])
         return flux
 
-    def Get_Keff(self, par, nphases=20, dataset=0, func_par=None, make_surface=False, verbose=False):
+    def Get_Keff(self, par, nphases=20, dataset=0, func_par=None, make_surface=False, closed_form=False, verbose=False):
         """
         Returns the effective projected velocity semi-amplitude of the star in m/s.
         The luminosity-weighted average velocity of the star is returned for
@@ -468,6 +468,8 @@ class Photometry_disk(object):
         make_surface (False): Whether lightcurve.make_surface should be called
             or not. If the flux has been evaluate before and the parameters have
             not changed, False is fine.
+        closed_form (False): If True, the sin wave is fitted using the closed-form
+            least-squares solution (Utils.Misc.Fit_sin) instead of Fit_linear.
         verbose (False): Verbosity. Will plot the velocities and the sin fit.
         """
         # Apply a function that can modify the value of parameters.
@@ -480,10 +482,13 @@ class Photometry_disk(object):
             self.star.Make_surface(q=q, omega=par[1], filling=par[2], temp=par[3], tempgrav=par[4], tirr=tirr, porb=self.porb, k1=par[5], incl=par[0])
         # Deciding which atmosphere grid we use to evaluate Keff
         atmo_grid = self.atmo_grid[dataset]
-        # Get the Keffs and fluxes
+        # Get the Keffs of all the phases at once
         phases = np.arange(nphases)/float(nphases)
-        Keffs = np.array( [self.star.Flux_disk_Keff(phase, atmo_grid=atmo_grid, disk=0.) for phase in phases] )[:,1]
-        tmp = Utils.Misc.Fit_linear(-Keffs, np.sin(cts.TWOPI*(phases)), inline=True)
+        Keffs = self.star.Keff_phases(phases, atmo_grid=atmo_grid)
+        if closed_form:
+            tmp = Utils.Misc.Fit_sin(-Keffs, phases)
+        else:
+            tmp = Utils.Misc.Fit_linear(-Keffs, np.sin(cts.TWOPI*(phases)), inline=True)
         if verbose:
             plotxy(-tmp[1]*np.sin(np.linspace(0.,1.)*cts.TWOPI)+tmp[0], np.linspace(0.,1.))
             plotxy(Keffs, phases, line=None, symbol=2)
@@ -1,7 +1,7 @@
 # Licensed under a 3-clause BSD style license - see LICENSE
 
 
-__all__ = ["Spectroscopy", "Doppler_shift", "Normalize_spectrum", "Rebin", "Process_flux", "Process_flux1"]
+__all__ = ["Spectroscopy", "Doppler_shift", "Normalize_spectrum", "Normalize_spectrum_batch", "Rebin", "Process_flux", "Process_flux1", "Velocity_search"]
 
 import sys
 import glob
@@ -118,8 +118,32 @@ class Spectroscopy(object):
             v = [0.]*self.ndataset
         if inds is None:
             inds = np.arange(self.ndataset)
-        fluxes, chi2 = list(zip(*[ Process_flux(self.data['flux'][i], self.data['err'][i], flux_model[i], self.data['wavelength'][i], self.atmo_grid.wav, z=v[i]/cts.c) for i in inds ]))
-        return fluxes, chi2
+        ## The models are rebinned one at a time and normalized all at once
+        models = [ Rebin(flux_model[i], self.atmo_grid.wav*(1+v[i]/cts.c), self.data['wavelength'][i]) for i in inds ]
+        fluxes, chi2 = Normalize_spectrum_batch(models, [self.data['flux'][i] for i in inds], flux_err=[self.data['err'][i] for i in inds])
+        return tuple(fluxes), tuple(chi2)
+
+    def Fit_velocity(self, flux_model, inds=None, vrange=None, coeff=3):
+        """
+        Given a set of flux models calculated with self.Get_flux, finds the
+        velocity of each data set by cross-correlation (see Velocity_search).
+
+        Returns the velocities (m/s), their uncertainties (m/s) and the
+        chi2 of the polynomial normalization at these velocities.
+
+        flux_model (list): Flux models calculated by self.Get_flux. The sampling
+            is that of the atmosphere grid.
+        inds (list): List of indices of the data corresponding to the provided
+            fluxes. If None, assumes that there is an entry for each data.
+        vrange (float): If provided, the search is restricted to the
+            approximate velocity of the data set +/- vrange, in m/s.
+        coeff (int): Polynomial order of the normalization.
+
+        >>> v, v_err, chi2 = Fit_velocity(flux_model)
+        """
+        if inds is None:
+            inds = np.arange(self.ndataset)
+        return Velocity_search([self.data['flux'][i] for i in inds], [self.data['err'][i] for i in inds], [flux_model[i] for i in inds], [self.data['wavelength'][i] for i in inds], self.atmo_grid.wav, v_approx=self.data['v_approx'][inds], vrange=vrange, coeff=coeff)
 
     def Get_flux(self, par, orbph=None, velocities=0., gravscale=None, atmo_grid=None, verbose=False):
         """Get_flux(par, orbph=None, velocities=0., gravscale=None, atmo_grid=None, verbose=False)
@@ -662,18 +686,130 @@ def Process_flux1(flux_obs, flux_obs_err, flux_model, wave_obs, wave_model, v_ap
     """
     Process the model flux and returns the best velocity and chi-square.
 
-    Tries to find the best velocity using "fmin".
+    Finds the best velocity using the cross-correlation of Velocity_search
+    around v_approx and returns the Doppler shift and the chi-square of the
+    polynomial normalization at that shift.
 
     Rebin the model spectra at the observed wavelengths.
     Convolve the model spectra to match the observed spectra.
     Normalize the model spectra to match the observed spectra.
+
+    v_approx: Approximate Doppler shift, in units of v/c (as the returned
+        shift). Note that vrange, if provided in kwargs, is in m/s (see
+        Velocity_search).
+    """
+    v, v_err, chi2 = Velocity_search([flux_obs], [flux_obs_err], [flux_model], [wave_obs], wave_model, v_approx=v_approx*cts.c, **kwargs)
+    return v[0]/cts.c, chi2[0]
+
+def Velocity_search(flux_obs, flux_obs_err, flux_model, wave_obs, wave_model, v_approx=0., vrange=None, coeff=3, chunksize=2**20, **kwargs):
+    """
+    Find the velocity of a set of observed spectra with respect to their
+    model spectra, by FFT cross-correlation on the log(wavelength) grid
+    of the model.
+
+    The continuum of the observed and model spectra is divided out by a
+    polynomial fit before the cross-correlation. The peak of the
+    cross-correlation is refined by parabolic interpolation. The full
+    chi-square of the polynomial normalization (Process_flux) is then only
+    evaluated at that velocity and one model bin on either side: the
+    minimum of the parabola through these points gives the final velocity
+    and its curvature the uncertainty.
+
+    flux_obs (list): Observed spectra.
+    flux_obs_err (list): Errors on the observed spectra.
+    flux_model (list): Model spectra, sampled at wave_model.
+    wave_obs (list): Wavelengths of the observed spectra.
+    wave_model (array): Wavelengths of the model spectra. Must be
+        uniformly spaced in log(wavelength), as the atmosphere grids.
+    v_approx (float, array): Approximate velocity of each spectrum, in m/s.
+    vrange (float): If provided, the search is restricted to
+        v_approx +/- vrange, in m/s.
+    coeff (int): Polynomial order of the normalization.
+    chunksize (int): The spectra are cross-correlated in chunks of about
+        chunksize values, which bounds the size of the FFT arrays.
+    kwargs: Passed to Process_flux for the chi-square evaluation.
+
+    Returns the velocities (m/s), their uncertainties (m/s) and the
+    chi-squares, each of shape (nspectra). If no lag of the cross-correlation
+    can be searched for a spectrum (e.g. vrange smaller than half a model
+    bin, or v_approx beyond the searchable range), its velocity is NaN and
+    its uncertainty and chi-square are infinite.
+
+    >>> v, v_err, chi2 = Velocity_search(fit.data['flux'], fit.data['err'], flux_model, fit.data['wavelength'], fit.atmo_grid.wav)
     """
+    nspec = len(flux_obs)
+    v_approx = np.zeros(nspec, dtype=float) + v_approx
+    lnwave_model = np.log(wave_model)
+    dlnwave = (lnwave_model[-1]-lnwave_model[0]) / (lnwave_model.size-1)
+
+    ## The observed spectra are resampled onto the model grid over their range.
+    ## Both are divided by their continuum.
+    obs = []
+    model = []
+    offset = np.empty(nspec, dtype=int)
+    for i in range(nspec):
+        lnwave_obs = np.log(wave_obs[i])
+        i0, i1 = np.searchsorted(lnwave_model, [lnwave_obs[0], lnwave_obs[-1]])
+        offset[i] = i0
+        obs.append( _Continuum_normalize(np.interp(lnwave_model[i0:i1], lnwave_obs, flux_obs[i]), coeff) )
+        model.append( _Continuum_normalize(np.asarray(flux_model[i], dtype=float), coeff) )
+
+    ## Batched cross-correlation. ccf[i,k] = sum_j model[i][j] obs[i][j+k]
+    ## peaks at k = s-offset, where s is the shift of the observed spectrum
+    ## in model bins. The spectra are transformed in chunks of about
+    ## chunksize values.
+    nfft = 2**int(np.ceil(np.log2(max(o.size+m.size for o,m in zip(obs,model)))))
+    lags = np.fft.ifftshift(np.arange(nfft) - nfft//2)
+    nchunk = max(1, chunksize//nfft)
+
+    v = np.empty(nspec, dtype=float)
+    v_err = np.empty(nspec, dtype=float)
+    chi2 = np.empty(nspec, dtype=float)
     kwargs['chi2only'] = True
-    def return_chi2(z):
-        chi2 = Process_flux(flux_obs, flux_obs_err, new_flux_model, wave_obs, wave_model, z=z **kwargs)
-        return np.sum(chi2)
-    sol = scipy.optimize.fmin(return_chi2, v_approx, full_output=1)
-    return sol[:2]
+    kwargs['coeff'] = coeff
+    for i0 in range(0, nspec, nchunk):
+        i1 = min(i0+nchunk, nspec)
+        fobs = np.fft.rfft(np.array([np.r_[o, np.zeros(nfft-o.size)] for o in obs[i0:i1]]), axis=-1)
+        fmodel = np.fft.rfft(np.array([np.r_[m, np.zeros(nfft-m.size)] for m in model[i0:i1]]), axis=-1)
+        ccf = np.fft.irfft(fobs*fmodel.conj(), n=nfft, axis=-1)
+        for i in range(i0, i1):
+            shift = lags + offset[i]
+            valid = (shift > -model[i].size) & (shift < model[i].size)
+            if vrange is not None:
+                s_approx = np.log1p(v_approx[i]/cts.c) / dlnwave
+                valid &= np.abs(shift - s_approx) <= np.log1p(vrange/cts.c) / dlnwave
+            if not valid.any():
+                logger.warning("Velocity_search: no searchable velocity for spectrum {} (v_approx={}, vrange={}).".format(i, v_approx[i], vrange))
+                v[i], v_err[i], chi2[i] = np.nan, np.inf, np.inf
+                continue
+            k = np.nonzero(valid)[0][np.argmax(ccf[i-i0,valid])]
+            ## Parabolic refinement of the peak
+            y0, y1, y2 = ccf[i-i0,k-1], ccf[i-i0,k], ccf[i-i0,(k+1)%nfft]
+            denom = y0 - 2*y1 + y2
+            delta = 0.5*(y0-y2)/denom if denom < 0 else 0.
+            s = shift[k] + delta
+            ## Chi-square around the cross-correlation peak. Its curvature provides
+            ## the uncertainty and its minimum the final velocity.
+            chi2s = [np.sum(Process_flux(flux_obs[i], flux_obs_err[i], flux_model[i], wave_obs[i], wave_model, z=np.expm1((s+ds)*dlnwave), **kwargs)) for ds in (-1., 0., 1.)]
+            denom = chi2s[0] - 2*chi2s[1] + chi2s[2]
+            if denom > 0:
+                s += np.clip(0.5*(chi2s[0]-chi2s[2])/denom, -1., 1.)
+                chi2[i] = np.sum(Process_flux(flux_obs[i], flux_obs_err[i], flux_model[i], wave_obs[i], wave_model, z=np.expm1(s*dlnwave), **kwargs))
+            else:
+                chi2[i] = chi2s[1]
+            z = np.expm1(s*dlnwave)
+            curvature = denom / ((1+z)*dlnwave)**2
+            v[i] = z*cts.c
+            v_err[i] = np.sqrt(2/curvature)*cts.c if curvature > 0 else np.inf
+    return v, v_err, chi2
+
+def _Continuum_normalize(flux, coeff):
+    """
+    Return a spectrum divided by its polynomial continuum, minus one.
+    """
+    x = np.linspace(-1., 1., flux.size)
+    continuum = np.polyval(np.polyfit(x, flux, coeff-1), x)
+    return flux/continuum - 1
 
 def Doppler_shift(flux, z, z0=1):
     """Doppler_shift(flux, z, z0=1)
@@ -734,14 +870,77 @@ def Normalize_spectrum(flux_model, flux, flux_err=None, a_n=None, coeff=3, chi2o
     coeff (int): Polynomial order of the fit to perform.
     chi2only (bool): If True, will return the chi-square only.
     """
+    x = np.arange(np.size(flux_model)) - np.size(flux_model)/2
+    chi2 = None
     if a_n is None:
-        x = np.arange(np.size(flux_model)) - np.size(flux_model)/2
         a_n, chi2 = Utils.Series.GPolynomial_fit(flux, x=x, err=flux_err, coeff=coeff, Xfnct=flux_model, Xfnct_offset=False)
-    if chi2only:
-        return chi2
-    else:
-        poly = np.poly1d(a_n)
-        norm_flux_model = poly(x) * flux_model
+        if chi2only:
+            return chi2
+    poly = np.poly1d(a_n)
+    norm_flux_model = poly(x) * flux_model
+    if chi2 is None:
+        ## The chi-square of the provided normalization
+        err = 1. if flux_err is None else flux_err
+        chi2 = np.sum(((flux - norm_flux_model)/err)**2)
+        if chi2only:
+            return chi2
+    return norm_flux_model, chi2
+
+def Normalize_spectrum_batch(flux_model, flux, flux_err=None, coeff=3, chunksize=2**14):
+    """
+    Normalize a set of model spectra to fit observed ones using a
+    polynomial fit, as Normalize_spectrum does for a single one. The
+    fits are solved together (see Utils.Series.GPolynomial_fit_batch).
+    Returns the normalized model spectra and their chi-square.
+
+    flux_model (list, array): Model spectra to be normalized.
+        shape -> (nspectra) list of (npoints), or (nspectra,npoints)
+    flux (list, array): Observed spectra to normalize to.
+        Same shape as flux_model.
+    flux_err (list, array): Errors on the observed spectra.
+        shape -> None or float or same shape as flux_model
+    coeff (int): Polynomial order of the fit to perform.
+    chunksize (int): The spectra are processed in chunks of about
+        chunksize values, which keeps the temporary arrays in cache.
+
+    Note: The spectra can have different numbers of points, in which
+        case they are padded internally and a list of normalized
+        spectra is returned.
+
+    >>> norm_flux_model, chi2 = Normalize_spectrum_batch(flux_model, flux, flux_err)
+    """
+    nspec = len(flux)
+    npoints = np.array([np.size(f) for f in flux])
+    scalar_err = flux_err is None or np.isscalar(flux_err)
+    norm_flux_model = []
+    chi2 = np.empty(nspec, dtype=float)
+    nchunk = max(1, chunksize//npoints.max())
+    for i0 in range(0, nspec, nchunk):
+        inds = np.arange(i0, min(i0+nchunk, nspec))
+        n = npoints[inds].max()
+        mask = np.arange(n) < npoints[inds,None]
+        ## Padded stacks of the spectra
+        def pad(arrs, fill):
+            out = np.full((inds.size, n), fill, dtype=float)
+            out[mask] = np.concatenate([np.ravel(arrs[i]) for i in inds])
+            return out
+        flux_model_ = pad(flux_model, 0.)
+        if scalar_err:
+            flux_err_ = 1. if flux_err is None else float(flux_err)
+        else:
+            flux_err_ = pad(flux_err, 1.)
+        ## Same abscissa as Normalize_spectrum for each spectrum
+        x = np.arange(n) - npoints[inds,None]/2
+        a_n, chi2[inds] = Utils.Series.GPolynomial_fit_batch(pad(flux, 0.), x=x, err=flux_err_, coeff=coeff, Xfnct=flux_model_, Xfnct_offset=False, mask=mask, chunksize=chunksize)
+        ## Evaluation of the polynomials (Horner's scheme)
+        poly = a_n[:,0,None] * np.ones_like(x)
+        for k in range(1, coeff):
+            poly *= x
+            poly += a_n[:,k,None]
+        poly *= flux_model_
+        norm_flux_model.extend( [poly[i,:m] for i,m in enumerate(npoints[inds])] )
+    if isinstance(flux_model, np.ndarray) and flux_model.ndim == 2:
+        return np.array(norm_flux_model), chi2
     return norm_flux_model, chi2
 
 def Rebin(flux, x, xnew, interpolate=True):
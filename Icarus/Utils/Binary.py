@@ -3,12 +3,18 @@
 
 import os
 
-import scipy.weave
-
 from .import_modules import *
 
 logger = logging.getLogger(__name__)
 
+# Try to import the weave package
+try:
+    import scipy.weave
+    _HAS_WEAVE = True
+except:
+    logger.info("The scipy.weave package cannot be imported. The radius will be solved using numpy.")
+    _HAS_WEAVE = False
+
 
 ##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
 ## Binary utilities
@@ -216,6 +222,8 @@ def Radius(cosx, cosy, cosz, psi0, r, q, qp1by2om2):
     """
     >>>Radius(-1., 0., 0., 5454., 0.14, 56., 57./2)
     """
+    if not _HAS_WEAVE:
+        return Radii(cosx, cosy, cosz, psi0, r, q, qp1by2om2)[0]
     logger.log(9, "start")
     code = """
     double x, y, z, rc2, rc, rx, rx3, psi, dpsi, dpsidx, dpsidy, dpsidz, dpsidr, dr;
@@ -257,82 +265,80 @@ def Radius(cosx, cosy, cosz, psi0, r, q, qp1by2om2):
     } while (fabs(dr) > 0.00001);
     return_val = r;
     """
-    psi0 = np.float(psi0)
-    r = np.float(r)
-    q = np.float(q)
-    cosx = np.float(cosx)
-    cosy = np.float(cosy)
-    cosz = np.float(cosz)
-    qp1by2om2 = np.float(qp1by2om2)
+    psi0 = float(psi0)
+    r = float(r)
+    q = float(q)
+    cosx = float(cosx)
+    cosy = float(cosy)
+    cosz = float(cosz)
+    qp1by2om2 = float(qp1by2om2)
     get_radius = scipy.weave.inline(code, ['r', 'cosx', 'cosy', 'cosz', 'psi0', 'q', 'qp1by2om2'], type_converters=scipy.weave.converters.blitz, compiler='gcc', verbose=2)
     r = get_radius
     logger.log(9, "end")
     return r
 
-def Radii(cosx, cosy, cosz, psi0, r, q, qp1by2om2):
+def Radii(cosx, cosy, cosz, psi0, r, q, qp1by2om2, nmax=50, tol=1e-5, full_output=False):
     """
-    >>>Radii(np.array([-1.,0.,0.]), np.array([0.,0.1,0.1]), np.array([0.,0.,0.1]), 5454., 0.14, 56., 57./2)
+    Solves the radius of the equipotential surface psi0 along a set of
+    directions using a vectorized Newton-Raphson scheme.
+
+    All elements are iterated at once and only the ones which have not
+    converged yet are updated at each iteration.
+
+    cosx, cosy, cosz: direction cosines (vectors).
+    psi0: potential of the equipotential surface (scalar).
+    r: initial guess radius. Can be a scalar or a vector having the same
+        length as cosx, which allows to warm start from a previous solution.
+    q: mass ratio (mass companion/mass pulsar).
+    qp1by2om2: (q+1) / (2 * omega^2)
+    nmax (50): maximum number of iterations.
+    tol (1e-5): convergence criterion on the radius step.
+    full_output (False): if true, will also return a dictionary containing
+        'niter' (the number of iterations for each element), 'nfailed'
+        (the number of elements which did not converge) and 'failed' (their
+        indices).
+
+    Note: elements which do not converge are set to -99.99. A warning is
+        issued unless full_output is true, in which case the caller is
+        expected to inspect 'nfailed'.
+
+    >>> Radii(np.array([-1.,0.,0.]), np.array([0.,0.1,0.1]), np.array([0.,0.,0.1]), 5454., 0.14, 56., 57./2)
     """
     logger.log(9, "start")
-    code = """
-    #pragma omp parallel shared(r,cosx,cosy,cosz,psi0,q,qp1by2om2,rout,n) default(none)
-    {
-    double x, y, z, rc2, rc, rx, rx3, psi, dpsi, dpsidx, dpsidy, dpsidz, dpsidr, dr;
-    int ii; // this will monitor the number of iterations
-    int nmax = 50; // stop if convergence not reached
-    #pragma omp for
-    for (int i=0; i<n; ++i) {
-        ii = 0;
-        rout(i) = r;
-        do {
-            ii += 1;
-            if (ii > nmax) {
-                //std::cout << "Maximum iteration reached!!!" << std::endl;
-                rout(i) = -99.99;
-                break;
-            }
-            x = rout(i)*cosx(i);
-            y = rout(i)*cosy(i);
-            z = rout(i)*cosz(i);
-            rc2 = x*x+y*y+z*z;
-            rc = sqrt(rc2);
-            rx = sqrt(rc2+1-2*x);
-            rx3 = rx*rx*rx;
-            psi = 1/rc + q/rx - q*x + qp1by2om2*(rc2-z*z);
-            dpsi = -1/(rc*rc*rc)-q/rx3;
-            dpsidx = x*(dpsi+2*qp1by2om2)+q*(1/rx3-1);
-            dpsidy = y*(dpsi+2*qp1by2om2);
-            dpsidz = z*dpsi;
-            dpsidr = dpsidx*cosx(i)+dpsidy*cosy(i)+dpsidz*cosz(i);
-            dr = (psi-psi0)/dpsidr;
-            if ((rout(i) - dr) < 0.0) {
-                rout(i) = 0.5 * rout(i);
-            } else {
-                rout(i) = rout(i) - dr;
-            }
-        } while (fabs(dr) > 0.00001);
-    }
-    }
-    """
-    cosx = np.ascontiguousarray(cosx)
-    cosy = np.ascontiguousarray(cosy)
-    cosz = np.ascontiguousarray(cosz)
-    psi0 = np.float(psi0)
-    r = np.float(r)
-    q = np.float(q)
-    qp1by2om2 = np.float(qp1by2om2)
+    cosx = np.asarray(cosx, dtype=float).ravel()
+    cosy = np.asarray(cosy, dtype=float).ravel()
+    cosz = np.asarray(cosz, dtype=float).ravel()
     n = cosx.size
     rout = np.empty(n, dtype=float)
-    try:
-        if os.uname()[0] == 'Darwin':
-            extra_compile_args = extra_link_args = ['-O3']
-        else:
-            extra_compile_args = extra_link_args = ['-O3 -fopenmp']
-        get_radius = scipy.weave.inline(code, ['r', 'cosx', 'cosy', 'cosz', 'psi0', 'q', 'qp1by2om2', 'rout', 'n'], type_converters=scipy.weave.converters.blitz, compiler='gcc', extra_compile_args=extra_compile_args, extra_link_args=extra_link_args, headers=['<omp.h>'], verbose=2)
-    except:
-        get_radius = scipy.weave.inline(code, ['r', 'cosx', 'cosy', 'cosz', 'psi0', 'q', 'qp1by2om2', 'rout', 'n'], type_converters=scipy.weave.converters.blitz, compiler='gcc', extra_compile_args=['-O3'], extra_link_args=['-O3'], verbose=2)
-    r = get_radius
+    rout[:] = r
+    niter = np.zeros(n, dtype=int)
+    ## Indices of the elements still iterating
+    active = np.arange(n)
+    for i in range(1, nmax+1):
+        if active.size == 0:
+            break
+        tcosx = cosx[active]
+        tcosy = cosy[active]
+        tcosz = cosz[active]
+        tr = rout[active]
+        rc, rx, dpsi, dpsidx, dpsidy, dpsidz, psi = Potential(tr*tcosx, tr*tcosy, tr*tcosz, q, qp1by2om2)
+        dpsidr = dpsidx*tcosx + dpsidy*tcosy + dpsidz*tcosz
+        dr = (psi-psi0)/dpsidr
+        tr_new = tr - dr
+        inds = tr_new < 0.
+        tr_new[inds] = 0.5 * tr[inds]
+        rout[active] = tr_new
+        niter[active] = i
+        active = active[np.abs(dr) > tol]
+    ## The remaining active elements have not converged
+    nfailed = active.size
+    if nfailed > 0:
+        rout[active] = -99.99
     logger.log(9, "end")
+    if full_output:
+        return rout, {'niter':niter, 'nfailed':nfailed, 'failed':active}
+    if nfailed > 0:
+        logger.warning("Radii: {} out of {} elements did not converge after {} iterations.".format(nfailed, n, nmax))
     return rout
 
 def Roche_lobe(q):
@@ -358,8 +364,17 @@ def Roche_lobe(q):
 
 def Saddle(x, q, qp1by2om2):
     """
+    Returns the position of the saddle point (L1) along the x axis,
+    found by Newton-Raphson iterations from the guess position x.
+
+    x: guess position.
+    q: mass ratio (mass companion/mass pulsar).
+    qp1by2om2: (q+1) / (2 * omega^2)
+
     >>>Saddle(0.5, 56., 57./2)
     """
+    if not _HAS_WEAVE:
+        return Saddle_numpy(x, q, qp1by2om2)
     logger.log(9, "start")
     code = """
         double rc, rx, rx3, dpsi, dpsidx, d2psidx2, dx;
@@ -375,9 +390,40 @@ def Saddle(x, q, qp1by2om2):
         } while (fabs(dx/x) > 0.00001);
         return_val = x;
         """
-    q = np.float(q)
-    qp1by2om2 = np.float(qp1by2om2)
+    q = float(q)
+    qp1by2om2 = float(qp1by2om2)
     get_saddle = scipy.weave.inline(code, ['x', 'q', 'qp1by2om2'], type_converters=scipy.weave.converters.blitz, compiler='gcc', verbose=2)
     x = get_saddle
     logger.log(9, "end")
     return x
+
+def Saddle_numpy(x, q, qp1by2om2, nmax=100, tol=1e-5):
+    """
+    Numpy equivalent of Saddle. The same Newton-Raphson iterations are
+    performed on the 1-D derivative of the potential along the x axis.
+
+    x: guess position.
+    q: mass ratio (mass companion/mass pulsar).
+    qp1by2om2: (q+1) / (2 * omega^2)
+    nmax (100): maximum number of iterations.
+    tol (1e-5): convergence criterion on the fractional step.
+
+    >>>Saddle_numpy(0.5, 56., 57./2)
+    """
+    x = float(x)
+    q = float(q)
+    qp1by2om2 = float(qp1by2om2)
+    for i in range(nmax):
+        rc = abs(x)
+        rx = np.sqrt(rc*rc+1-2*x)
+        rx3 = rx*rx*rx
+        dpsi = -1/(rc*rc*rc)-q/rx3
+        dpsidx = x*(dpsi+2*qp1by2om2)+q*(1/rx3-1)
+        d2psidx2 = dpsi+3*(x*x/(rc*rc*rc*rc*rc)+q*(x-1)*(x-1)/(rx*rx*rx*rx*rx))+2*qp1by2om2
+        dx = -dpsidx/d2psidx2
+        x = x+dx
+        if abs(dx/x) <= tol:
+            break
+    else:
+        logger.warning("Saddle: did not converge after {} iterations.".format(nmax))
+    return x
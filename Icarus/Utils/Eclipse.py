@@ -3,10 +3,18 @@
 
 import os
 
-import scipy.weave
-
 from .import_modules import *
 
+logger = logging.getLogger(__name__)
+
+# Try to import the weave package
+try:
+    import scipy.weave
+    _HAS_WEAVE = True
+except:
+    logger.info("The scipy.weave package cannot be imported. Some of the eclipse utilities will not be available.")
+    _HAS_WEAVE = False
+
 # Try to import the Shapely package
 try:
     import shapely.geometry
@@ -277,95 +285,75 @@ def Inside_triangle(p, a, b, c):
     lambda3 = 1 - lambda1 - lambda2
     return (0 < lambda1 < 1) and (0 < lambda2 < 1) and (0 < lambda3 < 1)
 
-def Occultation_approx(vertices, r_vertices, assoc, n_faces, incl, orbph, q, ntheta, radii):
-    """Occultation_approx(vertices, r_vertices, assoc, n_faces, incl, orbph, q, ntheta, radii)
+def Occultation_approx(vertices, r_vertices, assoc, n_faces, incl, orbph, q, ntheta, radii, chunksize=2**22):
+    """Occultation_approx(vertices, r_vertices, assoc, n_faces, incl, orbph, q, ntheta, radii, chunksize=2**22)
 
     Hidden surface removal algorithm.
     Returns the weight of each face/surface element with
     0, 1, 2, 3; going from not covered to fully covered.
-    """
-    support_code = """
-    #include <iostream>
-    // method to convert 3d coordinate to sky plane projection
-    void to_skyplane( double x, double y, double z, double incl, double orbph, double offsety, double offsetz, double *ynew, double *znew ) {
-        double cos_incl, sin_incl, cos_phs, sin_phs, xnew;
 
-        cos_incl = cos(incl);
-        sin_incl = sin(incl);
-        cos_phs = cos(orbph);
-        sin_phs = sin(orbph);
-        xnew = x*cos_phs + y*sin_phs;
-        *ynew = -x*sin_phs + y*cos_phs + offsety;
-        *znew = z*sin_incl + xnew*cos_incl + offsetz;
-        //*ynew = 5.;
-        //*znew = 10.;
-        //std::cout << "Test" << std::endl;
-        //std::cout << *ynew << std::endl;
-        //std::cout << *znew << std::endl;
-    }
+    The vertices are projected on the sky plane, relative to the center
+    of the occulting star, and a vertex is covered if it lies within the
+    outline of the occulting star at the same position angle. The weight
+    of a face is the number of its covered vertices.
+
+    vertices: x,y,z coordinates of the vertices on the unit sphere. shape = n_vertices,3
+    r_vertices: radius of the vertices. shape = n_vertices
+    assoc: indices of faces associated to a vertice. shape = n_vertices,6
+    n_faces: number of faces.
+    incl: orbital inclination (radians).
+    orbph: orbital phase (radians). Can be a vector of phases, in which
+        case the weights are returned for each of them. shape = nphases
+    q: mass ratio.
+    ntheta: number of points defining the outline.
+    radii: radii of the outline of the occulting star at
+        theta = np.arange(ntheta)/ntheta*cts.TWOPI (see Star.Outline).
+    chunksize (2**22): maximum number of vertex positions processed at
+        once when orbph is a vector, in order to bound the memory usage.
+
+    >>> weight = Occultation_approx(vertices, r_vertices, assoc, n_faces, incl, orbph, q, ntheta, radii)
+    >>> weights = Occultation_approx(vertices, r_vertices, assoc, n_faces, incl, orbphs, q, ntheta, radii)
+    >>> weights.shape = nphases, n_faces
     """
-
-    code = """
-    double tmp_y, tmp_z;
-    double offsety, offsetz;
-
-    to_skyplane( -1./(1.+q), 0., 0., incl, orbph, 0., 0., &offsety, &offsetz );
-    //std::cout << offsety << " " << offsetz << std::endl;
-    tmp_y = offsety;
-    tmp_z = offsetz;
-    to_skyplane( q/(1.+q), 0., 0., incl, orbph, 0., 0., &offsety, &offsetz );
-    //std::cout << offsety << " " << offsetz << std::endl;
-    offsety -= tmp_y;
-    offsetz -= tmp_z;
-
-    #pragma omp parallel shared(n_vertices,vertices,assoc,r_vertices,incl,orbph,weight,ntheta,radii,offsety,offsetz) default(none)
-    {
-    int ind;
-    double vx, vy, vz;
-    double y, z;
-    double theta, w, r;
-    int pos;
-    #pragma omp for
-    for (int i=0; i<n_vertices; i++) {
-        // first, retrieve the vertice coordinates
-        vx = vertices(i,0);
-        vy = vertices(i,1);
-        vz = vertices(i,2);
-        // transform the vertice coordinates to the sky plane
-        to_skyplane( vx*r_vertices(i),vy*r_vertices(i),vz*r_vertices(i),incl,orbph,offsety,offsetz,&y,&z );
-
-        theta = atan2(z,y);
-        pos = int( theta/ntheta );
-        w = theta/ntheta - pos;
-        //std::cout << "Test" << std::endl;
-        //std::cout << theta << " " << pos << " " << w << std::endl;
-        r = radii(pos)*(1-w) + radii(pos+1)*w;
-
-        if ((pow(y,2)+pow(z,2)) < pow(r,2)) {
-            for (int j=0; j<5; j++) {
-                ind = assoc(i, j);
-                weight(ind) += 1.;
-            }
-            if (assoc(i, 5) != -99) {
-                ind = assoc(i, 5);
-                weight(ind) += 1.;
-            }
-        }
-    }
-    }
+    orbph = np.asarray(orbph, dtype=float)
+    if orbph.ndim > 0:
+        n_vertices = vertices.shape[0]
+        weight = np.empty((orbph.size, n_faces), dtype=float)
+        step = max(1, chunksize // max(n_vertices,1))
+        for i in range(0, orbph.size, step):
+            weight[i:i+step] = _Occultation_approx(vertices, r_vertices, assoc, n_faces, incl, orbph[i:i+step], q, ntheta, radii)
+        return weight
+    return _Occultation_approx(vertices, r_vertices, assoc, n_faces, incl, orbph[None], q, ntheta, radii)[0]
+
+def _Occultation_approx(vertices, r_vertices, assoc, n_faces, incl, orbph, q, ntheta, radii):
+    """_Occultation_approx(vertices, r_vertices, assoc, n_faces, incl, orbph, q, ntheta, radii)
+
+    Vectorized kernel of Occultation_approx for a vector of phases.
+    Returns the weights. shape = nphases, n_faces
     """
-    q = np.float(q)
-    n_vertices = vertices.shape[0]
-    weight = np.zeros(n_faces, dtype=np.float)
-    try:
-        if os.uname()[0] == 'Darwin':
-            extra_compile_args = extra_link_args = ['-O3']
-        else:
-            extra_compile_args = extra_link_args = ['-O3 -fopenmp']
-        tmp = scipy.weave.inline(code, ['n_vertices', 'vertices', 'assoc', 'r_vertices', 'incl', 'orbph', 'q', 'weight', 'ntheta', 'radii'], type_converters=scipy.weave.converters.blitz, compiler='gcc', support_code=support_code, extra_compile_args=extra_compile_args, extra_link_args=extra_link_args, headers=['<cstdio>', '<cmath>', '<omp.h>'], verbose=2, force=0)
-    except:
-        tmp = scipy.weave.inline(code, ['n_vertices', 'vertices', 'assoc', 'r_vertices', 'incl', 'orbph', 'q', 'weight', 'ntheta', 'radii'], type_converters=scipy.weave.converters.blitz, compiler='gcc', support_code=support_code, extra_compile_args=['-O3'], extra_link_args=['-O3'], headers=['<cstdio>', '<cmath>'], verbose=2, force=0)
-
+    cos_incl = np.cos(incl)
+    sin_incl = np.sin(incl)
+    cos_phs = np.cos(orbph)[:,None]
+    sin_phs = np.sin(orbph)[:,None]
+    # Offset between the center of the occulted star, at -1/(1+q), and that of the occulting one, at q/(1+q), on the sky plane
+    offsety = -sin_phs
+    offsetz = cos_phs * cos_incl
+    # Sky plane projection of the vertices. shape = nphases, n_vertices
+    vx, vy, vz = (vertices * np.asarray(r_vertices)[:,None]).T
+    xnew = vx*cos_phs + vy*sin_phs
+    y = -vx*sin_phs + vy*cos_phs + offsety
+    z = vz*sin_incl + xnew*cos_incl + offsetz
+    # Radius of the outline of the occulting star at the position angle of the vertices
+    theta = np.arctan2(z, y) % cts.TWOPI
+    theta_outline = np.arange(ntheta, dtype=float)/ntheta * cts.TWOPI
+    r = np.interp(theta, theta_outline, radii[:ntheta], period=cts.TWOPI)
+    covered = (y**2 + z**2) < r**2
+    # Scatter the covered vertices to their associated faces
+    ind_vertex, ind_assoc = (assoc != -99).nonzero()
+    ind_face = assoc[ind_vertex, ind_assoc]
+    nphases = orbph.size
+    ind = (np.arange(nphases)[:,None]*n_faces + ind_face).ravel()
+    weight = np.bincount(ind, weights=covered[:,ind_vertex].ravel(), minlength=nphases*n_faces).reshape(nphases, n_faces)
     return weight
 
 def Occultation_shapely(vertices, faces_ind, incl, orbph, q, ntheta, radii):
@@ -547,28 +535,22 @@ def System_2Dprojection(x1, y1, z1, x2, y2, z2, incl, orbph, q):
 
 def Weights_transit(inds_highres, weight_highres, n_lowres):
     """Weights_transit(inds_highres, weight_highres, n_lowres)
+    Returns the sum of the weights of the high resolution faces
+    associated with each low resolution face.
 
-    """
-    code = """
-    #pragma omp parallel shared(n_highres,weight_lowres,weight_highres,inds_highres) default(none)
-    {
-    int ind;
-    #pragma omp for
-    for (int i=0; i<n_highres; i++) {
-        ind = inds_highres(i);
-        weight_lowres(ind) += weight_highres(i);
-    }
-    }
-    """
+    inds_highres: index of the low resolution face associated with
+        each high resolution face.
+    weight_highres: weight of each high resolution face. Can also be
+        the weights of several phases, shape = nphases, n_highres, in
+        which case the weights are returned for each of them.
+    n_lowres: number of low resolution faces.
 
-    n_highres = inds_highres.shape[0]
-    weight_lowres = np.zeros(n_lowres, dtype='float')
-    try:
-        if os.uname()[0] == 'Darwin':
-            extra_compile_args = extra_link_args = ['-O3']
-        else:
-            extra_compile_args = extra_link_args = ['-O3 -fopenmp']
-        get_assoc = scipy.weave.inline(code, ['n_highres', 'weight_lowres', 'weight_highres', 'inds_highres'], type_converters=scipy.weave.converters.blitz, compiler='gcc', extra_compile_args=extra_compile_args, extra_link_args=extra_link_args, headers=['<omp.h>'], libraries=['m'], verbose=2, force=0)
-    except:
-        get_assoc = scipy.weave.inline(code, ['n_highres', 'weight_lowres', 'weight_highres', 'inds_highres'], type_converters=scipy.weave.converters.blitz, compiler='gcc', extra_compile_args=['-O3'], extra_link_args=['-O3'], libraries=['m'], verbose=2, force=0)
+    >>> weight_lowres = Weights_transit(inds_highres, weight_highres, n_lowres)
+    """
+    weight_highres = np.asarray(weight_highres)
+    if weight_highres.ndim == 2:
+        nphases = weight_highres.shape[0]
+        ind = (np.arange(nphases)[:,None]*n_lowres + inds_highres).ravel()
+        return np.bincount(ind, weights=weight_highres.ravel(), minlength=nphases*n_lowres).astype(float).reshape(nphases, n_lowres)
+    weight_lowres = np.bincount(inds_highres, weights=weight_highres, minlength=n_lowres).astype(float)
     return weight_lowres
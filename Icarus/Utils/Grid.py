@@ -3,12 +3,22 @@
 
 import os
 
-import scipy.weave
-
 from .import_modules import *
 
 logger = logging.getLogger(__name__)
 
+# Try to import the weave package
+try:
+    import scipy.weave
+    _HAS_WEAVE = True
+except:
+    logger.info("The scipy.weave package cannot be imported. The grid interpolation will use the numpy backend.")
+    _HAS_WEAVE = False
+
+## Backend used by the photometric interpolation functions. Either 'weave'
+## (compiled C with OpenMP) or 'numpy' (vectorized, no compilation needed).
+BACKEND = 'weave' if _HAS_WEAVE else 'numpy'
+
 
 ##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
 ## Grid utilities
@@ -21,6 +31,8 @@ logger = logging.getLogger(__name__)
 def Interp_3Dgrid(grid, wx, wy, wz, jx, jy, jz):
     """
     """
+    if BACKEND == 'numpy':
+        return Interp_3Dgrid_numpy(grid, wx, wy, wz, jx, jy, jz)
     code = """
     #pragma omp parallel shared(grid,wx,wy,wz,jx,jy,jz,area,val_z,nsurf,interp_val) default(none)
     {
@@ -93,6 +105,8 @@ def Interp_photometry(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val_mu):
     flux : scalar
         Flux integrated over the surface.
     """
+    if BACKEND == 'numpy':
+        return Interp_photometry_numpy(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val_mu)
     code = """
     double fl = 0.;
     #pragma omp parallel shared(grid,wteff,wlogg,wmu,jteff,jlogg,jmu,area,val_mu,nsurf,fl) default(none)
@@ -172,6 +186,8 @@ def Interp_photometry_doppler(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area,
     flux : scalar
         Flux integrated over the surface, with Doppler boosting.
     """
+    if BACKEND == 'numpy':
+        return Interp_photometry_doppler_numpy(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val_mu, val_vel, grid_doppler)
     code = """
     double fl = 0.;
     #pragma omp parallel shared(grid,wteff,wlogg,wmu,jteff,jlogg,jmu,area,val_mu,nsurf,val_vel,grid_doppler,fl) default(none)
@@ -260,6 +276,8 @@ def Interp_photometry_doppler_nosum(grid, wteff, wlogg, wmu, jteff, jlogg, jmu,
     flux : ndarray
         Flux _not_ integrated over the surface.
     """
+    if BACKEND == 'numpy':
+        return Interp_photometry_doppler_nosum_numpy(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val_mu, val_vel, grid_doppler)
     code = """
     #pragma omp parallel shared(grid,wteff,wlogg,wmu,jteff,jlogg,jmu,area,val_mu,nsurf,val_vel,grid_doppler,fl) default(none)
     {
@@ -353,6 +371,8 @@ def Interp_photometry_details(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area,
     Teff : scalar
         Flux-weighted temperature.
     """
+    if BACKEND == 'numpy':
+        return Interp_photometry_details_numpy(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val_mu, v, val_teff)
     code = """
     double fl = 0.;
     double Keff = 0.;
@@ -452,6 +472,8 @@ def Interp_photometry_Keff(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val
     Keff : scalar
         Flux-weighted radial velocity.
     """
+    if BACKEND == 'numpy':
+        return Interp_photometry_Keff_numpy(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val_mu, v)
     code = """
     double fl = 0.;
     double Keff = 0.;
@@ -535,6 +557,8 @@ def Interp_photometry_nosum(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, va
     flux : ndarray
         Flux _not_ integrated over the surface.
     """
+    if BACKEND == 'numpy':
+        return Interp_photometry_nosum_numpy(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val_mu)
     code = """
     #pragma omp parallel shared(grid,wteff,wlogg,wmu,jteff,jlogg,jmu,area,val_mu,nsurf,fl) default(none)
     {
@@ -584,13 +608,19 @@ def Interp_photometry_nosum(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, va
     tmp = get_flux
     return fl
 
-def Interp_doppler(grid, wteff, wlogg, wmu, wwav, jteff, jlogg, jmu, jwav, area, val_mu):
+def Interp_doppler(grid, wteff, wlogg, wmu, wwav, jteff, jlogg, jmu, jwav, area, val_mu, linear=False):
     """
     Simple interpolation of an atmosphere grid having axes (logtemp, logg, mu, wav).
 
     This grid interpolation is made for a grid which is linear in the velocity
     or redshift space, e.g. log lambda.
 
+    By default the grid is assumed to contain log(flux) values, which are
+    exponentiated after the interpolation. If linear is true, the grid is
+    assumed to contain flux values, which are interpolated linearly and
+    summed directly, hence avoiding the evaluation of an exponential for
+    each surface element and wavelength.
+
     Note: Because of the Doppler shift, the interpolation on the wavelength
         will necessarily go out of bound, on the lower or upper range. We
         assume that the atmosphere grid has a broader spectral coverage than
@@ -609,15 +639,19 @@ def Interp_doppler(grid, wteff, wlogg, wmu, wwav, jteff, jlogg, jmu, jwav, area,
         Area (i.e. weight) of each surface element for the summation.
     val_mu : ndarray
         Value of the cross-section visible to us.
+    linear : bool
+        Whether the grid contains flux (True) or log(flux) (False) values.
 
     Returns
     -------
     spectrum : ndarray
         Spectrum integrated over the surface.
     """
+    if BACKEND == 'numpy':
+        return Interp_doppler_numpy(grid, wteff, wlogg, wmu, wwav, jteff, jlogg, jmu, jwav, area, val_mu, linear=linear)
     logger.log(9, "start")
     code = """
-    #pragma omp parallel shared(grid,wteff,wlogg,wmu,wwav,jteff,jlogg,jmu,jwav,area,val_mu,nsurf,nwav,fl) default(none)
+    #pragma omp parallel shared(grid,wteff,wlogg,wmu,wwav,jteff,jlogg,jmu,jwav,area,val_mu,nsurf,nwav,is_linear,fl) default(none)
     {
     double w1teff, w0teff, w1logg, w0logg, w1mu, w0mu, w1wav, w0wav, tmp_fl;
     int j0teff, j1teff, j0logg, j1logg, j0mu, j1mu, j0wav, j1wav, j0wavk, j1wavk;
@@ -684,9 +718,11 @@ def Interp_doppler(grid, wteff, wlogg, wmu, wwav, jteff, jlogg, jmu, jwav, area,
             //std::cout << "tmp_fl " << tmp_fl << std::endl;
             //std::cout << "area*val_mu " << area(i) * val_mu(i) << std::endl;
             //std::cout << "fl " << tmp_fl * area(i) * val_mu(i) << std::endl;
-            //fl(k) += tmp_fl * area(i) * val_mu(i);
-            fl(k) += exp(tmp_fl) * area(i) * val_mu(i);
-                //);
+            // The grid contains flux (is_linear = 1) or log(flux) values
+            if (is_linear)
+                fl(k) += tmp_fl * area(i) * val_mu(i);
+            else
+                fl(k) += exp(tmp_fl) * area(i) * val_mu(i);
         }
     }
     }
@@ -704,13 +740,14 @@ def Interp_doppler(grid, wteff, wlogg, wmu, wwav, jteff, jlogg, jmu, jwav, area,
     val_mu = np.ascontiguousarray(val_mu)
     nsurf = jteff.size
     nwav = grid.shape[-1]
+    is_linear = int(bool(linear))
     fl = np.zeros(nwav, dtype=float)
     if os.uname()[0] == 'Darwin':
         #extra_compile_args = extra_link_args = ['-O3']
         extra_compile_args = extra_link_args = ['-Ofast']
     else:
         extra_compile_args = extra_link_args = ['-O3 -fopenmp']
-    get_flux = scipy.weave.inline(code, ['grid', 'wteff', 'wlogg', 'wmu', 'wwav', 'jteff', 'jlogg', 'jmu', 'jwav', 'area', 'val_mu', 'nsurf', 'nwav', 'fl'], type_converters=scipy.weave.converters.blitz, compiler='gcc', extra_compile_args=extra_compile_args, extra_link_args=extra_link_args, headers=['<omp.h>','<cmath>'], libraries=['m'], verbose=2)
+    get_flux = scipy.weave.inline(code, ['grid', 'wteff', 'wlogg', 'wmu', 'wwav', 'jteff', 'jlogg', 'jmu', 'jwav', 'area', 'val_mu', 'nsurf', 'nwav', 'is_linear', 'fl'], type_converters=scipy.weave.converters.blitz, compiler='gcc', extra_compile_args=extra_compile_args, extra_link_args=extra_link_args, headers=['<omp.h>','<cmath>'], libraries=['m'], verbose=2)
     tmp = get_flux
     logger.log(9, "end")
     return fl
@@ -1142,3 +1179,343 @@ def Shift_spectrum(fref, wobs, v, refstart, refstep):
     rebin = scipy.weave.inline(code, ['refstart', 'refstep', 'nobs', 'nref', 'fref', 'fbin', 'wobs', 'v'], type_converters=scipy.weave.converters.blitz, compiler='gcc', libraries=['m'])
     tmp = rebin
     return fbin
+
+
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+## Numpy backend
+## Vectorized equivalents of the photometric interpolation
+## functions above. They perform the same 8-corner trilinear
+## interpolation as batched array operations and therefore do
+## not require any compilation.
+##
+## The input arrays can have any shape (e.g. (nphases, nsurf));
+## the summation is always performed along the last axis.
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+
+
+def Set_backend(backend):
+    """
+    Select the backend used by the photometric interpolation functions.
+
+    Parameters
+    ----------
+    backend : str
+        Either 'weave' (compiled C with OpenMP) or 'numpy' (vectorized).
+
+    >>> Set_backend('numpy')
+    """
+    global BACKEND
+    if backend not in ('weave', 'numpy'):
+        raise ValueError("The backend must be 'weave' or 'numpy'.")
+    if backend == 'weave' and not _HAS_WEAVE:
+        raise Exception("The scipy.weave package is not available, cannot use the weave backend.")
+    BACKEND = backend
+    return
+
+def Interp_3Dgrid_numpy(grid, wx, wy, wz, jx, jy, jz):
+    """
+    Trilinear interpolation of a 3D grid. Numpy equivalent of Interp_3Dgrid.
+
+    Parameters
+    ----------
+    grid : ndarray
+        Grid, with dimensions (x, y, z, ...). Trailing dimensions, if any,
+        are carried along.
+    wx, wy, wz : ndarray
+        Weights of the x, y, z.
+    jx, jy, jz : ndarray
+        Index of the x, y, z lower bound.
+
+    Returns
+    -------
+    interp_val : ndarray
+        Interpolated values.
+    """
+    w1x = np.asarray(wx, dtype=float)
+    w0x = 1.-w1x
+    j0x = np.asarray(jx, dtype=int)
+    j1x = j0x+1
+    w1y = np.asarray(wy, dtype=float)
+    w0y = 1.-w1y
+    j0y = np.asarray(jy, dtype=int)
+    j1y = j0y+1
+    w1z = np.asarray(wz, dtype=float)
+    w0z = 1.-w1z
+    j0z = np.asarray(jz, dtype=int)
+    j1z = j0z+1
+    ## In case the grid has extra trailing dimensions, we broadcast the weights
+    if grid.ndim > 3:
+        extra = (Ellipsis,) + (None,)*(grid.ndim-3)
+        w1x, w0x, w1y, w0y, w1z, w0z = w1x[extra], w0x[extra], w1y[extra], w0y[extra], w1z[extra], w0z[extra]
+    interp_val = w1z*(w0y*(w0x*grid[j0x,j0y,j1z] + w1x*grid[j1x,j0y,j1z]) \
+                    + w1y*(w0x*grid[j0x,j1y,j1z] + w1x*grid[j1x,j1y,j1z])) \
+               + w0z*(w0y*(w0x*grid[j0x,j0y,j0z] + w1x*grid[j1x,j0y,j0z]) \
+                    + w1y*(w0x*grid[j0x,j1y,j0z] + w1x*grid[j1x,j1y,j0z]))
+    return interp_val
+
+def Interp_photometry_numpy(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val_mu):
+    """
+    Numpy equivalent of Interp_photometry.
+
+    Returns
+    -------
+    flux : scalar (or ndarray)
+        Flux integrated over the surface (i.e. the last axis).
+    """
+    fl = Interp_photometry_nosum_numpy(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val_mu)
+    return fl.sum(axis=-1)
+
+def Interp_photometry_doppler_numpy(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val_mu, val_vel, grid_doppler):
+    """
+    Numpy equivalent of Interp_photometry_doppler.
+
+    Returns
+    -------
+    flux : scalar (or ndarray)
+        Flux integrated over the surface (i.e. the last axis), with Doppler
+        boosting.
+    """
+    fl = Interp_photometry_doppler_nosum_numpy(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val_mu, val_vel, grid_doppler)
+    return fl.sum(axis=-1)
+
+def Interp_photometry_doppler_nosum_numpy(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val_mu, val_vel, grid_doppler):
+    """
+    Numpy equivalent of Interp_photometry_doppler_nosum.
+
+    Returns
+    -------
+    flux : ndarray
+        Flux _not_ integrated over the surface, with Doppler boosting.
+    """
+    fl = Interp_photometry_nosum_numpy(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val_mu)
+    tmp_doppler = Interp_3Dgrid_numpy(grid_doppler, wteff, wlogg, wmu, jteff, jlogg, jmu)
+    return fl * (1 + tmp_doppler * val_vel)
+
+def Interp_photometry_details_numpy(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val_mu, v, val_teff):
+    """
+    Numpy equivalent of Interp_photometry_details.
+
+    Returns
+    -------
+    flux : scalar (or ndarray)
+        Flux integrated over the surface (i.e. the last axis).
+    Keff : scalar (or ndarray)
+        Flux-weighted velocity.
+    vsini : scalar (or ndarray)
+        Estimated vsini.
+    Teff : scalar (or ndarray)
+        Flux-weighted temperature.
+    """
+    tmp_fl = Interp_photometry_nosum_numpy(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val_mu)
+    fl = tmp_fl.sum(axis=-1)
+    Keff = (v * tmp_fl).sum(axis=-1) / fl
+    KeffSquare = (v*v * tmp_fl).sum(axis=-1) / fl
+    Teff = (np.exp(val_teff) * tmp_fl).sum(axis=-1) / fl
+    vsini = np.sqrt(KeffSquare - Keff*Keff)
+    return fl, Keff, vsini, Teff
+
+def Interp_photometry_Keff_numpy(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val_mu, v):
+    """
+    Numpy equivalent of Interp_photometry_Keff.
+
+    Returns
+    -------
+    flux : scalar (or ndarray)
+        Flux integrated over the surface (i.e. the last axis).
+    Keff : scalar (or ndarray)
+        Flux-weighted velocity.
+    """
+    tmp_fl = Interp_photometry_nosum_numpy(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val_mu)
+    fl = tmp_fl.sum(axis=-1)
+    Keff = (v * tmp_fl).sum(axis=-1) / fl
+    return fl, Keff
+
+def Interp_photometry_nosum_numpy(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val_mu):
+    """
+    Numpy equivalent of Interp_photometry_nosum.
+
+    Returns
+    -------
+    flux : ndarray
+        Flux _not_ integrated over the surface.
+    """
+    tmp_fl = Interp_3Dgrid_numpy(grid, wteff, wlogg, wmu, jteff, jlogg, jmu)
+    return np.exp(tmp_fl) * area * val_mu
+
+def Interp_doppler_numpy(grid, wteff, wlogg, wmu, wwav, jteff, jlogg, jmu, jwav, area, val_mu, linear=False, chunksize=2**22):
+    """
+    Numpy equivalent of Interp_doppler.
+
+    The surface elements are processed in chunks so that the temporary
+    arrays contain at most about chunksize elements.
+
+    Returns
+    -------
+    spectrum : ndarray
+        Spectrum integrated over the surface.
+    """
+    logger.log(9, "start")
+    wteff = np.atleast_1d(wteff)
+    wlogg = np.atleast_1d(wlogg)
+    wmu = np.atleast_1d(wmu)
+    wwav = np.atleast_1d(wwav)
+    jteff = np.atleast_1d(jteff)
+    jlogg = np.atleast_1d(jlogg)
+    jmu = np.atleast_1d(jmu)
+    jwav = np.atleast_1d(jwav).astype(int)
+    weight = np.atleast_1d(area * val_mu)
+    nsurf = jteff.size
+    nwav = grid.shape[-1]
+    k = np.arange(nwav)
+    fl = np.zeros(nwav, dtype=float)
+    nchunk = max(1, chunksize//nwav)
+    for i in range(0, nsurf, nchunk):
+        s = slice(i, i+nchunk)
+        ## Spectrum of each surface element, interpolated in (logtemp, logg, mu)
+        spec = Interp_3Dgrid_numpy(grid, wteff[s], wlogg[s], wmu[s], jteff[s], jlogg[s], jmu[s])
+        ## Shifted wavelength indices, saturated at the edges of the grid
+        j0wavk = jwav[s,None] + k
+        j1wavk = j0wavk + 1
+        low = j0wavk < 0
+        high = ~low * (j1wavk >= nwav)
+        j0wavk[low] = 0
+        j1wavk[low] = 0
+        j0wavk[high] = nwav-1
+        j1wavk[high] = nwav-1
+        rows = np.arange(spec.shape[0])[:,None]
+        w1wav = wwav[s,None]
+        tmp_fl = (1.-w1wav) * spec[rows,j0wavk] + w1wav * spec[rows,j1wavk]
+        if not linear:
+            tmp_fl = np.exp(tmp_fl)
+        fl += np.dot(weight[s], tmp_fl)
+    logger.log(9, "end")
+    return fl
+
+
+def Interp_doppler_binned(grid, wteff, wlogg, wmu, wwav, jteff, jlogg, jmu, jwav, area, val_mu, linear=False):
+    """
+    Velocity-binned equivalent of Interp_doppler.
+
+    Instead of interpolating and shifting a spectrum for each surface
+    element, the area-weighted contributions of the surface elements are
+    accumulated for each grid node (the 8 corners of their (logtemp, logg,
+    mu) interpolation cell) and each velocity bin of the grid's log(wav)
+    step. The spectrum is then obtained as one matrix product between these
+    velocity kernels and the spectra of the nodes, followed by a
+    shift-and-add over the occupied velocity bins. The cost therefore
+    scales with the number of distinct nodes and velocity bins rather than
+    with the number of surface elements.
+
+    The interpolation is linear in flux. For a grid of flux values (linear
+    is True) the result is the same as Interp_doppler. For a grid of
+    log(flux) values, the spectra of the nodes are exponentiated first,
+    which is the same approximation as AtmoGridSpec.To_linear.
+
+    Parameters
+    ----------
+    Same as Interp_doppler.
+
+    Returns
+    -------
+    spectrum : ndarray
+        Spectrum integrated over the surface.
+    """
+    logger.log(9, "start")
+    w1x = np.atleast_1d(wteff).astype(float)
+    w1y = np.atleast_1d(wlogg).astype(float)
+    w1z = np.atleast_1d(wmu).astype(float)
+    w1wav = np.atleast_1d(wwav).astype(float)
+    j0x = np.atleast_1d(jteff).astype(int)
+    j0y = np.atleast_1d(jlogg).astype(int)
+    j0z = np.atleast_1d(jmu).astype(int)
+    j0wav = np.atleast_1d(jwav).astype(int)
+    weight = np.atleast_1d(area * val_mu)
+    nx, ny, nz, nwav = grid.shape
+    ## Flat index and weight of the 8 corners of each surface element's cell
+    ## and of the two velocity bins it straddles
+    node = []
+    wnode = []
+    vbin = []
+    for dx, wx in ((0, 1.-w1x), (1, w1x)):
+        for dy, wy in ((0, 1.-w1y), (1, w1y)):
+            for dz, wz in ((0, 1.-w1z), (1, w1z)):
+                ind = ((j0x+dx)*ny + (j0y+dy))*nz + (j0z+dz)
+                w = wx*wy*wz*weight
+                node.extend([ind, ind])
+                wnode.extend([w*(1.-w1wav), w*w1wav])
+                vbin.extend([j0wav, j0wav+1])
+    node = np.concatenate(node)
+    wnode = np.concatenate(wnode)
+    vbin = np.concatenate(vbin)
+    ## Velocity kernel of each node, shape (nbins, nnodes)
+    unode, inode = np.unique(node, return_inverse=True)
+    ubin, ibin = np.unique(vbin, return_inverse=True)
+    kernel = np.bincount(ibin*unode.size+inode, weights=wnode, minlength=ubin.size*unode.size).reshape(ubin.size, unode.size)
+    ## Spectra of the nodes
+    spec = grid[np.unravel_index(unode, (nx, ny, nz))]
+    if not linear:
+        spec = np.exp(spec)
+    fl = Shift_and_add(np.dot(kernel, spec), ubin)
+    logger.log(9, "end")
+    return fl
+
+def Interp_doppler_pca(coeffs, basis, wteff, wlogg, wmu, wwav, jteff, jlogg, jmu, jwav, area, val_mu):
+    """
+    Equivalent of Interp_doppler for a grid compressed as coefficients on
+    a set of basis spectra (see Atmosphere.AtmoGridSpecPCA).
+
+    The coefficients are interpolated for each surface element and
+    accumulated per velocity bin of the grid's log(wav) step. The spectra
+    are only reconstructed once per occupied velocity bin, and then
+    shifted and added. The interpolation is linear in flux.
+
+    Parameters
+    ----------
+    coeffs : ndarray
+        Coefficients of the basis spectra, with dimensions
+        (logtemp, logg, mu, ncomp).
+    basis : ndarray
+        Basis spectra, with dimensions (ncomp, nwav).
+    Others are the same as Interp_doppler.
+
+    Returns
+    -------
+    spectrum : ndarray
+        Spectrum integrated over the surface.
+    """
+    logger.log(9, "start")
+    w1wav = np.atleast_1d(wwav).astype(float)
+    j0wav = np.atleast_1d(jwav).astype(int)
+    weight = np.atleast_1d(area * val_mu)
+    ## Coefficients of each surface element, shape (nsurf, ncomp)
+    c = Interp_3Dgrid_numpy(coeffs, wteff, wlogg, wmu, jteff, jlogg, jmu)
+    ## Accumulation of the coefficients in the two velocity bins each element straddles
+    ubin, ibin = np.unique(np.r_[j0wav, j0wav+1], return_inverse=True)
+    w = np.r_[weight*(1.-w1wav), weight*w1wav]
+    c = np.r_[c, c]
+    cbin = np.array([np.bincount(ibin, weights=w*ck, minlength=ubin.size) for ck in c.T]).T
+    fl = Shift_and_add(np.dot(cbin, basis), ubin)
+    logger.log(9, "end")
+    return fl
+
+def Shift_and_add(spectra, shifts):
+    """
+    Sum of spectra shifted by integer numbers of bins. The shifted
+    spectra are saturated at the edges, i.e. the output at bin k is the
+    sum of spectra[i, clip(k+shifts[i], 0, nwav-1)].
+
+    Parameters
+    ----------
+    spectra : ndarray
+        Spectra, with dimensions (nspectra, nwav).
+    shifts : ndarray
+        Shift of each spectrum, in bins.
+
+    Returns
+    -------
+    spectrum : ndarray
+        Sum of the shifted spectra.
+    """
+    nwav = spectra.shape[-1]
+    k = np.clip(np.asarray(shifts, dtype=int)[:,None] + np.arange(nwav), 0, nwav-1)
+    return spectra[np.arange(k.shape[0])[:,None], k].sum(axis=0)
@@ -65,6 +65,21 @@ def Fit_linear(y, x=None, err=1.0, m=None, b=None, output=None, inline=False):
     else:
         return (sol, res, rank, s)
 
+def Fit_sin(y, phases):
+    """
+    Fit_sin(y, phases)
+    return (b, m)
+    Closed-form least-squares solution of y = b + m*sin(2*pi*phases), i.e.
+    the same fit as Fit_linear(y, np.sin(TWOPI*phases)), without calling
+    lstsq. Works for any number of (not necessarily uniform) phases.
+    """
+    x = np.sin(cts.TWOPI*np.asarray(phases, dtype=float))
+    y = np.asarray(y, dtype=float)
+    dx = x - x.mean()
+    m = (dx*(y-y.mean())).sum() / (dx*dx).sum()
+    b = y.mean() - m*x.mean()
+    return b, m
+
 def Pprint(arr, show_index=False, max_lines=None):
     arr = np.atleast_2d(arr)
     if show_index:
@@ -92,3 +107,80 @@ def Sort_list(lst, cols):
     for keycolumn in reversed(cols):
         lst.sort(key=itemgetter(keycolumn))
     return
+
+
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+## class Cache_lru
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+class Cache_lru(object):
+    """Cache_lru(budget)
+    Least-recently-used cache storing dictionaries of values (typically
+    numpy arrays) under hashable keys, within a memory budget.
+
+    When adding an entry would exceed the budget, the least recently used
+    entries are discarded. The number of hits and misses are recorded.
+
+    budget: maximum memory size of the cached values, in bytes.
+
+    >>> cache = Cache_lru(64*2**20)
+    >>> cache.Put(key, {'rc': rc, 'area': area})
+    >>> values = cache.Get(key)
+    """
+    def __init__(self, budget):
+        from collections import OrderedDict
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def Clear(self):
+        """Clear()
+        Discard all the entries and reset the counters.
+        """
+        self._entries.clear()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def Get(self, key):
+        """Get(key)
+        Return the values stored under key, or None if there is none.
+        """
+        try:
+            values, size = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self._entries[key] = (values, size)
+        self.hits += 1
+        return values
+
+    def Put(self, key, values):
+        """Put(key, values)
+        Store the dictionary of values under key. Entries larger than the
+        budget are not stored.
+        """
+        size = sum(np.asarray(val).nbytes for val in values.values())
+        if key in self._entries:
+            self.size -= self._entries.pop(key)[1]
+        if size > self.budget:
+            return
+        while self._entries and self.size+size > self.budget:
+            self.size -= self._entries.popitem(last=False)[1][1]
+        self._entries[key] = (values, size)
+        self.size += size
+
+    @property
+    def Stats(self):
+        """Stats
+        Return a dictionary containing the number of hits, misses,
+        entries and the memory size.
+        """
+        return {'hits':self.hits, 'misses':self.misses, 'entries':len(self._entries), 'size':self.size, 'budget':self.budget}
@@ -0,0 +1,184 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+
+import time
+import functools
+import contextlib
+
+from .import_modules import *
+
+logger = logging.getLogger(__name__)
+
+
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+## Opt-in profiling of the Icarus stages.
+## Functions decorated with Profiled record their wall time and
+## number of calls, and Count records event counters (surface
+## cache hits, Newton iterations, visible faces, ...), but only
+## while a Profile context is active. Otherwise they reduce to a
+## test on the module variable _profiler.
+##
+## >>> with Icarus.profile() as p:
+## ...     fit.Calc_chi2(par)
+## >>> print(p.Report())
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+
+## The active profiler, None when profiling is disabled
+_profiler = None
+
+
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+## class Profiler
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+class Profiler(object):
+    """Profiler()
+    Accumulates the wall time and number of calls per stage, as well as
+    event counters. Usually obtained from the Profile context manager.
+
+    The total time of a stage includes that of the stages it calls,
+    whereas its own time excludes it.
+
+    >>> p = Profiler()
+    """
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self._stack = []
+        self.time = 0.
+
+    def Add(self, stage, dt):
+        """Add(stage, dt)
+        Record a call to a stage which took dt seconds.
+
+        >>> p.Add('Flux', 0.001)
+        """
+        inner = self._stack.pop() if self._stack else 0.
+        if self._stack:
+            self._stack[-1] += dt
+        entry = self.stages.get(stage)
+        if entry is None:
+            entry = self.stages[stage] = [0, 0., 0.]
+        entry[0] += 1
+        entry[1] += dt
+        entry[2] += dt - inner
+
+    def Count(self, name, n=1):
+        """Count(name, n=1)
+        Increment the counter name by n.
+
+        >>> p.Count('visible_faces', 640)
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def Report(self, sort='own'):
+        """Report(sort='own')
+        Returns a text table of the stages and counters.
+
+        sort ('own'): column by which the stages are sorted, in decreasing
+            order. Can be 'calls', 'total' or 'own'.
+
+        >>> print(p.Report())
+        """
+        col = {'calls':0, 'total':1, 'own':2}[sort]
+        lines = ["{:<40s} {:>10s} {:>12s} {:>12s} {:>12s} {:>7s}".format('stage', 'calls', 'total (s)', 'own (s)', 'per call (s)', 'own %')]
+        for stage, entry in sorted(self.stages.items(), key=lambda item: -item[1][col]):
+            lines.append( "{:<40s} {:>10d} {:>12.6f} {:>12.6f} {:>12.3e} {:>7.1f}".format(stage, entry[0], entry[1], entry[2], entry[1]/entry[0], 100*entry[2]/self.time if self.time > 0 else 0.) )
+        lines.append( "{:<40s} {:>10s} {:>12.6f}".format('(wall time)', '', self.time) )
+        if self.counters:
+            lines.append( "" )
+            lines.append( "{:<40s} {:>10s}".format('counter', 'value') )
+            for name, value in sorted(self.counters.items()):
+                lines.append( "{:<40s} {:>10}".format(name, value) )
+            for name, value in sorted(self.Derived().items()):
+                lines.append( "{:<40s} {:>10.2f}".format(name, value) )
+        return "\n".join(lines)
+
+    def Derived(self):
+        """Derived()
+        Returns the ratios derived from the counters, such as the
+        surface cache hit rate or the mean number of visible faces
+        per phase.
+
+        >>> p.Derived()
+        """
+        c = self.counters
+        derived = {}
+        ncache = c.get('surface_cache_hits', 0) + c.get('surface_cache_misses', 0)
+        if ncache > 0:
+            derived['surface_cache_hit_rate'] = c.get('surface_cache_hits', 0) / float(ncache)
+        if c.get('radius_elements', 0) > 0:
+            derived['newton_iterations_per_element'] = c.get('newton_iterations', 0) / float(c['radius_elements'])
+        if c.get('phases', 0) > 0:
+            derived['visible_faces_per_phase'] = c.get('visible_faces', 0) / float(c['phases'])
+        return derived
+
+    def Stats(self):
+        """Stats()
+        Returns the stages, counters and derived ratios as a dictionary.
+
+        >>> p.Stats()
+        """
+        stages = dict([(stage, {'calls':entry[0], 'total':entry[1], 'own':entry[2]}) for stage, entry in self.stages.items()])
+        return {'time':self.time, 'stages':stages, 'counters':dict(self.counters), 'derived':self.Derived()}
+
+
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+## Module functions
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+@contextlib.contextmanager
+def Profile():
+    """Profile()
+    Context manager enabling the profiling of the Icarus stages. It
+    yields the Profiler instance which accumulates the statistics. The
+    previously active profiler, if any, is restored on exit.
+
+    >>> with Profile() as p:
+    ...     star.Make_surface(q=10., omega=1., filling=0.9, temp=5000., tempgrav=0.08, tirr=4000., porb=7200., k1=300e3, incl=1.)
+    >>> print(p.Report())
+    """
+    global _profiler
+    previous = _profiler
+    p = Profiler()
+    _profiler = p
+    t0 = time.perf_counter()
+    try:
+        yield p
+    finally:
+        p.time += time.perf_counter() - t0
+        _profiler = previous
+
+def Profiled(stage=None):
+    """Profiled(stage=None)
+    Decorator recording the wall time and number of calls of a function
+    in the active profiler.
+
+    stage (None): name of the stage. If None, the qualified name of the
+        function is used.
+
+    >>> @Profiled()
+    ... def _Surface(self):
+    """
+    def decorator(func):
+        name = func.__qualname__ if stage is None else stage
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            p = _profiler
+            p._stack.append(0.)
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                p.Add(name, time.perf_counter()-t0)
+        return wrapper
+    return decorator
+
+def Count(name, n=1):
+    """Count(name, n=1)
+    Increment the counter name by n in the active profiler, if any.
+
+    >>> Count('surface_cache_hits')
+    """
+    if _profiler is not None:
+        _profiler.Count(name, n)
+
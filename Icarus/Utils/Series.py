@@ -4,8 +4,6 @@
 import sys
 import os
 
-import scipy.weave
-
 try:
     from numba import autojit
 except:
@@ -15,6 +13,14 @@ from .import_modules import *
 
 logger = logging.getLogger(__name__)
 
+# Try to import the weave package
+try:
+    import scipy.weave
+    _HAS_WEAVE = True
+except:
+    logger.info("The scipy.weave package cannot be imported. The axis lookups will use numpy.")
+    _HAS_WEAVE = False
+
 
 ##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
 ## Time series utilities
@@ -23,6 +29,27 @@ logger = logging.getLogger(__name__)
 ##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
 
 
+def Axis_uniform(xold, rtol=1e-6):
+    """ Axis_uniform(xold, rtol=1e-6)
+    Determines whether the values of a vector are uniformly spaced.
+
+    xold: vector of axis values (ascending or descending).
+    rtol (1e-6): relative tolerance on the spacing.
+
+    Returns (x0, dx) the first value and the spacing if the vector is
+    uniformly spaced, None otherwise.
+
+    >>> uniform = Axis_uniform(np.arange(2.0, 5.6, 0.5))
+    """
+    xold = np.asarray(xold, dtype=float)
+    n = xold.size
+    if n < 2:
+        return None
+    dx = (xold[-1]-xold[0])/(n-1)
+    if dx == 0. or not np.allclose(np.diff(xold), dx, rtol=rtol, atol=0.):
+        return None
+    return xold[0], dx
+
 def Convolve_gaussian_tophat(arr, sigma=1., top=1):
     """
     Convolve an array with a Gaussian and a tophat
@@ -133,12 +160,69 @@ def Getaxispos_scalar(xold, xnew):
     results[1] = jl;
     return_val = results;
     """
+    if not _HAS_WEAVE:
+        w,j = Getaxispos_searchsorted(xold, xnew)
+        return float(w), int(j)
     xold = np.asarray(xold)
     xnew = float(xnew)
     get_axispos = scipy.weave.inline(code, ['xold', 'xnew', 'n'], type_converters=scipy.weave.converters.blitz, compiler='gcc', verbose=2)
     w,j = get_axispos
     return w,j
 
+def Getaxispos_searchsorted(xold, xnew):
+    """ Getaxispos_searchsorted(xold, xnew)
+    Given a vector xnew, returns the indices and fractional weights
+    that corresponds to their nearest linear interpolation from
+    the vector xold.
+
+    This is the numpy equivalent of Getaxispos_vector, using a
+    binary search via np.searchsorted.
+
+    xold: vector of values to be interpolated from.
+    xnew: vector of values to be interpolated.
+
+    weights,indices = Getaxispos_searchsorted(xold, xnew)
+    """
+    xold = np.asarray(xold, dtype=float)
+    xnew = np.asarray(xnew, dtype=float)
+    n = xold.shape[0]
+    if xold[n-1] > xold[0]:
+        j = np.searchsorted(xold, xnew, side='left') - 1
+    else:
+        j = n-1 - np.searchsorted(xold[::-1], xnew, side='left')
+    j = np.clip(j, 0, n-2)
+    w = (xnew-xold[j])/(xold[j+1]-xold[j])
+    return w,j
+
+def Getaxispos_uniform(xold, xnew, x0, dx):
+    """ Getaxispos_uniform(xold, xnew, x0, dx)
+    Given a scalar or vector xnew, returns the indices and fractional
+    weights that corresponds to their nearest linear interpolation from
+    the uniformly spaced vector xold.
+
+    The indices are calculated arithmetically rather than by a search,
+    hence the lookup is O(1) per value. The weights are calculated from
+    the xold values bracketing xnew so the result is equivalent to that
+    of Getaxispos_vector.
+
+    xold: vector of uniformly spaced values to be interpolated from.
+    xnew: scalar or vector of values to be interpolated.
+    x0, dx: first value and spacing of xold (see Axis_uniform).
+
+    weights,indices = Getaxispos_uniform(xold, xnew, x0, dx)
+    """
+    xold = np.asarray(xold, dtype=float)
+    n = xold.shape[0]
+    if np.ndim(xnew) == 0:
+        j = min(max(int(np.floor((xnew-x0)/dx)), 0), n-2)
+        w = (xnew-xold[j])/(xold[j+1]-xold[j])
+        return float(w), j
+    xnew = np.asarray(xnew, dtype=float)
+    j = np.floor((xnew-x0)/dx).astype(int)
+    np.clip(j, 0, n-2, out=j)
+    w = (xnew-xold[j])/(xold[j+1]-xold[j])
+    return w,j
+
 def Getaxispos_vector(xold, xnew):
     """ Getaxispos_vector(xold, xnew)
     Given a vector xnew, returns the indices and fractional weights
@@ -150,6 +234,8 @@ def Getaxispos_vector(xold, xnew):
 
     weights,indices = Getaxispos_scalar(xold, xnew)
     """
+    if not _HAS_WEAVE:
+        return Getaxispos_searchsorted(xold, xnew)
     logger.log(5, "start")
     xold = np.ascontiguousarray(xold)
     xnew = np.ascontiguousarray(xnew)
@@ -231,6 +317,11 @@ def GPolynomial_fit(y, x=None, err=None, coeff=1, Xfnct=None, Xfnct_offset=False
         err = np.ones(n, dtype=float)*err
     if Xfnct is None:
         Xfnct = np.ones(n, dtype=float)
+    if not _HAS_WEAVE:
+        a_n, chi2_ = GPolynomial_fit_batch(y[None], x=x[None], err=err[None], coeff=coeff, Xfnct=Xfnct[None], Xfnct_offset=Xfnct_offset)
+        if chi2:
+            return a_n[0], chi2_[0]
+        return a_n[0]
     if Xfnct_offset:
         Xfnct_offset = 1
     else:
@@ -271,6 +362,100 @@ def GPolynomial_fit(y, x=None, err=None, coeff=1, Xfnct=None, Xfnct_offset=False
         return tmp[0], tmp[1][0]
     return tmp[0]
 
+def GPolynomial_fit_batch(y, x=None, err=None, coeff=1, Xfnct=None, Xfnct_offset=False, mask=None, chunksize=2**14):
+    """
+    Batched equivalent of GPolynomial_fit, fitting a set of spectra at once.
+
+    Since the basis functions are powers of x times Xfnct (or 1), the
+    normal equations of all the spectra are built from a few power sums
+    evaluated by broadcasting, without forming the design matrices, and
+    solved at once. x is rescaled to [-1,1] to keep them well conditioned.
+    Spectra of different lengths can be padded to a common length, the
+    padding being excluded with mask.
+
+    y: the y values, shape (nspec, n)
+    x (None): the x values, shape (n) or (nspec, n)
+    err (None): the error values, shape (1), (n) or (nspec, n)
+    coeff (1): the number of coefficients to the generalized polynomial
+            function to be fitted (>= 1)
+    Xfnct (None): a function to generalize the polynomial, shape (nspec, n)
+    Xfnct_offset (False): whether the polynomial includes a constant offset or not
+    mask (None): True for the valid values, shape (nspec, n)
+    chunksize (2**14): the spectra are processed in chunks of about
+            chunksize values, which keeps the temporary arrays in cache.
+
+    Returns generalized polynomial coefficients and the chi-squares
+        shapes (nspec, coeff) and (nspec)
+        i.e. (a_n, a_(n-1), ..., a_1, a_0) for each spectrum
+    """
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    nspec, n = y.shape
+    if x is None:
+        x = np.arange(n, dtype=float)
+    x = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+    if err is None:
+        err = 1.
+    if Xfnct is None:
+        Xfnct = 1.
+    w = np.broadcast_to(1./np.asarray(err, dtype=float)**2, y.shape)
+    if mask is not None:
+        w = np.where(mask, w, 0.)
+    f = np.broadcast_to(np.asarray(Xfnct, dtype=float), y.shape)
+    ## Each basis function is g*u**p, with g either Xfnct ('f') or 1 ('1'),
+    ## listed here from a_0 to a_n
+    if Xfnct_offset:
+        basis = [('1', 0)] + [('f', p) for p in range(coeff-1)]
+    else:
+        basis = [('f', p) for p in range(coeff)]
+    sol = np.empty((nspec, coeff), dtype=float)
+    chi2 = np.empty(nspec, dtype=float)
+    nchunk = max(1, chunksize//n)
+    for i in range(0, nspec, nchunk):
+        s = slice(i, i+nchunk)
+        sol[s], chi2[s] = _GPolynomial_normal(y[s], x[s], w[s], f[s], basis)
+    ## Ordered as (a_n, ..., a_0)
+    return sol[:,::-1], chi2
+
+def _GPolynomial_normal(y, x, w, f, basis):
+    """
+    Solve the normal equations of the generalized polynomial fits of
+    GPolynomial_fit_batch for a chunk of spectra, given the inverse
+    variances w. Returns the coefficients ordered as basis and the
+    chi-squares.
+    """
+    nspec, n = y.shape
+    coeff = len(basis)
+    xscale = np.abs(np.where(w > 0, x, 0.)).max(axis=1)
+    xscale[xscale == 0] = 1.
+    u = x / xscale[:,None]
+    pmax = 2*max(p for g,p in basis)
+    ## Power sums sum(weight*u**p) of the weights needed by the basis
+    ## (w*f*f, w*f*y, etc.), obtained as one batched matrix product
+    powers = np.empty((nspec, pmax+1, n), dtype=float)
+    powers[:,0] = 1.
+    for p in range(1, pmax+1):
+        np.multiply(powers[:,p-1], u, out=powers[:,p])
+    ## Each key, e.g. 'fy' for w*f*y, is the sorted pair of factors
+    fac = {'1':1., 'f':f, 'y':y}
+    keys = sorted(set([''.join(sorted(gk+gl)) for gk,pk in basis for gl,pl in basis] + [gk+'y' for gk,pk in basis]))
+    weights = np.stack([w*fac[k[0]]*fac[k[1]] for k in keys], axis=1)
+    sums = dict(zip(keys, np.matmul(weights, powers.transpose(0,2,1)).transpose(1,0,2)))
+    ata = np.empty((nspec, coeff, coeff), dtype=float)
+    atb = np.empty((nspec, coeff), dtype=float)
+    for k, (gk, pk) in enumerate(basis):
+        atb[:,k] = sums[gk+'y'][:,pk]
+        for l, (gl, pl) in enumerate(basis):
+            ata[:,k,l] = sums[''.join(sorted(gk+gl))][:,pk+pl]
+    sol = np.linalg.solve(ata, atb[...,None])[...,0]
+    ## The chi-square is computed from the residuals of the model
+    model = np.zeros_like(y)
+    for k, (gk, pk) in enumerate(basis):
+        model += sol[:,k,None] * fac[gk] * powers[:,pk]
+    chi2 = (w*(y-model)**2).sum(axis=1)
+    ## Back to the powers of x
+    sol /= xscale[:,None]**np.array([p for g,p in basis])
+    return sol, chi2
+
 def Interp_linear(y, weights, inds):
     """
     """
@@ -309,6 +494,8 @@ def Interp_linear(y, weights, inds):
     y = np.asarray(y)
     weights = np.asarray(weights)
     inds = np.asarray(inds, dtype=int)
+    if not _HAS_WEAVE:
+        return y[...,inds]*(1-weights) + y[...,inds+1]*weights
     nynew = weights.size
     if y.ndim == 1:
         ynew = np.empty(nynew, dtype=float)
@@ -1,10 +1,27 @@
 # Licensed under a 3-clause BSD style license - see LICENSE
 
 
-import scipy.weave
+import os
+import getpass
+import hashlib
+import tempfile
 
 from .import_modules import *
 
+logger = logging.getLogger(__name__)
+
+# Try to import the weave package
+try:
+    import scipy.weave
+    _HAS_WEAVE = True
+except:
+    logger.info("The scipy.weave package cannot be imported. The tessellation utilities will use numpy.")
+    _HAS_WEAVE = False
+
+## Geodesic primitives and subsampling maps already loaded in the process
+_geodesic_cache = {}
+_subsampling_cache = {}
+
 
 ##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
 ## Tessellation utilities
@@ -14,264 +31,96 @@ from .import_modules import *
 ##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
 
 
-def Make_geodesic(n):
-    """ Make_geodesic(n)
+def Make_geodesic(n, parents=False):
+    """ Make_geodesic(n, parents=False)
     Makes the primitives of a geodesic surface based on an
     isocahedron which is subdivided n times in smaller triangles.
     Return the number of vertices, surfaces, associations and
     their related vectors.
 
-    n: integer number of subdivisions (can be zero)
+    Each subdivision splits every triangle (a, b, c) into 4 smaller
+    ones (a, ab, ca), (ca, ab, bc), (ca, bc, c), (ab, b, bc), where
+    ab, bc, ca are the midpoints of the edges projected on the unit
+    sphere. The midpoints are shared by the two triangles of an edge:
+    they are deduplicated by hashing the pair of vertex indices of the
+    edge. New vertices are numbered by order of first appearance.
 
-    >>> n_faces, n_vertices, myfaces, myvertices, myassoc = Make_geodesic(n)
-    """
-    support_code = """
-    static int n_vertices;
-    static int n_faces;
-    static int n_edges;
-    static float *vertices = NULL;
-    static int *faces = NULL;
-    static int *assoc = NULL;
-
-    static int edge_walk;
-    static int *start = NULL;
-    static int *end = NULL;
-    static int *midpoint = NULL;
-
-    static void
-    init_icosahedron (void)
-    {
-        float t = (1+sqrt(5))/2;
-        float tau = t/sqrt(1+t*t);
-        float one = 1/sqrt(1+t*t);
-
-        float icosahedron_vertices[] =
-        {tau, one, 0.0,
-        -tau, one, 0.0,
-        -tau, -one, 0.0,
-        tau, -one, 0.0,
-        one, 0.0 ,  tau,
-        one, 0.0 , -tau,
-        -one, 0.0 , -tau,
-        -one, 0.0 , tau,
-        0.0 , tau, one,
-        0.0 , -tau, one,
-        0.0 , -tau, -one,
-        0.0 , tau, -one};
-
-        int icosahedron_faces[] =
-        {4, 8, 7,
-        4, 7, 9,
-        5, 6, 11,
-        5, 10, 6,
-        0, 4, 3,
-        0, 3, 5,
-        2, 7, 1,
-        2, 1, 6,
-        8, 0, 11,
-        8, 11, 1,
-        9, 10, 3,
-        9, 2, 10,
-        8, 4, 0,
-        11, 0, 5,
-        4, 9, 3,
-        5, 3, 10,
-        7, 8, 1,
-        6, 1, 11,
-        7, 2, 9,
-        6, 10, 2};
-
-        n_vertices = 12;
-        n_faces = 20;
-        n_edges = 30;
-
-        vertices = (float*)malloc(3*n_vertices*sizeof(float));
-        faces = (int*)malloc(3*n_faces*sizeof(int));
-        memcpy ((void*)vertices, (void*)icosahedron_vertices, 3*n_vertices*sizeof(float));
-        memcpy ((void*)faces, (void*)icosahedron_faces, 3*n_faces*sizeof(int));
-    }
-
-    static int
-    search_midpoint (int index_start, int index_end)
-    {
-        int i;
-        for (i=0; i<edge_walk; i++)
-            if ((start[i] == index_start && end[i] == index_end) ||
-	        (start[i] == index_end && end[i] == index_start))
-                {
-	            int res = midpoint[i];
-
-	            /* update the arrays */
-	            start[i]    = start[edge_walk-1];
-	            end[i]      = end[edge_walk-1];
-	            midpoint[i] = midpoint[edge_walk-1];
-	            edge_walk--;
-
-	            return res;
-                }
+    Because the children of face i are faces 4*i to 4*i+3, the face of
+    a coarser tessellation (m < n subdivisions) containing face k is
+    simply k // 4**(n-m). See Parent_faces.
 
-            /* vertex not in the list, so we add it */
-            start[edge_walk] = index_start;
-            end[edge_walk] = index_end;
-            midpoint[edge_walk] = n_vertices;
-
-            /* create new vertex */
-            vertices[3*n_vertices]   = (vertices[3*index_start] + vertices[3*index_end]) / 2.0;
-            vertices[3*n_vertices+1] = (vertices[3*index_start+1] + vertices[3*index_end+1]) / 2.0;
-            vertices[3*n_vertices+2] = (vertices[3*index_start+2] + vertices[3*index_end+2]) / 2.0;
-
-            /* normalize the new vertex */
-            float length = sqrt (vertices[3*n_vertices] * vertices[3*n_vertices] +
-        		       vertices[3*n_vertices+1] * vertices[3*n_vertices+1] +
-        		       vertices[3*n_vertices+2] * vertices[3*n_vertices+2]);
-            length = 1/length;
-            vertices[3*n_vertices] *= length;
-            vertices[3*n_vertices+1] *= length;
-            vertices[3*n_vertices+2] *= length;
-
-            n_vertices++;
-            edge_walk++;
-            return midpoint[edge_walk-1];
-    }
+    n: integer number of subdivisions (can be zero). Note that the
+        precalculated 'geodesic_n{ndiv}.txt' files have n = ndiv-1.
+    parents (False): if True, also returns the index of the parent face
+        (in the n-1 tessellation) of each face.
 
-    static void
-    subdivide (void)
-    {
-        int n_vertices_new = n_vertices+2*n_edges;
-        int n_faces_new = 4*n_faces;
-        int i;
-
-        edge_walk = 0;
-        n_edges = 2*n_vertices + 3*n_faces;
-        start = (int*)malloc(n_edges*sizeof (int));
-        end = (int*)malloc(n_edges*sizeof (int));
-        midpoint = (int*)malloc(n_edges*sizeof (int));
-
-        int *faces_old = (int*)malloc (3*n_faces*sizeof(int));
-        faces_old = (int*)memcpy((void*)faces_old, (void*)faces, 3*n_faces*sizeof(int));
-        vertices = (float*)realloc ((void*)vertices, 3*n_vertices_new*sizeof(float));
-        faces = (int*)realloc ((void*)faces, 3*n_faces_new*sizeof(int));
-        n_faces_new = 0;
-
-        for (i=0; i<n_faces; i++)
-        {
-            int a = faces_old[3*i];
-            int b = faces_old[3*i+1];
-            int c = faces_old[3*i+2];
-
-            int ab_midpoint = search_midpoint (b, a);
-            int bc_midpoint = search_midpoint (c, b);
-            int ca_midpoint = search_midpoint (a, c);
-
-            faces[3*n_faces_new] = a;
-            faces[3*n_faces_new+1] = ab_midpoint;
-            faces[3*n_faces_new+2] = ca_midpoint;
-            n_faces_new++;
-            faces[3*n_faces_new] = ca_midpoint;
-            faces[3*n_faces_new+1] = ab_midpoint;
-            faces[3*n_faces_new+2] = bc_midpoint;
-            n_faces_new++;
-            faces[3*n_faces_new] = ca_midpoint;
-            faces[3*n_faces_new+1] = bc_midpoint;
-            faces[3*n_faces_new+2] = c;
-            n_faces_new++;
-            faces[3*n_faces_new] = ab_midpoint;
-            faces[3*n_faces_new+1] = b;
-            faces[3*n_faces_new+2] = bc_midpoint;
-            n_faces_new++;
-        }
-        n_faces = n_faces_new;
-        free (start);
-        free (end);
-        free (midpoint);
-        free (faces_old);
-    }
-
-    static void
-    associativity (void)
-    {
-        //printf ("associativity 2\\n");
-        int i;
-
-        assoc = (int*)malloc(6*n_vertices*sizeof(int));
-
-        for (int v=0; v<n_vertices; v++)
-        {
-            i = 0;
-            for (int f=0; f<n_faces; f++)
-            {
-                if ((faces[3*f] == v) || (faces[3*f+1] == v) || (faces[3*f+2] == v)) {
-                    assoc[6*v+i] = f;
-                    i += 1;
-                }
-            }
-            if (i==5) {
-                assoc[6*v+i] = -99;
-                i = 6;
-            }
-        }
-    }
-
-    static void
-    isocahedron (int n_subdivisions)
-    {
-        int i;
-
-        init_icosahedron ();
-
-        for (i=0; i<n_subdivisions; i++)
-            subdivide ();
-
-        associativity ();
-    }
-
-    static void
-    free_memory ()
-    {
-        if (vertices) free (vertices);
-        if (faces) free (faces);
-        if (assoc) free (assoc);
-    }
+    >>> n_faces, n_vertices, myfaces, myvertices, myassoc = Make_geodesic(n)
+    >>> n_faces, n_vertices, myfaces, myvertices, myassoc, myparents = Make_geodesic(n, parents=True)
     """
+    t = (1+np.sqrt(5))/2
+    tau = t/np.sqrt(1+t*t)
+    one = 1/np.sqrt(1+t*t)
+    vertices = np.array([
+        [tau, one, 0.0],
+        [-tau, one, 0.0],
+        [-tau, -one, 0.0],
+        [tau, -one, 0.0],
+        [one, 0.0 ,  tau],
+        [one, 0.0 , -tau],
+        [-one, 0.0 , -tau],
+        [-one, 0.0 , tau],
+        [0.0 , tau, one],
+        [0.0 , -tau, one],
+        [0.0 , -tau, -one],
+        [0.0 , tau, -one]])
+    faces = np.array([
+        [4, 8, 7],
+        [4, 7, 9],
+        [5, 6, 11],
+        [5, 10, 6],
+        [0, 4, 3],
+        [0, 3, 5],
+        [2, 7, 1],
+        [2, 1, 6],
+        [8, 0, 11],
+        [8, 11, 1],
+        [9, 10, 3],
+        [9, 2, 10],
+        [8, 4, 0],
+        [11, 0, 5],
+        [4, 9, 3],
+        [5, 3, 10],
+        [7, 8, 1],
+        [6, 1, 11],
+        [7, 2, 9],
+        [6, 10, 2]])
+
+    for i in range(n):
+        n_vertices = vertices.shape[0]
+        a, b, c = faces.T
+        ## Edges in the order ab, bc, ca for each face. shape = n_faces*3,2
+        edges = np.c_[b, a, c, b, a, c].reshape(-1,2)
+        key = edges.min(axis=1).astype(np.int64)*n_vertices + edges.max(axis=1)
+        ukey, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+        ## Number the new vertices by order of first appearance
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(order.size)
+        midpoint = (n_vertices + rank[inverse.ravel()]).reshape(-1,3)
+        ## Create the new vertices and project them on the unit sphere
+        ends = edges[first[order]]
+        new_vertices = (vertices[ends[:,0]] + vertices[ends[:,1]]) / 2.0
+        new_vertices /= np.sqrt((new_vertices**2).sum(axis=1))[:,None]
+        vertices = np.r_[vertices, new_vertices]
+        ab, bc, ca = midpoint.T
+        faces = np.c_[a, ab, ca, ca, ab, bc, ca, bc, c, ab, b, bc].reshape(-1,3)
 
-    code = """
-    isocahedron(n);
-
-    //printf ( "\\nisocahedron 1 \\n" );
-    //printf ( "long %zu\\n", sizeof(long) );
-    //printf ( "myfaces %zu\\n", sizeof(myfaces(0,0)) );
-    //printf ( "faces %zu\\n", sizeof(faces[0]) );
-    //printf ( "myvertices %zu\\n", sizeof(myvertices(0,0)) );
-    //printf ( "vertices %zu\\n", sizeof(vertices[0]) );
-
-    for (int i=0; i<n_faces; i++) {
-        myfaces(i,0) = faces[3*i];
-        myfaces(i,1) = faces[3*i+1];
-        myfaces(i,2) = faces[3*i+2];
-    }
-
-    for (int i=0; i<n_vertices; i++) {
-        myvertices(i,0) = vertices[3*i];
-        myvertices(i,1) = vertices[3*i+1];
-        myvertices(i,2) = vertices[3*i+2];
-
-        myassoc(i,0) = assoc[6*i];
-        myassoc(i,1) = assoc[6*i+1];
-        myassoc(i,2) = assoc[6*i+2];
-        myassoc(i,3) = assoc[6*i+3];
-        myassoc(i,4) = assoc[6*i+4];
-        myassoc(i,5) = assoc[6*i+5];
-    }
-
-    free_memory();
-    """
-    n_faces = 20 * 4**n
-    myfaces = np.empty((n_faces,3), dtype=np.int)
-    n_vertices = 2 + 10 * 4**n
-    myvertices = np.empty((n_vertices,3), dtype=np.float)
-    myassoc = np.empty((n_vertices,6), dtype=np.int)
-    get_axispos = scipy.weave.inline(code, ['n','myfaces','myvertices','myassoc'], type_converters=scipy.weave.converters.blitz, compiler='gcc', libraries=['m'], verbose=2, support_code=support_code, force=0)
-    return n_faces, n_vertices, myfaces, myvertices, myassoc
+    n_faces = faces.shape[0]
+    n_vertices = vertices.shape[0]
+    assoc = Match_assoc(faces, n_vertices)
+    if parents:
+        return n_faces, n_vertices, faces, vertices, assoc, np.arange(n_faces) // 4
+    return n_faces, n_vertices, faces, vertices, assoc
 
 def Match_assoc(faces, n_vertices):
     """
@@ -296,11 +145,49 @@ def Match_assoc(faces, n_vertices):
         }
     }
     """
+    if not _HAS_WEAVE:
+        return Match_assoc_numpy(faces, n_vertices)
     n_faces = faces.shape[0]
     assoc = -99 * np.ones((n_vertices,6), dtype=np.int)
     get_assoc = scipy.weave.inline(code, ['n_faces','faces','assoc'], type_converters=scipy.weave.converters.blitz, compiler='gcc', libraries=['m'], verbose=2, force=0)
     return assoc
 
+def Match_assoc_numpy(faces, n_vertices):
+    """
+    Match_assoc_numpy(faces, n_vertices)
+
+    Same as Match_assoc, but vectorized using numpy. The faces
+    associated with a vertice are listed in increasing order.
+
+    >>> assoc = Match_assoc_numpy(faces, n_vertices)
+    """
+    vert = np.asarray(faces).ravel()
+    face = np.repeat(np.arange(faces.shape[0]), 3)
+    inds = np.argsort(vert, kind='mergesort')
+    vert = vert[inds]
+    face = face[inds]
+    counts = np.bincount(vert, minlength=n_vertices)
+    if counts.max() > 6:
+        raise Exception("Some vertices are associated with more than 6 faces.")
+    start = np.r_[0, np.cumsum(counts)[:-1]]
+    pos = np.arange(vert.size) - start[vert]
+    assoc = -99 * np.ones((n_vertices,6), dtype=int)
+    assoc[vert,pos] = face
+    return assoc
+
+def Parent_faces(n_high, n_low):
+    """Parent_faces(n_high, n_low)
+
+    Returns the index of the face of the n_low subdivisions tessellation
+    containing each face of the n_high subdivisions tessellation, for
+    the tessellations generated by Make_geodesic.
+
+    >>> ind = Parent_faces(7, 4)
+    """
+    if n_low > n_high:
+        raise ValueError("n_low must be smaller or equal to n_high.")
+    return np.arange(20 * 4**n_high) // 4**(n_high-n_low)
+
 def Match_triangles(high_x, high_y, high_z, low_x, low_y, low_z):
     """Match_triangles(high_x, high_y, high_z, low_x, low_y, low_z)
 
@@ -311,30 +198,28 @@ def Match_triangles(high_x, high_y, high_z, low_x, low_y, low_z):
     resolution one.
 
     Returns the list of low resolution face indices associated with each
-    high resolution one.
+    high resolution one, i.e. the one whose center has the largest dot
+    product with the center of the high resolution face.
+
+    The candidates are found using a KD-tree of the (normalized) low
+    resolution face centers, so that only a few dot products are evaluated
+    for each high resolution face.
+
+    For tessellations generated by Make_geodesic, the association follows
+    from the subdivision and Parent_faces should be used instead.
 
     >>> ind = Match_triangles(high_x, high_y, high_z, low_x, low_y, low_z)
     >>> n_lowres = ind.shape
     """
-    code = """
-    double dot, new_dot;
-
-    for (int i=0; i<n_highres; i++) {
-        dot = 0.;
-        new_dot = 0.;
-        for (int j=0; j<n_lowres; j++) {
-            new_dot = high_x(i)*low_x(j) + high_y(i)*low_y(j) + high_z(i)*low_z(j);
-            if (new_dot > dot) {
-                dot = new_dot;
-                ind(i) = j;
-            }
-        }
-    }
-    """
-    n_highres = high_x.size
-    n_lowres = low_x.size
-    ind = np.zeros(n_highres, dtype='int')
-    get_assoc = scipy.weave.inline(code, ['n_highres','n_lowres','ind', 'high_x', 'low_x', 'high_y', 'low_y', 'high_z', 'low_z'], type_converters=scipy.weave.converters.blitz, compiler='gcc', libraries=['m'], verbose=2, force=0)
+    import scipy.spatial
+    low = np.c_[low_x, low_y, low_z]
+    high = np.c_[high_x, high_y, high_z]
+    k = min(8, low.shape[0])
+    tree = scipy.spatial.cKDTree(low / np.sqrt((low**2).sum(axis=1))[:,None])
+    dist, cand = tree.query(high / np.sqrt((high**2).sum(axis=1))[:,None], k=k)
+    cand = cand.reshape(high.shape[0], k)
+    dot = (low[cand] * high[:,None,:]).sum(axis=2)
+    ind = cand[np.arange(high.shape[0]), dot.argmax(axis=1)]
     return ind
 
 def Match_subtriangles(inds_highres, inds_lowres):
@@ -347,16 +232,233 @@ def Match_subtriangles(inds_highres, inds_lowres):
     >>> ind = Match_subtriangles(inds_highres, inds_lowres)
     >>> inds_highres.shape = ind.shape
     """
-    code = """
-    int tmp_ind;
+    return np.asarray(inds_lowres)[inds_highres]
 
-    for (int i=0; i<n_highres; i++) {
-        tmp_ind = inds_highres(i);
-        ind(i) = inds_lowres(tmp_ind);
-    }
+def Mirror_symmetry(x, y, z, tol=1e-8):
+    """ Mirror_symmetry(x, y, z, tol=1e-8)
+    Identifies the mirror images, under y -> -y and z -> -z, of a set
+    of points on the unit sphere (e.g. the vertices or the face centers
+    of a geodesic surface).
+
+    Returns (unique, src, sy, sz), where unique are the indices of one
+    representative point per group of mirror images (the one having the
+    smallest index) and unique[src] is the representative of each point.
+    sy and sz are the signs (1. or -1.) of the reflections mapping the
+    representative onto each point, such that a quantity q which is odd
+    in y is recovered as q[unique][src]*sy.
+
+    Returns None if the points are not mirror symmetric within tol.
+
+    x, y, z: coordinates of the points.
+    tol (1e-8): maximum distance between a reflected point and its
+        mirror image.
+
+    >>> unique, src, sy, sz = Mirror_symmetry(cosx, cosy, cosz)
     """
-    n_highres = inds_highres.size
-    n_lowres = inds_lowres.size
-    ind = np.zeros(n_highres, dtype='int')
-    get_assoc = scipy.weave.inline(code, ['n_highres','n_lowres','ind', 'inds_highres', 'inds_lowres'], type_converters=scipy.weave.converters.blitz, compiler='gcc', libraries=['m'], verbose=2, force=0)
+    import scipy.spatial
+    p = np.c_[x, y, z]
+    tree = scipy.spatial.cKDTree(p)
+    dist_y, my = tree.query(p * [1.,-1.,1.])
+    dist_z, mz = tree.query(p * [1.,1.,-1.])
+    if dist_y.max() > tol or dist_z.max() > tol:
+        return None
+    ind = np.arange(p.shape[0])
+    if np.any(my[my] != ind) or np.any(mz[mz] != ind) or np.any(mz[my] != my[mz]):
+        return None
+    ## The 4 mirror images of each point and their signs (sy, sz)
+    images = np.c_[ind, my, mz, mz[my]]
+    signs = np.array([[1.,1.], [-1.,1.], [1.,-1.], [-1.,-1.]])
+    rep = images.min(axis=1)
+    ## Reflection mapping the representative onto each point
+    which = (images[rep] == ind[:,None]).argmax(axis=1)
+    unique, src = np.unique(rep, return_inverse=True)
+    return unique, src, signs[which,0], signs[which,1]
+
+def Pre_area(vertices, faces):
+    """ Pre_area(vertices, faces)
+    Returns the area of the triangular faces. The calculation is
+    simply the Pythagorean sum of the areas of the respective
+    projections on the x,y,z planes.
+
+    vertices: x,y,z coordinates of the vertices. shape = n_vertices,3
+    faces: indices of vertices forming faces. shape = n_faces,3
+
+    >>> pre_area = Pre_area(vertices, faces)
+    """
+    mesh = vertices[faces]
+    return 0.5 *np.sqrt( ((mesh[:,0,0]*mesh[:,1,1]+mesh[:,1,0]*mesh[:,2,1]+mesh[:,2,0]*mesh[:,0,1]) - (mesh[:,0,1]*mesh[:,1,0]+mesh[:,1,1]*mesh[:,2,0]+mesh[:,2,1]*mesh[:,0,0]))**2 + ((mesh[:,0,1]*mesh[:,1,2]+mesh[:,1,1]*mesh[:,2,2]+mesh[:,2,1]*mesh[:,0,2]) - (mesh[:,0,2]*mesh[:,1,1]+mesh[:,1,2]*mesh[:,2,1]+mesh[:,2,2]*mesh[:,0,1]))**2 + ((mesh[:,0,2]*mesh[:,1,0]+mesh[:,1,2]*mesh[:,2,0]+mesh[:,2,2]*mesh[:,0,0]) - (mesh[:,0,0]*mesh[:,1,2]+mesh[:,1,0]*mesh[:,2,2]+mesh[:,2,0]*mesh[:,0,2]))**2 )
+
+def Read_geodesic(ndiv, path=None):
+    """ Read_geodesic(ndiv, path=None)
+    Returns the precalculated primitives of the geodesic surface
+    having ndiv subdivisions: n_vertices, n_faces, n_edges, vertices,
+    faces, assoc, pre_area and the cosx, cosy, cosz of the face centers,
+    as well as the mirror_faces and mirror_vertices symmetry maps (see
+    Mirror_symmetry).
+
+    The text file 'geodesic_n{ndiv}.txt' is parsed only once. The
+    primitives are then saved in a binary cache 'geodesic_n{ndiv}.npz'
+    next to it (or in the temporary directory if the former is not
+    writable), which is used as long as it is newer than the text file.
+    Within a process, the primitives are loaded once and the same
+    read-only arrays are shared by all the callers.
+
+    ndiv: number of subdivisions of the geodesic surface.
+    path (None): directory containing the geodesic files. Defaults
+        to the 'geodesic' directory of the package.
+
+    >>> prim = Read_geodesic(5)
+    >>> vertices, faces = prim['vertices'], prim['faces']
+    """
+    if path is None:
+        path = _Geodesic_path()
+    fln = os.path.join(path, 'geodesic_n%i.txt' %ndiv)
+    key = (fln, ndiv)
+    if key in _geodesic_cache:
+        return _geodesic_cache[key]
+
+    prim = _Load_cache(fln, 'geodesic_n%i.npz' %ndiv)
+    if prim is None:
+        with open(fln, 'r') as f:
+            lines = f.readlines()
+        header = lines[0].split()
+        n_vertices, n_faces, n_edges = int(header[1]), int(header[2]), int(header[3])
+        # Vertice information contains coordinate x,y,z of vertices. shape = n_vertices,3
+        vertices = np.array(' '.join(lines[1:1+n_vertices]).split(), dtype=float).reshape(n_vertices,3)
+        # Face information contains indices of vertices forming faces. shape = n_faces,3
+        faces = np.array(' '.join(lines[1+n_vertices:1+n_vertices+n_faces]).split(), dtype=int).reshape(n_faces,4)[:,1:]
+        prim = {'n_vertices':np.array(n_vertices), 'n_faces':np.array(n_faces), 'n_edges':np.array(n_edges), 'vertices':vertices, 'faces':faces}
+        prim['assoc'] = Match_assoc(faces, n_vertices)
+        prim['pre_area'] = Pre_area(vertices, faces)
+        # The cosine of x,y,z for the center of the faces. shape = n_faces
+        prim['cosx'], prim['cosy'], prim['cosz'] = [np.ascontiguousarray(c) for c in vertices[faces].mean(axis=1).T]
+        _Save_cache(fln, 'geodesic_n%i.npz' %ndiv, prim)
+
+    for k in ['n_vertices', 'n_faces', 'n_edges']:
+        prim[k] = int(prim[k])
+    for k in ['vertices', 'faces', 'assoc', 'pre_area', 'cosx', 'cosy', 'cosz']:
+        prim[k].flags.writeable = False
+    prim['mirror_faces'] = Mirror_symmetry(prim['cosx'], prim['cosy'], prim['cosz'])
+    prim['mirror_vertices'] = Mirror_symmetry(prim['vertices'][:,0], prim['vertices'][:,1], prim['vertices'][:,2])
+    _geodesic_cache[key] = prim
+    return prim
+
+def Read_subsampling(ndiv_low, ndiv_high, path=None):
+    """ Read_subsampling(ndiv_low, ndiv_high, path=None)
+    Returns the index of the face of the ndiv_low geodesic surface
+    associated with each face of the ndiv_high one, for the
+    precalculated geodesic primitives (see Read_geodesic).
+
+    The map is read from 'ind_subsampling_n{ndiv_low}_n{ndiv_high}.txt'
+    if it exists, otherwise it is calculated with Match_triangles by
+    going through the intermediate resolutions. It is then saved in a
+    binary cache next to the geodesic files (or in the temporary
+    directory if the former is not writable) and shared read-only
+    within the process.
+
+    ndiv_low: number of subdivisions of the low resolution surface.
+    ndiv_high: number of subdivisions of the high resolution surface.
+    path (None): directory containing the geodesic files. Defaults
+        to the 'geodesic' directory of the package.
+
+    >>> ind = Read_subsampling(5, 7)
+    """
+    if path is None:
+        path = _Geodesic_path()
+    fln = os.path.join(path, 'ind_subsampling_n%i_n%i.txt' %(ndiv_low, ndiv_high))
+    key = (fln, ndiv_low, ndiv_high)
+    if key in _subsampling_cache:
+        return _subsampling_cache[key]
+
+    name = 'ind_subsampling_n%i_n%i.npz' %(ndiv_low, ndiv_high)
+    if os.path.isfile(fln):
+        res = _Load_cache(fln, name)
+        if res is None:
+            res = {'ind': np.loadtxt(fln, dtype='int')}
+            _Save_cache(fln, name, res)
+    else:
+        fln_high = os.path.join(path, 'geodesic_n%i.txt' %ndiv_high)
+        res = _Load_cache(fln_high, name)
+        if res is None:
+            logger.info("Calculating the subsampling from n{} to n{}".format(ndiv_low, ndiv_high))
+            ind = None
+            for n in range(ndiv_high, ndiv_low, -1):
+                high = Read_geodesic(n, path=path)
+                low = Read_geodesic(n-1, path=path)
+                tmp = Match_triangles(high['cosx'], high['cosy'], high['cosz'], low['cosx'], low['cosy'], low['cosz'])
+                ind = tmp if ind is None else Match_subtriangles(ind, tmp)
+            res = {'ind': ind}
+            _Save_cache(fln_high, name, res)
+    ind = res['ind']
+    ind.flags.writeable = False
+    _subsampling_cache[key] = ind
     return ind
+
+def _Geodesic_path():
+    """ _Geodesic_path()
+    Returns the directory containing the geodesic files of the package.
+    """
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'geodesic')
+
+def _Cache_paths(fln_src, name):
+    """ _Cache_paths(fln_src, name)
+    Returns the candidate filenames of the binary cache 'name' of
+    fln_src: next to fln_src, and in a per-user directory of the
+    temporary directory. The latter is suffixed with a hash of the
+    path of fln_src so that different installations do not collide.
+    """
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = 'unknown'
+    tag = hashlib.sha1(os.path.abspath(fln_src).encode('utf-8')).hexdigest()[:12]
+    root, ext = os.path.splitext(name)
+    return [os.path.join(os.path.dirname(fln_src), name), os.path.join(tempfile.gettempdir(), 'icarus-{}'.format(user), '{}_{}{}'.format(root, tag, ext))]
+
+def _Load_cache(fln_src, name):
+    """ _Load_cache(fln_src, name)
+    Returns the dictionary of arrays stored in the binary cache 'name',
+    located in the directory of fln_src or in the temporary directory
+    (see _Cache_paths), provided that it is newer than fln_src. Returns
+    None otherwise.
+    """
+    mtime = os.path.getmtime(fln_src)
+    for fln_npz in _Cache_paths(fln_src, name):
+        if os.path.isfile(fln_npz) and os.path.getmtime(fln_npz) >= mtime:
+            try:
+                with np.load(fln_npz) as f:
+                    res = dict([(k, f[k]) for k in f.files])
+                logger.debug("Loaded the cache {}".format(fln_npz))
+                return res
+            except Exception as e:
+                logger.warning("Cannot read the cache {} ({}).".format(fln_npz, e))
+    return None
+
+def _Save_cache(fln_src, name, res):
+    """ _Save_cache(fln_src, name, res)
+    Saves the dictionary of arrays in the binary cache 'name', in the
+    directory of fln_src or, if it is not writable, in the temporary
+    directory (see _Cache_paths).
+
+    The cache is written to a temporary file which is then renamed, so
+    that concurrent processes never read a partially written cache.
+    """
+    for fln_npz in _Cache_paths(fln_src, name):
+        fln_tmp = None
+        try:
+            cache_path = os.path.dirname(fln_npz)
+            if not os.path.isdir(cache_path):
+                os.makedirs(cache_path, mode=0o700)
+            with tempfile.NamedTemporaryFile(dir=cache_path, prefix='.'+os.path.basename(fln_npz), suffix='.tmp', delete=False) as f:
+                fln_tmp = f.name
+                np.savez(f, **res)
+            # NamedTemporaryFile is only readable by its owner
+            os.chmod(fln_tmp, 0o644)
+            os.replace(fln_tmp, fln_npz)
+            logger.info("Saved the cache {}".format(fln_npz))
+            return
+        except (IOError, OSError):
+            if fln_tmp is not None and os.path.exists(fln_tmp):
+                os.remove(fln_tmp)
+            continue
+    return
@@ -0,0 +1,146 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+
+import json
+import time
+import contextlib
+
+from .import_modules import *
+
+logger = logging.getLogger(__name__)
+
+
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+## Opt-in structured tracing of the intermediate arrays.
+## Record stores a summary (shape, min, max, mean, number of
+## NaNs) of the arrays passed to it, but only while a Trace
+## context is active. Otherwise it returns immediately, without
+## evaluating any reduction or formatting any string.
+##
+## >>> with Icarus.trace() as t:
+## ...     fit.Calc_chi2(par)
+## >>> t.Write('trace.json')
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+
+## The active tracer, None when tracing is disabled
+_tracer = None
+
+
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+## class Tracer
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+class Tracer(object):
+    """Tracer(stages=None, maxrecords=100000)
+    Accumulates the records of the traced stages. Usually obtained
+    from the Trace context manager.
+
+    stages (None): list of the stage names to record. All if None.
+    maxrecords (100000): maximum number of records kept. Once reached,
+        further records are counted in self.dropped but discarded.
+
+    >>> t = Tracer()
+    """
+    def __init__(self, stages=None, maxrecords=100000):
+        self.stages = None if stages is None else set(stages)
+        self.maxrecords = maxrecords
+        self.records = []
+        self.dropped = 0
+        self._t0 = time.perf_counter()
+
+    def Record(self, stage, values):
+        """Record(stage, values)
+        Record the summary of the values (dictionary of name: array or
+        scalar) of a stage.
+
+        >>> t.Record('Star_base.Flux_doppler', {'mu':mu})
+        """
+        if self.stages is not None and stage not in self.stages:
+            return
+        if len(self.records) >= self.maxrecords:
+            self.dropped += 1
+            return
+        record = {'stage':stage, 'time':time.perf_counter()-self._t0}
+        record['values'] = dict([(name, Summary(value)) for name, value in values.items()])
+        self.records.append(record)
+
+    def To_json(self, **kwargs):
+        """To_json(**kwargs)
+        Returns the records as a JSON string. The keyword arguments are
+        passed to json.dumps.
+
+        >>> s = t.To_json(indent=1)
+        """
+        return json.dumps({'records':self.records, 'dropped':self.dropped}, **kwargs)
+
+    def Write(self, fln, **kwargs):
+        """Write(fln, **kwargs)
+        Writes the records to a JSON file. The keyword arguments are
+        passed to json.dump.
+
+        >>> t.Write('trace.json')
+        """
+        with open(fln, 'w') as f:
+            json.dump({'records':self.records, 'dropped':self.dropped}, f, **kwargs)
+
+
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+## Module functions
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+def Record(stage, **values):
+    """Record(stage, **values)
+    Record the summary of the values of a stage in the active tracer,
+    if any.
+
+    >>> Record('AtmoGridSpec.Get_flux_doppler', w1mu=w1mu, jmu=jmu)
+    """
+    if _tracer is not None:
+        _tracer.Record(stage, values)
+
+def Summary(value):
+    """Summary(value)
+    Returns a JSON serialisable summary of a value. Arrays are
+    summarised by their shape, dtype, min, max, mean and number of
+    NaNs (the statistics exclude the NaNs); scalars are returned as is.
+
+    >>> Summary(np.arange(4.))
+    {'shape': [4], 'dtype': 'float64', 'min': 0.0, 'max': 3.0, 'mean': 1.5, 'nan': 0}
+    """
+    if np.isscalar(value) or value is None:
+        return value.item() if isinstance(value, np.generic) else value
+    value = np.asarray(value)
+    summary = {'shape':list(value.shape), 'dtype':str(value.dtype)}
+    if value.dtype.kind in 'biuf' and value.size > 0:
+        if value.dtype.kind == 'f':
+            nan = np.isnan(value)
+            summary['nan'] = int(nan.sum())
+            value = value[~nan] if summary['nan'] > 0 else value
+        else:
+            summary['nan'] = 0
+        if value.size > 0:
+            summary['min'] = value.min().item()
+            summary['max'] = value.max().item()
+            summary['mean'] = float(value.mean())
+    return summary
+
+@contextlib.contextmanager
+def Trace(stages=None, maxrecords=100000):
+    """Trace(stages=None, maxrecords=100000)
+    Context manager enabling the tracing of the Icarus stages. It
+    yields the Tracer instance which accumulates the records. The
+    previously active tracer, if any, is restored on exit.
+
+    stages (None): list of the stage names to record. All if None.
+    maxrecords (100000): maximum number of records kept.
+
+    >>> with Trace(stages=['Star_base.Flux_doppler']) as t:
+    ...     star.Flux_doppler(0.25, atmo_grid=atmo)
+    >>> print(t.To_json(indent=1))
+    """
+    global _tracer
+    previous = _tracer
+    t = Tracer(stages=stages, maxrecords=maxrecords)
+    _tracer = t
+    try:
+        yield t
+    finally:
+        _tracer = previous
+
@@ -6,8 +6,10 @@ __all__ = ["Binary",
             "Flux",
             "Grid",
             "Misc",
+            "Profiler",
             "Series",
             "Spherical_harmonics",
-            "Tessellation"]
+            "Tessellation",
+            "Tracer"]
 
 from . import *
@@ -8,6 +8,11 @@ from . import Photometry
 from . import Spectroscopy
 from . import Utils
 
+## Opt-in profiling of the stages, e.g. "with Icarus.profile() as p:"
+profile = Utils.Profiler.Profile
+## Opt-in tracing of the intermediate arrays, e.g. "with Icarus.trace() as t:"
+trace = Utils.Tracer.Trace
+
 ## The release version
 __version__ = "2.3.1"
 
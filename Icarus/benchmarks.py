@@ -0,0 +1,390 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+
+"""
+Benchmarks of the Icarus hot paths.
+
+The benchmarks use synthetic atmosphere grids built in memory, so that no
+external model files are needed. The results are written in JSON so that
+runs made on two different commits can be compared.
+
+Usage:
+    python -m Icarus.benchmarks [--ndiv 3 4 5 6 7] [--repeat 5] [--output bench.json] [--only make_surface flux ...]
+"""
+
+__all__ = ["Run", "Synthetic_phot", "Synthetic_doppler", "Synthetic_spec", "BENCHMARKS"]
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import argparse
+
+from .Utils.import_modules import *
+from . import Utils
+from . import Core
+from . import CoreBinary
+from . import Atmosphere
+
+logger = logging.getLogger(__name__)
+
+
+## Fiducial binary parameters used by the benchmarks
+PAR = dict(q=60., omega=1., filling=0.9, temp=5000., tempgrav=0.08, tirr=6000., porb=8*3600., k1=300e3, incl=np.pi/3)
+## Fiducial parameters of an eclipsing binary
+PAR_ECLIPSE = dict(q=0.8, omega1=1., omega2=1., filling1=0.8, filling2=0.8, temp1=6000., temp2=5000., tempgrav1=0.08, tempgrav2=0.08, tirr1=0., tirr2=0., porb=86400., k1=100e3, incl=np.pi/2)
+
+
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+## Synthetic atmosphere grids
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+
+def _Axes(nmu=51):
+    logtemp = np.log(np.arange(3000.,10001.,250.))
+    logg = np.arange(2.0, 5.6, 0.5)
+    mu = np.linspace(0., 1., nmu)
+    return logtemp, logg, mu
+
+def Synthetic_phot(name='synthetic', zp=0., ext=1., offset=0.):
+    """Synthetic_phot(name='synthetic', zp=0., ext=1., offset=0.)
+    Returns a synthetic photometric atmosphere grid consisting of a
+    blackbody-like flux with a linear limb darkening law.
+
+    name ('synthetic'): name of the band.
+    zp (0.): zero point of the band.
+    ext (1.): extinction coefficient of the band.
+    offset (0.): offset added to the log(flux).
+
+    >>> atmo = Synthetic_phot()
+    """
+    logtemp, logg, mu = _Axes()
+    temp = np.exp(logtemp)[:,None,None]
+    logflux = np.log(cts.sigma*temp**4*(1-0.6*(1-mu))/cts.pi) + 0.01*logg[:,None] + offset
+    return Atmosphere.AtmoGridPhot(data=logflux, name=name, description='Synthetic photometric grid', meta={'zp':zp, 'ext':ext}, cols=[('logtemp',logtemp), ('logg',logg), ('mu',mu)])
+
+def Synthetic_doppler():
+    """Synthetic_doppler()
+    Returns a synthetic grid of Doppler boosting factors matching the
+    dimensions of Synthetic_phot.
+
+    >>> atmo_doppler = Synthetic_doppler()
+    """
+    logtemp, logg, mu = _Axes()
+    boost = 1. + 0.1*logg[None,:,None] + 0.*logtemp[:,None,None] + 0.*mu
+    return Atmosphere.AtmoGridDoppler(data=boost, name='synthetic', description='Synthetic Doppler boosting grid', cols=[('logtemp',logtemp), ('logg',logg), ('mu',mu)])
+
+def Synthetic_spec(nwav=400, wav0=5000., dv=1e-5, linear=False):
+    """Synthetic_spec(nwav=400, wav0=5000., dv=1e-5, linear=False)
+    Returns a synthetic spectroscopic atmosphere grid consisting of a
+    blackbody with absorption lines and a linear limb darkening law.
+    The wavelength axis is uniformly spaced in log.
+
+    nwav (400): number of wavelength bins.
+    wav0 (5000.): first wavelength, in Angstrom.
+    dv (1e-5): fractional spacing of the wavelengths, i.e. dv*c velocity bins.
+    linear (False): if True, the grid is converted to the linear mode.
+
+    >>> atmo = Synthetic_spec()
+    """
+    logtemp, logg, mu = _Axes(nmu=11)
+    wav = wav0 * (1+dv)**np.arange(nwav)
+    lam = wav[None,None,None,:] * 1e-10
+    temp = np.exp(logtemp)[:,None,None,None]
+    planck = np.log(2*cts.h*cts.c**2/lam**5) - np.log(np.expm1(cts.h*cts.c/(lam*cts.k*temp)))
+    lines = np.log(1 - 0.5*np.exp(-0.5*((np.arange(nwav)%50 - 25)/2.)**2))
+    logflux = planck + np.log(1-0.6*(1-mu))[None,None,:,None] + lines + 0.01*logg[None,:,None,None]
+    atmo = Atmosphere.AtmoGridSpec(data=logflux, name='synthetic', description='Synthetic spectroscopic grid', cols=[('logtemp',logtemp), ('logg',logg), ('mu',mu), ('wav',wav)])
+    if linear:
+        atmo = atmo.To_linear()
+    return atmo
+
+
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+## Timing utilities
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+
+def Timeit(func, repeat=5, number=1):
+    """Timeit(func, repeat=5, number=1)
+    Returns the minimum and median time (in seconds) per call of func,
+    which is evaluated number times in each of the repeat trials.
+
+    >>> res = Timeit(lambda: star.Flux(0.25), repeat=5)
+    """
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        for j in range(number):
+            func()
+        times.append( (time.perf_counter()-t0)/number )
+    return {'time':float(np.min(times)), 'median':float(np.median(times)), 'repeat':repeat, 'number':number}
+
+def _Star(ndiv, atmo_grid=None):
+    star = Core.Star(ndiv, atmo_grid=atmo_grid, read=True)
+    star.Make_surface(**PAR)
+    return star
+
+
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+## Benchmarks
+## Each benchmark takes (ndiv, repeat, workdir) and returns a
+## list of records, i.e. dictionaries with at least 'name'.
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+
+def Bench_make_surface(ndiv, repeat, workdir):
+    """Star.Make_surface: full geometry (cache disabled and cached) vs temperature-only"""
+    star = _Star(ndiv)
+    star.Set_surface_cache(0)
+    fillings = iter(np.linspace(0.5, 0.95, 10000))
+    res_geom = Timeit(lambda: star.Make_surface(filling=next(fillings)), repeat=repeat)
+    star.Set_surface_cache(star.surface_cache_budget)
+    star.Make_surface(filling=0.8)
+    star.Make_surface(filling=0.9)
+    flip = iter(np.tile([0.8, 0.9], 10000))
+    res_cached = Timeit(lambda: star.Make_surface(filling=next(flip)), repeat=repeat)
+    temps = iter(np.linspace(4000., 6000., 10000))
+    res_temp = Timeit(lambda: star.Make_surface(temp=next(temps)), repeat=repeat)
+    return [dict(name='make_surface_geometry', n_faces=star.n_faces, **res_geom),
+            dict(name='make_surface_geometry_cached', n_faces=star.n_faces, **res_cached),
+            dict(name='make_surface_temperature', n_faces=star.n_faces, **res_temp)]
+
+def Bench_flux(ndiv, repeat, workdir):
+    """Star.Flux per phase, one phase at a time and phase-batched"""
+    atmo = Synthetic_phot()
+    star = _Star(ndiv, atmo_grid=atmo)
+    phases = np.linspace(0., 1., 20, endpoint=False)
+    res = Timeit(lambda: [star.Flux(phase) for phase in phases], repeat=repeat)
+    res_batch = Timeit(lambda: star.Flux_phases(phases, atmo_grid=atmo), repeat=repeat)
+    for r in (res, res_batch):
+        r['time'] /= phases.size
+        r['median'] /= phases.size
+    return [dict(name='flux', n_faces=star.n_faces, **res),
+            dict(name='flux_phases', n_faces=star.n_faces, **res_batch)]
+
+def Bench_keff(ndiv, repeat, workdir):
+    """Star.Keff per phase, one phase at a time and phase-batched"""
+    atmo = Synthetic_phot()
+    star = _Star(ndiv, atmo_grid=atmo)
+    phases = np.linspace(0., 1., 20, endpoint=False)
+    res = Timeit(lambda: [star.Keff(phase) for phase in phases], repeat=repeat)
+    res_batch = Timeit(lambda: star.Keff_phases(phases), repeat=repeat)
+    for r in (res, res_batch):
+        r['time'] /= phases.size
+        r['median'] /= phases.size
+    return [dict(name='keff', n_faces=star.n_faces, **res),
+            dict(name='keff_phases', n_faces=star.n_faces, **res_batch)]
+
+def Bench_flux_doppler(ndiv, repeat, workdir):
+    """Star.Flux_doppler per phase, photometric (with boosting) and spectroscopic grids"""
+    atmo = Synthetic_phot()
+    atmo_doppler = Synthetic_doppler()
+    spec = Synthetic_spec()
+    spec_linear = spec.To_linear()
+    star = _Star(ndiv, atmo_grid=atmo)
+    records = []
+    res = Timeit(lambda: star.Flux_doppler(0.25, atmo_grid=atmo, atmo_doppler=atmo_doppler), repeat=repeat)
+    records.append( dict(name='flux_doppler_phot', n_faces=star.n_faces, **res) )
+    res = Timeit(lambda: star.Flux_doppler(0.25, atmo_grid=spec), repeat=repeat)
+    records.append( dict(name='flux_doppler_spec', n_faces=star.n_faces, nwav=spec.shape[-1], **res) )
+    res = Timeit(lambda: star.Flux_doppler(0.25, atmo_grid=spec_linear), repeat=repeat)
+    records.append( dict(name='flux_doppler_spec_linear', n_faces=star.n_faces, nwav=spec.shape[-1], **res) )
+    spec_binned = spec.To_linear()
+    spec_binned.meta['binned'] = True
+    res = Timeit(lambda: star.Flux_doppler(0.25, atmo_grid=spec_binned), repeat=repeat)
+    records.append( dict(name='flux_doppler_spec_binned', n_faces=star.n_faces, nwav=spec.shape[-1], **res) )
+    spec_pca = Atmosphere.AtmoGridSpecPCA.From_grid(spec, tol=1e-3)
+    res = Timeit(lambda: star.Flux_doppler(0.25, atmo_grid=spec_pca), repeat=repeat)
+    records.append( dict(name='flux_doppler_spec_pca', n_faces=star.n_faces, nwav=spec.shape[-1], ncomp=spec_pca.shape[-1]-1, error=spec_pca.meta['error'], **res) )
+    return records
+
+def Bench_spec_linear_accuracy(ndiv, repeat, workdir):
+    """Accuracy of the linear mode of AtmoGridSpec with respect to the log mode"""
+    spec = Synthetic_spec()
+    spec_linear = spec.To_linear()
+    star = _Star(ndiv)
+    records = []
+    for phase in [0., 0.25, 0.5]:
+        flux_log = star.Flux_doppler(phase, atmo_grid=spec)
+        flux_linear = star.Flux_doppler(phase, atmo_grid=spec_linear)
+        records.append( dict(name='spec_linear_accuracy', phase=phase, n_faces=star.n_faces, max_rel_diff=float(np.abs(flux_linear/flux_log-1).max())) )
+    return records
+
+def Bench_grid_backend(ndiv, repeat, workdir):
+    """Utils.Grid.Interp_photometry for each available backend, and their parity"""
+    atmo = Synthetic_phot()
+    ## Synthetic surface elements, as many as the faces of a ndiv surface,
+    ## drawn within the axes of the grid
+    n_faces = 20*4**(ndiv-1)
+    rng = np.random.RandomState(0)
+    logtemp, logg, mu = _Axes()
+    args = (rng.uniform(logtemp[0], logtemp[-1], n_faces), rng.uniform(logg[0], logg[-1], n_faces), rng.uniform(0., 1., n_faces), rng.uniform(0.5, 1.5, n_faces)/n_faces)
+    backends = ['numpy']
+    if Utils.Grid._HAS_WEAVE:
+        backends.append('weave')
+    backend_old = Utils.Grid.BACKEND
+    records = []
+    fluxes = {}
+    try:
+        for backend in backends:
+            Utils.Grid.Set_backend(backend)
+            fluxes[backend] = atmo.Get_flux(*args)
+            res = Timeit(lambda: atmo.Get_flux(*args), repeat=repeat)
+            records.append( dict(name='grid_interp_photometry', backend=backend, n_faces=n_faces, faces_per_s=n_faces/res['time'], **res) )
+    finally:
+        Utils.Grid.Set_backend(backend_old)
+    if len(fluxes) == 2:
+        records.append( dict(name='grid_backend_parity', n_faces=n_faces, max_rel_diff=float(abs(fluxes['numpy']/fluxes['weave']-1))) )
+    return records
+
+def Bench_calc_chi2(ndiv, repeat, workdir):
+    """Photometry.Calc_chi2 for two bands of synthetic data"""
+    from .Photometry import Photometry
+    atmo_fln, data_fln = _Write_photometry(workdir)
+    fit = Photometry(atmo_fln, data_fln, ndiv, read=True)
+    par = [PAR['q'], PAR['porb'], PAR['incl'], PAR['k1'], PAR['omega'], PAR['filling'], PAR['tempgrav'], PAR['temp'], PAR['tirr'], 10., 0.1]
+    fillings = iter(np.linspace(0.85, 0.95, 10000))
+    def calc():
+        par[5] = next(fillings)
+        fit.Calc_chi2(par)
+    res = Timeit(calc, repeat=repeat)
+    return [dict(name='calc_chi2', ndata=int(sum(p.size for p in fit.data['phase'])), **res)]
+
+def Bench_flux_eclipse(ndiv, repeat, workdir):
+    """StarBinary.Flux_eclipse in and out of eclipse, and a phase-batched light curve"""
+    atmo = Synthetic_phot()
+    binary = CoreBinary.StarBinary(ndiv, ndiv, atmo_grid=atmo, read=True)
+    binary.Make_surface(**PAR_ECLIPSE)
+    records = []
+    for label, phase in [('out', 0.25), ('in', 0.5)]:
+        res = Timeit(lambda: binary.Flux_eclipse(phase, atmo_grid=atmo), repeat=repeat)
+        records.append( dict(name='flux_eclipse_'+label, phase=phase, overlap=bool(binary.overlap), **res) )
+    phases = np.linspace(0., 1., 1000, endpoint=False)
+    type1, type2 = binary.Occultation_phases(phases)
+    eclipsed = (type1 != "none") | (type2 != "none")
+    res = Timeit(lambda: binary.Flux_eclipse_phases(phases, atmo_grid=atmo), repeat=repeat)
+    records.append( dict(name='flux_eclipse_phases', nphases=phases.size, neclipsed=int(eclipsed.sum()), **res) )
+    res = Timeit(lambda: binary.Flux_eclipse_phases(phases[eclipsed], atmo_grid=atmo), repeat=repeat)
+    records.append( dict(name='flux_eclipse_phases_eclipsed', nphases=int(eclipsed.sum()), **res) )
+    return records
+
+def Bench_grid_hdf5_load(ndiv, repeat, workdir):
+    """AtmoGridPhot and AtmoGridSpec HDF5 load"""
+    records = []
+    for name, atmo in [('phot', Synthetic_phot()), ('spec', Synthetic_spec())]:
+        fln = os.path.join(workdir, 'grid_{}.h5'.format(name))
+        atmo.WriteHDF5(fln, overwrite=True)
+        res = Timeit(lambda: atmo.__class__.ReadHDF5(fln), repeat=repeat)
+        records.append( dict(name='grid_hdf5_load_'+name, size=int(atmo.size), **res) )
+    return records
+
+def _Write_photometry(workdir):
+    """_Write_photometry(workdir)
+    Writes the atmosphere grids and synthetic photometric data
+    of two bands in workdir, in the format read by Photometry.
+
+    Returns the atmosphere and data filenames.
+    """
+    atmo_fln = os.path.join(workdir, 'atmo.txt')
+    data_fln = os.path.join(workdir, 'data.txt')
+    if os.path.exists(atmo_fln) and os.path.exists(data_fln):
+        return atmo_fln, data_fln
+    phases = np.linspace(0., 1., 50, endpoint=False)
+    with open(atmo_fln, 'w') as fa, open(data_fln, 'w') as fd:
+        for i, band in enumerate(['g', 'i']):
+            fln = os.path.join(workdir, 'atmo_{}.h5'.format(band))
+            Synthetic_phot(name=band, zp=-48.6-i, ext=1.-0.5*i, offset=-0.3*i).WriteHDF5(fln, overwrite=True)
+            fa.write('{} {}\n'.format(band, fln))
+            fln = os.path.join(workdir, 'data_{}.txt'.format(band))
+            np.savetxt(fln, np.c_[phases, 20.+0.3*np.cos(phases*cts.TWOPI*2), phases*0.+0.02])
+            fd.write('{} 0 1 2 0. 0.05 0. mag {}\n'.format(band, fln))
+    return atmo_fln, data_fln
+
+## List of the benchmarks. Those with ndiv_dependent False are run only once.
+BENCHMARKS = [
+    ('make_surface', Bench_make_surface, True),
+    ('flux', Bench_flux, True),
+    ('keff', Bench_keff, True),
+    ('flux_doppler', Bench_flux_doppler, True),
+    ('spec_linear_accuracy', Bench_spec_linear_accuracy, True),
+    ('grid_backend', Bench_grid_backend, True),
+    ('calc_chi2', Bench_calc_chi2, True),
+    ('flux_eclipse', Bench_flux_eclipse, True),
+    ('grid_hdf5_load', Bench_grid_hdf5_load, False),
+    ]
+
+
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+## Driver
+##----- ----- ----- ----- ----- ----- ----- ----- ----- -----##
+
+def _Environment():
+    try:
+        import subprocess
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.STDOUT).decode().strip()
+    except Exception:
+        commit = None
+    from . import __version__
+    return {'icarus':__version__, 'commit':commit, 'python':platform.python_version(), 'numpy':np.__version__, 'scipy':scipy.__version__,
+            'platform':platform.platform(), 'date':time.strftime('%Y-%m-%dT%H:%M:%S'), 'grid_backend':Utils.Grid.BACKEND}
+
+def Run(ndivs=(3,4,5,6,7), repeat=5, only=None, verbose=True):
+    """Run(ndivs=(3,4,5,6,7), repeat=5, only=None, verbose=True)
+    Runs the benchmarks and returns the results as a dictionary
+    {'environment':..., 'results':[...]}.
+
+    A benchmark which fails does not stop the others: its record
+    contains an 'error' entry instead of the timing.
+
+    ndivs ((3,4,5,6,7)): surface subdivisions to benchmark.
+    repeat (5): number of timing trials; the minimum is reported.
+    only (None): list of benchmark names to run. All if None.
+    verbose (True): print the results as they come.
+
+    >>> results = Run(ndivs=[4,5], repeat=3, only=['flux'])
+    """
+    results = []
+    workdir = tempfile.mkdtemp(prefix='icarus_bench_')
+    try:
+        for name, func, ndiv_dependent in BENCHMARKS:
+            if only is not None and name not in only:
+                continue
+            for ndiv in (ndivs if ndiv_dependent else [None]):
+                try:
+                    records = func(ndiv, repeat, workdir)
+                except Exception as e:
+                    logger.warning("Benchmark {} (ndiv={}) failed: {!r}".format(name, ndiv, e))
+                    records = [{'name':name, 'error':repr(e)}]
+                for record in records:
+                    record['ndiv'] = ndiv
+                    results.append(record)
+                    if verbose:
+                        _Print_record(record)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {'environment':_Environment(), 'results':results}
+
+def _Print_record(record):
+    extra = ', '.join('{}={}'.format(k, v) for k, v in record.items() if k not in ('name', 'ndiv', 'time', 'median', 'repeat', 'number'))
+    if 'time' in record:
+        print( "{:<30s} ndiv={!s:<4s} {:>12.6f} s  {}".format(record['name'], record['ndiv'], record['time'], extra) )
+    else:
+        print( "{:<30s} ndiv={!s:<4s} {:>14s}  {}".format(record['name'], record['ndiv'], '', extra) )
+    sys.stdout.flush()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m Icarus.benchmarks', description='Benchmarks of the Icarus hot paths.')
+    parser.add_argument('--ndiv', type=int, nargs='+', default=[3,4,5,6,7], help='surface subdivisions to benchmark (default: 3 4 5 6 7)')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timing trials (default: 5)')
+    parser.add_argument('--only', nargs='+', default=None, choices=[b[0] for b in BENCHMARKS], help='benchmarks to run (default: all)')
+    parser.add_argument('--output', default=None, help='JSON file to write the results to (default: stdout only)')
+    args = parser.parse_args(argv)
+    results = Run(ndivs=args.ndiv, repeat=args.repeat, only=args.only)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+        print( "Results written to {}".format(args.output) )
+    return results
+
+if __name__ == '__main__':
+    main()
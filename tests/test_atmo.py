@@ -0,0 +1,136 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from Icarus import Atmosphere, benchmarks
+
+
+def _Init(handle):
+    global _atmo
+    _atmo = Atmosphere.AtmoGrid.Attach_shared(handle)
+
+def _Sum(i):
+    return float(_atmo.view(np.ndarray).sum())
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason="requires the fork start method")
+def test_shared_grid_in_workers():
+    atmo = benchmarks.Synthetic_phot()
+    handle = atmo.Export_shared()
+    try:
+        with multiprocessing.get_context('fork').Pool(2, initializer=_Init, initargs=(handle,)) as pool:
+            res = pool.map(_Sum, range(4))
+        ## The block outlives the workers
+        attached = Atmosphere.AtmoGrid.Attach_shared(handle)
+        np.testing.assert_array_equal(attached.view(np.ndarray), atmo.view(np.ndarray))
+        del attached
+    finally:
+        Atmosphere.AtmoGrid.Release_shared(handle)
+    assert res == [float(atmo.view(np.ndarray).sum())]*4
+
+def test_release_shared_already_unlinked():
+    from multiprocessing import shared_memory
+    atmo = benchmarks.Synthetic_phot()
+    handle = atmo.Export_shared()
+    ## Simulate a block removed behind our back, e.g. by a resource tracker
+    shm = shared_memory.SharedMemory(name=handle['shm'], create=False)
+    shm.close()
+    shm.unlink()
+    Atmosphere.AtmoGrid.Release_shared(handle)
+
+def test_phot_stack():
+    grids = [benchmarks.Synthetic_phot(name=band, zp=-48.6-i, ext=1.-0.5*i, offset=-0.3*i) for i,band in enumerate('gri')]
+    stack = Atmosphere.AtmoGridPhotStack.From_grids(grids)
+    assert stack.meta['bands'] == ['g', 'r', 'i']
+    np.testing.assert_array_equal(stack.meta['zp'], [grid.meta['zp'] for grid in grids])
+    np.testing.assert_array_equal(stack.meta['ext'], [grid.meta['ext'] for grid in grids])
+    rng = np.random.RandomState(0)
+    nsurf = 500
+    logtemp = rng.uniform(np.log(4000.), np.log(7000.), nsurf)
+    logg = rng.uniform(3.5, 4.5, nsurf)
+    mu = rng.uniform(0.05, 1., nsurf)
+    area = rng.uniform(0.5, 1.5, nsurf)
+    fl_nosum = stack.Get_flux_nosum(logtemp, logg, mu, area)
+    fl = stack.Get_flux(logtemp, logg, mu, area)
+    assert fl_nosum.shape == (nsurf, len(grids))
+    for i, grid in enumerate(grids):
+        ## Each band of the stack is identical to its own grid
+        np.testing.assert_array_equal(fl_nosum[:,i], grid.Get_flux_nosum(logtemp, logg, mu, area))
+        np.testing.assert_allclose(fl[i], grid.Get_flux(logtemp, logg, mu, area), rtol=1e-13)
+        band = stack.Band(i)
+        assert band.name == grid.name
+        assert band.meta['zp'] == grid.meta['zp']
+        assert band.meta['ext'] == grid.meta['ext']
+        np.testing.assert_array_equal(band.data, grid.data)
+        for colname in grid.colnames:
+            np.testing.assert_array_equal(band.cols[colname], grid.cols[colname])
+
+def test_phot_stack_axes_mismatch():
+    grid = benchmarks.Synthetic_phot()
+    cols = [(colname, grid.cols[colname]*(0.5 if colname == 'mu' else 1.)) for colname in grid.colnames]
+    grids = [grid, Atmosphere.AtmoGridPhot(data=grid.data, name='other', meta=dict(grid.meta), cols=cols)]
+    with pytest.raises(Exception):
+        Atmosphere.AtmoGridPhotStack.From_grids(grids)
+
+@pytest.fixture(scope='module')
+def spec():
+    return benchmarks.Synthetic_spec(nwav=120)
+
+def _Surface_spec(spec, nsurf=300):
+    rng = np.random.RandomState(5)
+    logtemp = rng.uniform(np.log(4000.), np.log(7000.), nsurf)
+    logg = rng.uniform(3.5, 4.5, nsurf)
+    mu = rng.uniform(0.05, 1., nsurf)
+    area = rng.uniform(0.5, 1.5, nsurf)
+    ## Shifts of up to 1.5 times the wavelength range, i.e. past both edges
+    vel = rng.uniform(-1.5, 1.5, nsurf) * spec.shape[-1] * spec.meta['delta_v']
+    return logtemp, logg, mu, area, vel
+
+def test_spec_pca_all_components(spec):
+    ## Keeping all the components reproduces the linear grid
+    ncomp = spec.shape[0]*spec.shape[1]*spec.shape[2]
+    pca = Atmosphere.AtmoGridSpecPCA.From_grid(spec, ncomp=ncomp)
+    linear = spec.To_linear()
+    scale = np.abs(linear.data).max()
+    np.testing.assert_allclose(pca.Reconstruct().data, linear.data, rtol=0, atol=1e-10*scale)
+    assert pca.meta['error'] < 1e-12
+    np.testing.assert_array_equal(pca.wav, spec.cols['wav'])
+
+@pytest.mark.parametrize('tol', [1e-2, 1e-3, 1e-4])
+def test_spec_pca_error(spec, tol):
+    pca = Atmosphere.AtmoGridSpecPCA.From_grid(spec, tol=tol)
+    assert pca.meta['error'] <= tol
+    ## The reported error is that of the reconstruction
+    flux = spec.To_linear().data
+    error = np.sqrt(((pca.Reconstruct().data - flux)**2).sum() / (flux**2).sum())
+    np.testing.assert_allclose(pca.meta['error'], error, rtol=1e-6)
+    ## The smallest number of components is kept
+    if pca.shape[-1] > 2:
+        assert Atmosphere.AtmoGridSpecPCA.From_grid(spec, ncomp=pca.shape[-1]-2).meta['error'] > tol
+
+def test_spec_pca_get_flux_doppler(spec):
+    ## The compressed synthesis equals the linear one on the reconstructed grid
+    pca = Atmosphere.AtmoGridSpecPCA.From_grid(spec, tol=1e-3)
+    args = _Surface_spec(spec)
+    expected = pca.Reconstruct().Get_flux_doppler(*args)
+    np.testing.assert_allclose(pca.Get_flux_doppler(*args), expected, rtol=1e-10)
+    ## And with all the components, the linear synthesis of the original grid
+    ncomp = spec.shape[0]*spec.shape[1]*spec.shape[2]
+    pca = Atmosphere.AtmoGridSpecPCA.From_grid(spec, ncomp=ncomp)
+    expected = spec.To_linear().Get_flux_doppler(*args)
+    np.testing.assert_allclose(pca.Get_flux_doppler(*args), expected, rtol=1e-9)
+
+def test_spec_pca_hdf5(spec, tmp_path):
+    pytest.importorskip('h5py')
+    pca = Atmosphere.AtmoGridSpecPCA.From_grid(spec, tol=1e-3)
+    fln = str(tmp_path / 'spec_pca.h5')
+    pca.WriteHDF5(fln)
+    pca_read = Atmosphere.AtmoGridSpecPCA.ReadHDF5(fln)
+    np.testing.assert_array_equal(pca_read.basis, pca.basis)
+    np.testing.assert_array_equal(pca_read.wav, pca.wav)
+    np.testing.assert_array_equal(pca_read.data, pca.data)
+    assert pca_read.meta['error'] == pca.meta['error']
+    args = _Surface_spec(spec)
+    np.testing.assert_array_equal(pca_read.Get_flux_doppler(*args), pca.Get_flux_doppler(*args))
@@ -0,0 +1,22 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+
+import numpy as np
+import pytest
+
+from Icarus.Utils import Binary
+
+
+@pytest.mark.parametrize('q, omega', [(56., 1.), (0.8, 1.), (5., 0.7)])
+def test_saddle_numpy(q, omega):
+    qp1by2om2 = (q+1.)/2*omega**2
+    x = Binary.Saddle_numpy(0.5, q, qp1by2om2)
+    ## The derivative of the potential vanishes at the saddle point
+    rc = abs(x)
+    rx = np.sqrt(rc*rc+1-2*x)
+    dpsidx = x*(-1/rc**3-q/rx**3+2*qp1by2om2)+q*(1/rx**3-1)
+    assert 0 < x < 1
+    assert abs(dpsidx) < 1e-8
+
+@pytest.mark.skipif(not Binary._HAS_WEAVE, reason="scipy.weave is not available")
+def test_saddle_weave():
+    np.testing.assert_allclose(Binary.Saddle(0.5, 56., 57./2), Binary.Saddle_numpy(0.5, 56., 57./2), rtol=1e-12)
@@ -0,0 +1,86 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+
+"""
+The vectorized eclipse utilities against per-element reference loops.
+"""
+
+import numpy as np
+import pytest
+
+from Icarus import CoreBinary, benchmarks
+from Icarus.Utils import Eclipse
+from Icarus.Utils.import_modules import cts
+
+
+NTHETA = 100
+
+
+@pytest.fixture(scope='module')
+def binary():
+    binary = CoreBinary.StarBinary(4, 4, atmo_grid=benchmarks.Synthetic_phot(), read=True)
+    binary.Make_surface(**benchmarks.PAR_ECLIPSE)
+    return binary
+
+def _Occultation_reference(vertices, r_vertices, assoc, n_faces, incl, orbph, q, ntheta, radii):
+    ## Per-vertex loop of the former C kernel, the outline being binned
+    ## in steps of dtheta over [0, 2pi)
+    dtheta = cts.TWOPI/ntheta
+    offsety = -np.sin(orbph)
+    offsetz = np.cos(orbph)*np.cos(incl)
+    weight = np.zeros(n_faces)
+    for i in range(vertices.shape[0]):
+        vx, vy, vz = vertices[i]*r_vertices[i]
+        xnew = vx*np.cos(orbph) + vy*np.sin(orbph)
+        y = -vx*np.sin(orbph) + vy*np.cos(orbph) + offsety
+        z = vz*np.sin(incl) + xnew*np.cos(incl) + offsetz
+        theta = np.arctan2(z, y)
+        if theta < 0:
+            theta += cts.TWOPI
+        pos = int(theta/dtheta)
+        w = theta/dtheta - pos
+        r = radii[pos%ntheta]*(1-w) + radii[(pos+1)%ntheta]*w
+        if y**2 + z**2 < r**2:
+            for ind in assoc[i]:
+                if ind != -99:
+                    weight[ind] += 1.
+    return weight
+
+def _Args(binary):
+    star = binary.primary
+    radii = binary._Outline(binary.secondary, NTHETA)
+    return (star.vertices, star.r_vertices, star.assoc, star.n_faces, star.incl), (star.q, NTHETA, radii)
+
+@pytest.mark.parametrize('phase', [0., 0.02, 0.05, -0.04, 0.97])
+def test_occultation_approx(binary, phase):
+    args1, args2 = _Args(binary)
+    weight = Eclipse.Occultation_approx(*(args1 + (phase*cts.TWOPI,) + args2))
+    expected = _Occultation_reference(*(args1 + (phase*cts.TWOPI,) + args2))
+    np.testing.assert_array_equal(weight, expected)
+    if phase == 0.:
+        ## At conjunction, some faces are fully covered
+        assert (weight == 3).any()
+
+@pytest.mark.parametrize('chunksize', [2**22, 1000])
+def test_occultation_approx_phases(binary, chunksize):
+    args1, args2 = _Args(binary)
+    orbph = np.r_[np.linspace(-0.08, 0.08, 17), 0.3, 0.5]*cts.TWOPI
+    weights = Eclipse.Occultation_approx(*(args1 + (orbph,) + args2), chunksize=chunksize)
+    assert weights.shape == (orbph.size, binary.primary.n_faces)
+    for w, ph in zip(weights, orbph):
+        np.testing.assert_array_equal(w, _Occultation_reference(*(args1 + (ph,) + args2)))
+    ## The stars do not overlap on the sky plane at quadrature
+    assert (weights[-2] == 0).all()
+
+def test_weights_transit():
+    rng = np.random.RandomState(0)
+    n_lowres = 50
+    inds_highres = rng.randint(0, n_lowres, size=800)
+    ## The last low resolution face has no high resolution face
+    inds_highres[inds_highres == n_lowres-1] = 0
+    weights = rng.randint(0, 4, size=(6, 800)).astype(float)
+    res = Eclipse.Weights_transit(inds_highres, weights, n_lowres)
+    assert res.shape == (6, n_lowres)
+    for w, r in zip(weights, res):
+        np.testing.assert_array_equal(r, np.bincount(inds_highres, weights=w, minlength=n_lowres))
+        np.testing.assert_array_equal(r, Eclipse.Weights_transit(inds_highres, w, n_lowres))
+    assert (res[:,-1] == 0).all()
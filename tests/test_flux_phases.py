@@ -0,0 +1,73 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+
+"""
+The batched Star_base.Flux_phases against the per-phase Star_base.Flux.
+"""
+
+import numpy as np
+import pytest
+
+from Icarus import Core, benchmarks
+
+
+PHASES = np.r_[np.linspace(0., 1., 17), 0.1234, 0.8766, 0.5, 1.25, -0.3]
+
+## Spherical harmonic coefficients [A_{00},A_{1-1},A_{10},A_{11}]
+TEMP_EVEN = [5000., 0., 300., 400.]
+TEMP_ODD = [5000., 400., 300., 0.]
+
+
+def _Star_temperature(temp):
+    star = Core.Star_temperature(4, read=True)
+    par = dict(benchmarks.PAR, temp=temp)
+    star.Make_surface(**par)
+    return star
+
+@pytest.fixture(scope='module')
+def atmo():
+    return benchmarks.Synthetic_phot()
+
+@pytest.fixture(scope='module')
+def stars():
+    return {'star': benchmarks._Star(4), 'temperature_even': _Star_temperature(TEMP_EVEN), 'temperature_odd': _Star_temperature(TEMP_ODD)}
+
+def test_symmetric(stars):
+    assert stars['star']._Symmetric()
+    assert stars['temperature_even']._Symmetric()
+    assert not stars['temperature_odd']._Symmetric()
+
+@pytest.mark.parametrize('name', ['star', 'temperature_even', 'temperature_odd'])
+@pytest.mark.parametrize('nchunk', [1, 3, 100])
+def test_flux_phases(stars, atmo, name, nchunk):
+    star = stars[name]
+    expected = np.array([star.Flux(phase, atmo_grid=atmo) for phase in PHASES])
+    chunksize = nchunk*star.n_faces
+    ## The default evaluation is identical to the per-phase one
+    np.testing.assert_array_equal(star.Flux_phases(PHASES, atmo_grid=atmo, chunksize=chunksize), expected)
+    ## Folding only changes the results at the rounding level
+    np.testing.assert_allclose(star.Flux_phases(PHASES, atmo_grid=atmo, chunksize=chunksize, fold=True), expected, rtol=1e-12)
+
+def test_flux_phases_odd_temperature_is_asymmetric(stars, atmo):
+    ## Sanity check that the odd-m temperature map indeed breaks F(phase) = F(1-phase)
+    star = stars['temperature_odd']
+    fl = star.Flux_phases([0.25, 0.75], atmo_grid=atmo)
+    assert abs(fl[0]/fl[1]-1) > 1e-6
+
+@pytest.mark.parametrize('nchunk', [1, 3, 100])
+def test_keff_phases(stars, atmo, nchunk):
+    star = stars['star']
+    expected = np.array([star.Keff(phase, atmo_grid=atmo) for phase in PHASES])
+    ## Keff sums inside the atmosphere grid, hence the agreement is to rounding
+    ## (the absolute tolerance covers the conjunctions, where Keff ~ 0)
+    np.testing.assert_allclose(star.Keff_phases(PHASES, atmo_grid=atmo, chunksize=nchunk*star.n_faces), expected, rtol=1e-12, atol=1e-12*np.abs(expected).max())
+
+def test_keff_phases_nothing_visible(stars, atmo, monkeypatch):
+    star = stars['star']
+    expected = star.Keff_phases(PHASES, atmo_grid=atmo)
+    mu = star._Mu(PHASES[:,None])
+    ## Hide the whole surface at the second phase only
+    mu[1] = -1.
+    monkeypatch.setattr(star, '_Mu', lambda phases: mu)
+    keff = star.Keff_phases(PHASES, atmo_grid=atmo)
+    assert keff[1] == 0.
+    np.testing.assert_array_equal(np.delete(keff, 1), np.delete(expected, 1))
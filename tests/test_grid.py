@@ -0,0 +1,195 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+
+"""
+Parity of the numpy backend of Utils.Grid with the weave kernels, and with a
+per-element reference loop that mirrors the C code (so that the comparison
+still runs where scipy.weave is not available).
+"""
+
+import numpy as np
+import pytest
+
+from Icarus.Utils import Grid
+
+
+NTEFF, NLOGG, NMU = 6, 5, 7
+
+
+def _Corner(grid, w1teff, w1logg, w1mu, j0teff, j0logg, j0mu):
+    ## Literal transcription of the 8-corner interpolation of the C kernels
+    w0teff, w0logg, w0mu = 1.-w1teff, 1.-w1logg, 1.-w1mu
+    j1teff, j1logg, j1mu = j0teff+1, j0logg+1, j0mu+1
+    return w1mu*(w0logg*(w0teff*grid[j0teff,j0logg,j1mu] + w1teff*grid[j1teff,j0logg,j1mu]) \
+               + w1logg*(w0teff*grid[j0teff,j1logg,j1mu] + w1teff*grid[j1teff,j1logg,j1mu])) \
+         + w0mu*(w0logg*(w0teff*grid[j0teff,j0logg,j0mu] + w1teff*grid[j1teff,j0logg,j0mu]) \
+               + w1logg*(w0teff*grid[j0teff,j1logg,j0mu] + w1teff*grid[j1teff,j1logg,j0mu]))
+
+def _Reference(grid, wteff, wlogg, wmu, jteff, jlogg, jmu, area, val_mu, val_vel=None, grid_doppler=None, v=None, val_teff=None):
+    fl = np.empty(jteff.size)
+    for i in range(jteff.size):
+        args = (wteff[i], wlogg[i], wmu[i], jteff[i], jlogg[i], jmu[i])
+        fl[i] = np.exp(_Corner(grid, *args)) * area[i] * val_mu[i]
+        if grid_doppler is not None:
+            fl[i] *= 1 + _Corner(grid_doppler, *args) * val_vel[i]
+    return fl
+
+@pytest.fixture
+def inputs():
+    rng = np.random.RandomState(42)
+    grid = rng.uniform(-2., 2., size=(NTEFF,NLOGG,NMU))
+    grid_doppler = rng.uniform(0., 3., size=(NTEFF,NLOGG,NMU))
+    nsurf = 500
+    wteff = rng.uniform(size=nsurf)
+    wlogg = rng.uniform(size=nsurf)
+    wmu = rng.uniform(size=nsurf)
+    jteff = rng.randint(0, NTEFF-1, size=nsurf)
+    jlogg = rng.randint(0, NLOGG-1, size=nsurf)
+    jmu = rng.randint(0, NMU-1, size=nsurf)
+    ## On-node values: zero weight on the lower node and unit weight on the upper one
+    wteff[:20] = 0.
+    wlogg[10:30] = 1.
+    wmu[20:40] = 0.
+    ## Grid edges: the last cell along each axis, with unit weight (i.e. the last node)
+    jteff[40:60], wteff[40:60] = NTEFF-2, 1.
+    jlogg[50:70], wlogg[50:70] = NLOGG-2, 1.
+    jmu[60:80], wmu[60:80] = NMU-2, 1.
+    ## Grid edges: the first node
+    jteff[80:90], wteff[80:90] = 0, 0.
+    jlogg[80:90], wlogg[80:90] = 0, 0.
+    jmu[80:90], wmu[80:90] = 0, 0.
+    area = rng.uniform(0.5, 1.5, size=nsurf)
+    val_mu = rng.uniform(size=nsurf)
+    val_vel = rng.uniform(-1e-3, 1e-3, size=nsurf)
+    v = rng.uniform(-300e3, 300e3, size=nsurf)
+    val_teff = rng.uniform(np.log(3000.), np.log(8000.), size=nsurf)
+    return dict(grid=grid, grid_doppler=grid_doppler, w=(wteff, wlogg, wmu), j=(jteff, jlogg, jmu), area=area, val_mu=val_mu, val_vel=val_vel, v=v, val_teff=val_teff)
+
+def _Call(name, inputs):
+    args = (inputs['grid'],) + inputs['w'] + inputs['j'] + (inputs['area'], inputs['val_mu'])
+    if name in ('Interp_photometry', 'Interp_photometry_nosum'):
+        return getattr(Grid, name)(*args)
+    if name in ('Interp_photometry_doppler', 'Interp_photometry_doppler_nosum'):
+        return getattr(Grid, name)(*(args + (inputs['val_vel'], inputs['grid_doppler'])))
+    if name == 'Interp_photometry_Keff':
+        return getattr(Grid, name)(*(args + (inputs['v'],)))
+    if name == 'Interp_photometry_details':
+        return getattr(Grid, name)(*(args + (inputs['v'], inputs['val_teff'])))
+
+def _Expected(name, inputs):
+    args = (inputs['grid'],) + inputs['w'] + inputs['j'] + (inputs['area'], inputs['val_mu'])
+    if 'doppler' in name:
+        fl = _Reference(*args, val_vel=inputs['val_vel'], grid_doppler=inputs['grid_doppler'])
+    else:
+        fl = _Reference(*args)
+    if name.endswith('_nosum'):
+        return fl
+    total = fl.sum()
+    v = inputs['v']
+    if name == 'Interp_photometry_Keff':
+        return total, (v*fl).sum()/total
+    if name == 'Interp_photometry_details':
+        Keff = (v*fl).sum()/total
+        vsini = np.sqrt((v*v*fl).sum()/total - Keff*Keff)
+        Teff = (np.exp(inputs['val_teff'])*fl).sum()/total
+        return total, Keff, vsini, Teff
+    return total
+
+NAMES = ['Interp_photometry', 'Interp_photometry_nosum', 'Interp_photometry_doppler', 'Interp_photometry_doppler_nosum', 'Interp_photometry_Keff', 'Interp_photometry_details']
+
+@pytest.fixture
+def backend():
+    backend_old = Grid.BACKEND
+    def select(name):
+        Grid.Set_backend(name)
+    yield select
+    Grid.Set_backend(backend_old)
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_numpy_matches_reference(name, inputs, backend):
+    backend('numpy')
+    res = _Call(name, inputs)
+    expected = _Expected(name, inputs)
+    np.testing.assert_allclose(np.array(res, dtype=float), np.array(expected, dtype=float), rtol=1e-12)
+
+@pytest.mark.skipif(not Grid._HAS_WEAVE, reason="scipy.weave is not available")
+@pytest.mark.parametrize('name', NAMES)
+def test_numpy_matches_weave(name, inputs, backend):
+    backend('weave')
+    res_weave = _Call(name, inputs)
+    backend('numpy')
+    res_numpy = _Call(name, inputs)
+    np.testing.assert_allclose(np.array(res_numpy, dtype=float), np.array(res_weave, dtype=float), rtol=1e-12)
+
+def test_interp_3Dgrid_on_nodes(inputs):
+    ## At the nodes the interpolation returns the grid values themselves
+    grid = inputs['grid']
+    jteff, jlogg, jmu = np.meshgrid(np.arange(NTEFF-1), np.arange(NLOGG-1), np.arange(NMU-1), indexing='ij')
+    jteff, jlogg, jmu = jteff.ravel(), jlogg.ravel(), jmu.ravel()
+    zeros = np.zeros(jteff.size)
+    ones = np.ones(jteff.size)
+    np.testing.assert_array_equal(Grid.Interp_3Dgrid_numpy(grid, zeros, zeros, zeros, jteff, jlogg, jmu), grid[jteff,jlogg,jmu])
+    np.testing.assert_array_equal(Grid.Interp_3Dgrid_numpy(grid, ones, ones, ones, jteff, jlogg, jmu), grid[jteff+1,jlogg+1,jmu+1])
+
+def test_numpy_batched_phases(inputs, backend):
+    ## A (nphases, nsurf) input is summed along the last axis only
+    backend('numpy')
+    args = (inputs['grid'],) + tuple(np.tile(x, (3,1)) for x in inputs['w'] + inputs['j']) + (np.tile(inputs['area'], (3,1)), np.tile(inputs['val_mu'], (3,1)))
+    res = Grid.Interp_photometry(*args)
+    assert res.shape == (3,)
+    np.testing.assert_allclose(res, _Expected('Interp_photometry', inputs), rtol=1e-12)
+
+NWAV = 40
+
+def _Reference_doppler(grid, wteff, wlogg, wmu, wwav, jteff, jlogg, jmu, jwav, area, val_mu):
+    ## Per-element shift of a linear grid, saturated at the edges as in the C kernel
+    nwav = grid.shape[-1]
+    fl = np.zeros(nwav)
+    for i in range(jteff.size):
+        spec = _Corner(grid, wteff[i], wlogg[i], wmu[i], jteff[i], jlogg[i], jmu[i])
+        for k in range(nwav):
+            j0 = jwav[i] + k
+            if j0 < 0:
+                j0 = j1 = 0
+            elif j0+1 >= nwav:
+                j0 = j1 = nwav-1
+            else:
+                j1 = j0+1
+            fl[k] += area[i] * val_mu[i] * ((1.-wwav[i])*spec[j0] + wwav[i]*spec[j1])
+    return fl
+
+@pytest.fixture
+def inputs_doppler(inputs):
+    rng = np.random.RandomState(7)
+    grid = rng.uniform(0.5, 2., size=(NTEFF,NLOGG,NMU,NWAV))
+    nsurf = inputs['area'].size
+    wwav = rng.uniform(size=nsurf)
+    ## Shifts within the grid, and past both edges (fully or partially)
+    jwav = rng.randint(-3, 4, size=nsurf)
+    jwav[:30] = rng.randint(-NWAV-5, -NWAV+5, size=30)
+    jwav[30:60] = rng.randint(NWAV-5, NWAV+5, size=30)
+    jwav[60:70] = -1
+    jwav[70:80] = NWAV-1
+    return (grid,) + inputs['w'] + (wwav,) + inputs['j'] + (jwav, inputs['area'], inputs['val_mu'])
+
+def test_interp_doppler_linear_matches_reference(inputs_doppler, backend):
+    backend('numpy')
+    np.testing.assert_allclose(Grid.Interp_doppler(*inputs_doppler, linear=True), _Reference_doppler(*inputs_doppler), rtol=1e-12)
+
+def test_interp_doppler_binned_matches_interp_doppler(inputs_doppler, backend):
+    backend('numpy')
+    expected = Grid.Interp_doppler(*inputs_doppler, linear=True)
+    np.testing.assert_allclose(Grid.Interp_doppler_binned(*inputs_doppler, linear=True), expected, rtol=1e-12)
+    ## For a log(flux) grid, the binned version interpolates exp(grid) linearly
+    grid = inputs_doppler[0]
+    np.testing.assert_allclose(Grid.Interp_doppler_binned(np.log(grid), *inputs_doppler[1:]), expected, rtol=1e-12)
+
+@pytest.mark.skipif(not Grid._HAS_WEAVE, reason="scipy.weave is not available")
+@pytest.mark.parametrize('linear', [False, True])
+def test_interp_doppler_numpy_matches_weave(inputs_doppler, backend, linear):
+    grid = inputs_doppler[0] if linear else np.log(inputs_doppler[0])
+    args = (grid,) + inputs_doppler[1:]
+    backend('weave')
+    res_weave = Grid.Interp_doppler(*args, linear=linear)
+    backend('numpy')
+    np.testing.assert_allclose(Grid.Interp_doppler(*args, linear=linear), res_weave, rtol=1e-12)
@@ -0,0 +1,49 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+
+import numpy as np
+
+from Icarus import Utils
+
+
+def _Values(n):
+    return {'a': np.zeros(n), 'b': np.zeros(n, dtype=np.int32)}
+
+def test_cache_lru_eviction_order():
+    ## Each entry takes 12*100 bytes, so that the budget holds three of them
+    cache = Utils.Misc.Cache_lru(12*300)
+    for key in 'abc':
+        cache.Put(key, _Values(100))
+    assert cache.size == 12*300 and len(cache) == 3
+    ## Using 'a' makes 'b' the least recently used entry
+    assert cache.Get('a') is not None
+    cache.Put('d', _Values(100))
+    assert 'b' not in cache
+    assert all(key in cache for key in 'acd')
+    ## An entry twice as large discards the two least recently used ones
+    cache.Put('e', _Values(200))
+    assert 'a' not in cache and 'c' not in cache
+    assert 'd' in cache and 'e' in cache
+    assert cache.size == 12*300
+
+def test_cache_lru_replace_and_oversized():
+    cache = Utils.Misc.Cache_lru(12*300)
+    cache.Put('a', _Values(100))
+    cache.Put('a', _Values(50))
+    assert len(cache) == 1 and cache.size == 12*50
+    ## Entries larger than the budget are not stored, and replace nothing
+    cache.Put('b', _Values(400))
+    assert 'b' not in cache and 'a' in cache
+    cache.Put('a', _Values(400))
+    assert len(cache) == 0 and cache.size == 0
+
+def test_cache_lru_counters():
+    cache = Utils.Misc.Cache_lru(2**20)
+    values = _Values(10)
+    assert cache.Get('a') is None
+    cache.Put('a', values)
+    assert cache.Get('a') is values
+    assert cache.Get('a') is values
+    assert cache.Get('b') is None
+    assert cache.Stats == {'hits':2, 'misses':2, 'entries':1, 'size':120, 'budget':2**20}
+    cache.Clear()
+    assert cache.Stats == {'hits':0, 'misses':0, 'entries':0, 'size':0, 'budget':2**20}
@@ -0,0 +1,124 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+
+"""
+The batched light curves of Photometry against the former per-data set loop
+over Star.Flux and Star.Mag_flux.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from Icarus import Utils, benchmarks
+from Icarus.Utils.import_modules import cts
+
+
+PAR = [benchmarks.PAR[k] for k in ['q', 'porb', 'incl', 'k1', 'omega', 'filling', 'tempgrav', 'temp', 'tirr']]
+DM, AV = 10., 0.1
+
+
+@pytest.fixture(scope='module')
+def fit(tmp_path_factory):
+    pytest.importorskip('h5py')
+    from Icarus.Photometry import Photometry
+    workdir = str(tmp_path_factory.mktemp('photometry'))
+    atmo_fln = os.path.join(workdir, 'atmo.txt')
+    data_fln = os.path.join(workdir, 'data.txt')
+    rng = np.random.RandomState(1)
+    ## The band 'g' appears twice, with different phases
+    bands = [('g', 0), ('i', 1), ('g', 0)]
+    with open(atmo_fln, 'w') as fa, open(data_fln, 'w') as fd:
+        for k, (band, i) in enumerate(bands):
+            fln = os.path.join(workdir, 'atmo_{}.h5'.format(band))
+            if not os.path.exists(fln):
+                benchmarks.Synthetic_phot(name=band, zp=-48.6-i, ext=1.-0.5*i, offset=-0.3*i).WriteHDF5(fln, overwrite=True)
+            fa.write('{} {}\n'.format(band, fln))
+            phases = np.sort(rng.uniform(size=20+5*k))
+            fln = os.path.join(workdir, 'data_{}.txt'.format(k))
+            np.savetxt(fln, np.c_[phases, 20.+0.3*np.cos(phases*cts.TWOPI*2), phases*0.+0.02])
+            fd.write('{} 0 1 2 0. 0.05 0. mag {}\n'.format(band, fln))
+    ## A small chunksize to go through several chunks
+    fit = Photometry(atmo_fln, data_fln, 4, read=True, chunksize=7*1280)
+    assert list(fit.grouping) == [0, 1, 0]
+    ## The grids share their axes, hence the distinct bands are stacked
+    assert fit.atmo_stack.meta['bands'] == ['g', 'i']
+    return fit
+
+def _Offsets(fit, influx):
+    offsets = fit.data['ext']*AV + DM
+    if influx:
+        offsets = 10**(-0.4*offsets)
+    return offsets
+
+def _Assert_close(flux, expected):
+    ## The per-phase sums of Flux_phases are identical to those of Flux
+    for fl, ref in zip(flux, expected):
+        np.testing.assert_array_equal(fl, ref)
+
+def _Reference(fit, phases, influx):
+    ## The former per-data set loop
+    offsets = _Offsets(fit, influx)
+    flux = []
+    for i in np.arange(fit.ndataset):
+        if influx:
+            flux.append( np.array([fit.star.Flux(phase, atmo_grid=fit.atmo_grid[i]) for phase in phases[i]]) * offsets[i] )
+        else:
+            flux.append( np.array([fit.star.Mag_flux(phase, atmo_grid=fit.atmo_grid[i]) for phase in phases[i]]) + offsets[i] )
+    return flux
+
+@pytest.mark.parametrize('influx', [False, True])
+def test_get_flux(fit, influx):
+    flux = fit.Get_flux(PAR, DM=DM, AV=AV, influx=influx)
+    expected = _Reference(fit, fit.data['phase'], influx)
+    _Assert_close(flux, expected)
+
+@pytest.mark.parametrize('influx', [False, True])
+def test_get_flux_unstacked(fit, influx, monkeypatch):
+    ## The per-band evaluation, used when the grids cannot be stacked
+    monkeypatch.setattr(fit, 'atmo_stack', None)
+    flux = fit.Get_flux(PAR, DM=DM, AV=AV, influx=influx)
+    expected = _Reference(fit, fit.data['phase'], influx)
+    _Assert_close(flux, expected)
+
+@pytest.mark.parametrize('influx', [False, True])
+def test_get_flux_nsamples(fit, influx):
+    nsamples = 16
+    flux = fit.Get_flux(PAR, DM=DM, AV=AV, nsamples=nsamples, influx=influx)
+    phases = [np.arange(nsamples, dtype=float)/nsamples]*fit.ndataset
+    expected = _Reference(fit, phases, influx)
+    for i in np.arange(fit.ndataset):
+        ws, inds = Utils.Series.Getaxispos_vector(phases[i], fit.data['phase'][i])
+        np.testing.assert_array_equal(flux[i], expected[i][inds]*(1-ws) + expected[i][inds+1]*ws)
+
+@pytest.mark.parametrize('influx', [False, True])
+def test_get_flux_theoretical(fit, influx):
+    ## The data sets of the same band share their phases, as the former
+    ## loop copied the lightcurve of the first one.
+    phases = [np.linspace(0., 1., 11), np.linspace(0., 1., 7), np.linspace(0., 1., 11)]
+    flux = fit.Get_flux_theoretical(PAR, phases, DM=DM, AV=AV, influx=influx)
+    expected = _Reference(fit, phases, influx)
+    _Assert_close(flux, expected)
+
+@pytest.mark.skipif('fork' not in __import__('multiprocessing').get_all_start_methods(), reason="requires the fork start method")
+def test_calc_chi2_batch_pool(fit):
+    pars = [PAR[:5] + [filling] + PAR[6:] for filling in (0.8, 0.85, 0.9)]
+    try:
+        chi2 = fit.Calc_chi2_batch(pars, workers=2)
+        ## The radii are warm started from the previous surface of each process
+        np.testing.assert_allclose(chi2, [fit.Calc_chi2(par) for par in pars], rtol=1e-8)
+        pool = fit._pool
+        fit.Calc_chi2_batch(pars, workers=2)
+        assert fit._pool is pool
+        ## Changing the model re-creates the pool, so that the workers see it
+        fit.star.Set_surface_cache(0)
+        fit.Calc_chi2_batch(pars, workers=2)
+        assert fit._pool is not pool
+        pool = fit._pool
+        chunksize = fit.chunksize
+        fit.chunksize = chunksize*2
+        fit.Calc_chi2_batch(pars, workers=2)
+        assert fit._pool is not pool
+        fit.chunksize = chunksize
+    finally:
+        fit.Close_pool()
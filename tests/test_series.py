@@ -0,0 +1,52 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+
+"""
+The batched generalized polynomial fits against a least-squares solution of
+each spectrum.
+"""
+
+import numpy as np
+import pytest
+
+from Icarus import Utils
+
+
+def _Lstsq(y, x, err, coeff, f, offset):
+    ## Design matrix ordered as (a_n, ..., a_0), as GPolynomial_fit
+    if offset:
+        cols = [np.ones_like(x)] + [f*x**p for p in range(coeff-1)]
+    else:
+        cols = [f*x**p for p in range(coeff)]
+    a = np.array(cols[::-1]).T / err[:,None]
+    sol = np.linalg.lstsq(a, y/err, rcond=None)[0]
+    return sol, (((y - a.dot(sol)*err)/err)**2).sum()
+
+def _Spectra(nspec, n, rng):
+    x = np.arange(n) - n/2.
+    f = 1. + 0.3*rng.uniform(size=(nspec, n))
+    y = f*(2. + 1e-3*x - 1e-6*x**2) + 0.01*rng.normal(size=(nspec, n))
+    err = 0.01*(1 + rng.uniform(size=(nspec, n)))
+    return y, x, err, f
+
+@pytest.mark.parametrize('offset', [False, True])
+@pytest.mark.parametrize('coeff', [1, 3])
+def test_gpolynomial_fit_batch(offset, coeff):
+    rng = np.random.RandomState(0)
+    y, x, err, f = _Spectra(7, 300, rng)
+    ## A small chunksize to go through several chunks
+    sol, chi2 = Utils.Series.GPolynomial_fit_batch(y, x=x, err=err, coeff=coeff, Xfnct=f, Xfnct_offset=offset, chunksize=3*300)
+    for i in range(y.shape[0]):
+        sol_ref, chi2_ref = _Lstsq(y[i], x, err[i], coeff, f[i], offset)
+        np.testing.assert_allclose(sol[i], sol_ref, rtol=1e-7)
+        np.testing.assert_allclose(chi2[i], chi2_ref, rtol=1e-7)
+        assert chi2[i] >= 0.
+
+def test_gpolynomial_fit_batch_exact():
+    ## A noiseless spectrum gives a chi-square at the rounding level, not a
+    ## negative one as the expanded form could
+    rng = np.random.RandomState(1)
+    y, x, err, f = _Spectra(4, 200, rng)
+    y = f*(2. + 1e-3*x - 1e-6*x**2)
+    sol, chi2 = Utils.Series.GPolynomial_fit_batch(y, x=x, err=err, coeff=3, Xfnct=f)
+    np.testing.assert_allclose(sol, np.tile([-1e-6, 1e-3, 2.], (4,1)), rtol=1e-8)
+    assert (chi2 >= 0.).all() and (chi2 < 1e-15).all()
@@ -0,0 +1,99 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+
+import importlib
+
+import numpy as np
+import pytest
+
+from Icarus.Utils.import_modules import cts
+
+Spectroscopy = importlib.import_module('Icarus.Spectroscopy.Spectroscopy')
+
+V0 = 20e3
+
+
+@pytest.fixture
+def spectra():
+    rng = np.random.RandomState(3)
+    wav = 5000*(1+1e-5)**np.arange(2000)
+    ## Absorption lines at random positions, so that the cross-correlation has a single peak
+    centers = rng.uniform(0, 2000, size=40)
+    model = 1 - 0.5*np.exp(-0.5*((np.arange(2000)[:,None]-centers)/2.)**2).sum(axis=1)
+    wave_obs = wav[200:1800]
+    flux_obs = np.interp(np.log(wave_obs), np.log(wav*(1+V0/cts.c)), model)
+    return flux_obs, flux_obs*0+0.01, model, wave_obs, wav
+
+def test_velocity_search(spectra):
+    flux_obs, err, model, wave_obs, wav = spectra
+    v, v_err, chi2 = Spectroscopy.Velocity_search([flux_obs], [err], [model], [wave_obs], wav)
+    assert abs(v[0]-V0) < 300.
+
+def test_velocity_search_nothing_searchable(spectra):
+    flux_obs, err, model, wave_obs, wav = spectra
+    v, v_err, chi2 = Spectroscopy.Velocity_search([flux_obs, flux_obs], [err, err], [model, model], [wave_obs, wave_obs], wav, v_approx=[0., 1e9], vrange=30e3)
+    assert abs(v[0]-V0) < 300.
+    assert np.isnan(v[1]) and np.isinf(v_err[1]) and np.isinf(chi2[1])
+
+def test_velocity_search_chunked(spectra):
+    ## Chunks of one spectrum give the same results as a single chunk,
+    ## including for a spectrum with nothing searchable
+    flux_obs, err, model, wave_obs, wav = spectra
+    args = ([flux_obs, flux_obs[100:], flux_obs], [err, err[100:], err], [model]*3, [wave_obs, wave_obs[100:], wave_obs], wav)
+    kwargs = dict(v_approx=[0., 10e3, 1e9], vrange=30e3)
+    res = Spectroscopy.Velocity_search(*args, **kwargs)
+    res_chunked = Spectroscopy.Velocity_search(*args, chunksize=1, **kwargs)
+    for r, r_chunked in zip(res, res_chunked):
+        np.testing.assert_array_equal(r, r_chunked)
+    assert np.isnan(res_chunked[0][2])
+
+def test_process_flux1_units(spectra):
+    ## v_approx and the returned shift are in units of v/c
+    flux_obs, err, model, wave_obs, wav = spectra
+    z, chi2 = Spectroscopy.Process_flux1(flux_obs, err, model, wave_obs, wav, 15e3/cts.c, vrange=10e3)
+    assert abs(z*cts.c-V0) < 300.
+
+def test_normalize_spectrum_given_coefficients():
+    rng = np.random.RandomState(4)
+    x = np.arange(100) - 50
+    flux_model = rng.uniform(0.5, 1.5, size=100)
+    a_n = np.array([1e-4, 0.01, 2.])
+    flux = np.poly1d(a_n)(x) * flux_model + rng.normal(scale=0.01, size=100)
+    norm_flux_model, chi2 = Spectroscopy.Normalize_spectrum(flux_model, flux, flux_err=0.01, a_n=a_n)
+    np.testing.assert_allclose(norm_flux_model, np.poly1d(a_n)(x) * flux_model)
+    np.testing.assert_allclose(chi2, np.sum(((flux-norm_flux_model)/0.01)**2))
+    assert Spectroscopy.Normalize_spectrum(flux_model, flux, flux_err=0.01, a_n=a_n, chi2only=True) == chi2
+
+def _Normalize_lstsq(flux_model, flux, flux_err, coeff):
+    ## The single-spectrum normalization of Normalize_spectrum, as a least-squares solution
+    n = np.size(flux_model)
+    x = np.arange(n) - n/2
+    err = np.broadcast_to(1. if flux_err is None else flux_err, (n,))
+    a = np.array([flux_model*x**p for p in range(coeff)][::-1]).T / err[:,None]
+    a_n = np.linalg.lstsq(a, flux/err, rcond=None)[0]
+    norm = np.poly1d(a_n)(x) * flux_model
+    return norm, (((flux - norm)/err)**2).sum()
+
+@pytest.mark.parametrize('errors', ['array', 'scalar', 'none'])
+def test_normalize_spectrum_batch(errors):
+    rng = np.random.RandomState(4)
+    ## Ragged lengths
+    npoints = [500, 321, 64, 500, 77]
+    flux_model = [1. + 0.2*rng.uniform(size=n) for n in npoints]
+    flux = [fm*(1.5 + 1e-3*np.arange(n) - 1e-6*np.arange(n)**2) + 0.01*rng.normal(size=n) for fm,n in zip(flux_model, npoints)]
+    if errors == 'array':
+        flux_err = [0.01*(1 + rng.uniform(size=n)) for n in npoints]
+    elif errors == 'scalar':
+        flux_err = 0.01
+    else:
+        flux_err = None
+    ## A small chunksize to go through several chunks
+    norm, chi2 = Spectroscopy.Normalize_spectrum_batch(flux_model, flux, flux_err=flux_err, coeff=3, chunksize=1000)
+    for i in range(len(npoints)):
+        err = flux_err[i] if errors == 'array' else flux_err
+        norm_ref, chi2_ref = _Normalize_lstsq(flux_model[i], flux[i], err, 3)
+        np.testing.assert_allclose(norm[i], norm_ref, rtol=1e-8)
+        np.testing.assert_allclose(chi2[i], chi2_ref, rtol=1e-7)
+        ## The single-spectrum path agrees as well
+        norm_single, chi2_single = Spectroscopy.Normalize_spectrum(flux_model[i], flux[i], flux_err=err, coeff=3)
+        np.testing.assert_allclose(norm[i], norm_single, rtol=1e-10)
+        np.testing.assert_allclose(chi2[i], chi2_single, rtol=1e-10)
@@ -0,0 +1,70 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+
+import numpy as np
+import pytest
+
+from Icarus import Core, Utils, benchmarks
+
+
+def _Has_gts():
+    try:
+        import gts
+    except ImportError:
+        return False
+    return True
+
+@pytest.mark.skipif(_Has_gts(), reason="the default mesh is generated by PyGTS when it is available")
+def test_default_mesh_is_the_shipped_one():
+    ## Without PyGTS, the default Star falls back to the shipped geodesic files
+    star = Core.Star(4)
+    prim = Utils.Tessellation.Read_geodesic(4)
+    np.testing.assert_array_equal(star.vertices, prim['vertices'])
+    np.testing.assert_array_equal(star.faces, prim['faces'])
+    assert not star.hierarchical
+
+@pytest.mark.parametrize('ndiv', [3, 4, 5])
+def test_mirror_surface(ndiv):
+    ## The surface solved over one element per group of mirror images is that of the full solve
+    star = Core.Star(ndiv, read=True)
+    star_full = Core.Star(ndiv, read=True)
+    assert star.mirror_faces is not None and star.mirror_vertices is not None
+    star_full.mirror_faces = star_full.mirror_vertices = None
+    star.Make_surface(**benchmarks.PAR)
+    star_full.Make_surface(**benchmarks.PAR)
+    for name in ['rc', 'rx', 'logg', 'gradx', 'grady', 'gradz', 'r_vertices', 'coschi', 'area']:
+        expected = getattr(star_full, name)
+        np.testing.assert_allclose(getattr(star, name), expected, rtol=0, atol=1e-13*np.abs(expected).max(), err_msg=name)
+
+@pytest.mark.parametrize('cls', [Core.Star_base.Star_base, lambda ndiv: Core.Star(ndiv, read=True)])
+def test_surface_cache(cls, monkeypatch):
+    ## Revisiting a geometry restores exactly the attributes calculated by _Surface
+    star = cls(4)
+    star.Make_surface(**benchmarks.PAR)
+    star.Make_surface(filling=0.8)
+    assert star.surface_cache.Stats['misses'] == 2 and star.surface_cache.Stats['hits'] == 0
+    expected = cls(4)
+    expected.Set_surface_cache(0)
+    expected.Make_surface(**benchmarks.PAR)
+    def fail():
+        raise AssertionError("_Surface called on a cache hit")
+    monkeypatch.setattr(star, '_Surface', fail)
+    star.Make_surface(filling=benchmarks.PAR['filling'])
+    assert star.surface_cache.Stats['hits'] == 1 and star.surface_cache.Stats['misses'] == 2
+    for name in star._surface_attrs:
+        np.testing.assert_array_equal(getattr(star, name), getattr(expected, name), err_msg=name)
+    ## The fluxes are hence unchanged as well
+    np.testing.assert_array_equal(star.logteff, expected.logteff)
+
+def test_surface_cache_eviction():
+    ## With room for a single geometry, alternating geometries always miss
+    star = Core.Star_base.Star_base(4)
+    star.Make_surface(**benchmarks.PAR)
+    size = star.surface_cache.size
+    star.Set_surface_cache(1.5*size/2**20)
+    for filling in [0.8, 0.9, 0.8, 0.9]:
+        star.Make_surface(**dict(benchmarks.PAR, filling=filling))
+    assert star.surface_cache.Stats['misses'] == 4 and star.surface_cache.Stats['hits'] == 0
+    assert len(star.surface_cache) == 1
+    ## A budget of 0 disables the cache
+    star.Set_surface_cache(0)
+    assert star.surface_cache is None
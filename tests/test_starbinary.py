@@ -0,0 +1,59 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+
+"""
+The batched StarBinary.Flux_eclipse_phases against the per-phase
+StarBinary.Flux_eclipse.
+"""
+
+import numpy as np
+import pytest
+
+from Icarus import CoreBinary, benchmarks
+
+
+## A small secondary, which is fully eclipsed around phase 0.5
+PAR = dict(benchmarks.PAR_ECLIPSE, q=0.2, filling1=0.99, filling2=0.5)
+PHASES = np.r_[np.linspace(0., 1., 120, endpoint=False), 0.5, 0.]
+
+
+@pytest.fixture(scope='module')
+def atmo():
+    return benchmarks.Synthetic_phot()
+
+@pytest.fixture(scope='module', params=[4, [4, 5]], ids=['single', 'hd'])
+def binary(request, atmo):
+    binary = CoreBinary.StarBinary(request.param, request.param, atmo_grid=atmo, read=True)
+    binary.Make_surface(**PAR)
+    return binary
+
+def test_occultation_types(binary):
+    ## The phases cover all the occultation cases
+    type1, type2 = binary.Occultation_phases(PHASES)
+    partial = 'partial' if binary.primary_hd is None else 'partial_hd'
+    assert set(type1) == set(['none', partial])
+    assert set(type2) == set(['none', partial, 'full'])
+
+@pytest.mark.parametrize('doppler', [0., None, 3.])
+@pytest.mark.parametrize('nchunk', [1, 7, 1000])
+def test_flux_eclipse_phases(binary, atmo, doppler, nchunk):
+    chunksize = nchunk*binary.primary.n_faces
+    fsum1, fsum2 = binary.Flux_eclipse_phases(PHASES, atmo_grid=atmo, doppler1=doppler, doppler2=doppler, nosum=True, chunksize=chunksize)
+    expected = np.array([binary.Flux_eclipse(phase, atmo_grid=atmo, doppler1=doppler, doppler2=doppler, nosum=True) for phase in PHASES])
+    ## The segments are reduced sequentially, hence the agreement is to rounding
+    np.testing.assert_allclose(fsum1, expected[:,0], rtol=1e-13)
+    np.testing.assert_allclose(fsum2, expected[:,1], rtol=1e-13)
+    ## The fully eclipsed phases are exactly zero
+    type1, type2 = binary.Occultation_phases(PHASES)
+    assert (fsum2[type2 == 'full'] == 0.).all()
+    np.testing.assert_allclose(binary.Flux_eclipse_phases(PHASES, atmo_grid=atmo, doppler1=doppler, doppler2=doppler, chunksize=chunksize), fsum1+fsum2, rtol=1e-15)
+
+def test_doppler_boosting_segments(binary):
+    star = binary.primary
+    mu = star._Mu(PHASES[:,None])
+    ivis, iface, bounds = star._Visible(mu)
+    logteff, logg = star.logteff[iface], star.logg[iface]
+    doppler = star.Doppler_boosting_segments(logteff, logg, bounds)
+    expected = [star.Doppler_boosting(logteff[i0:i1], logg[i0:i1]) for i0,i1 in zip(bounds[:-1], bounds[1:])]
+    np.testing.assert_allclose(doppler, expected, rtol=1e-13)
+    ## Empty segments
+    np.testing.assert_array_equal(star.Doppler_boosting_segments(logteff, logg, [0, 0, 0]), [0., 0.])
@@ -0,0 +1,118 @@
+# Licensed under a 3-clause BSD style license - see LICENSE
+
+import os
+
+import numpy as np
+import pytest
+
+from Icarus.Utils import Tessellation
+
+
+def test_cache_roundtrip(tmp_path):
+    fln_src = str(tmp_path / 'geodesic_n3.txt')
+    with open(fln_src, 'w') as f:
+        f.write('source\n')
+    res = {'ind': np.arange(10)}
+    Tessellation._Save_cache(fln_src, 'geodesic_n3.npz', res)
+    ## The cache is renamed into place, without leftover temporary files
+    assert sorted(os.listdir(str(tmp_path))) == ['geodesic_n3.npz', 'geodesic_n3.txt']
+    np.testing.assert_array_equal(Tessellation._Load_cache(fln_src, 'geodesic_n3.npz')['ind'], res['ind'])
+
+def test_cache_paths_namespaced(tmp_path):
+    ## The fallback caches of two installations do not collide
+    paths1 = Tessellation._Cache_paths(str(tmp_path / 'a' / 'geodesic_n3.txt'), 'geodesic_n3.npz')
+    paths2 = Tessellation._Cache_paths(str(tmp_path / 'b' / 'geodesic_n3.txt'), 'geodesic_n3.npz')
+    assert paths1[0] != paths2[0]
+    assert paths1[1] != paths2[1]
+    assert os.path.dirname(paths1[1]) == os.path.dirname(paths2[1])
+
+def _Sphere(n, rng):
+    p = rng.normal(size=(n, 3))
+    return p / np.sqrt((p**2).sum(axis=1))[:,None]
+
+def test_mirror_symmetry():
+    rng = np.random.RandomState(0)
+    p = _Sphere(50, rng)
+    p[:,1:] = np.abs(p[:,1:])
+    ## The 4 mirror images of each point, shuffled
+    p = np.r_[p, p*[1.,-1.,1.], p*[1.,1.,-1.], p*[1.,-1.,-1.]]
+    p = p[rng.permutation(p.shape[0])]
+    unique, src, sy, sz = Tessellation.Mirror_symmetry(p[:,0], p[:,1], p[:,2])
+    assert unique.size == 50
+    np.testing.assert_array_equal(p[unique][src,0], p[:,0])
+    np.testing.assert_array_equal(p[unique][src,1]*sy, p[:,1])
+    np.testing.assert_array_equal(p[unique][src,2]*sz, p[:,2])
+
+def test_mirror_symmetry_asymmetric():
+    rng = np.random.RandomState(1)
+    p = _Sphere(200, rng)
+    assert Tessellation.Mirror_symmetry(p[:,0], p[:,1], p[:,2]) is None
+    ## Symmetric under y -> -y only
+    p = np.r_[p, p*[1.,-1.,1.]]
+    assert Tessellation.Mirror_symmetry(p[:,0], p[:,1], p[:,2]) is None
+    ## A single point moved off its mirror position by more than tol
+    p = np.r_[p, p*[1.,1.,-1.]]
+    assert Tessellation.Mirror_symmetry(p[:,0], p[:,1], p[:,2]) is not None
+    p[0] += [0., 1e-6, 0.]
+    assert Tessellation.Mirror_symmetry(p[:,0], p[:,1], p[:,2]) is None
+
+@pytest.mark.parametrize('n', [0, 1, 2, 3, 4])
+def test_make_geodesic(n):
+    n_faces, n_vertices, faces, vertices, assoc, parents = Tessellation.Make_geodesic(n, parents=True)
+    assert n_vertices == 10*4**n+2 == vertices.shape[0]
+    assert n_faces == 20*4**n == faces.shape[0]
+    np.testing.assert_allclose((vertices**2).sum(axis=1), 1., rtol=1e-14)
+    ## Every vertex is used, and the faces associated with each vertex contain it
+    assert np.array_equal(np.unique(faces), np.arange(n_vertices))
+    for k in range(6):
+        valid = assoc[:,k] != -99
+        assert (faces[assoc[valid,k]] == np.arange(n_vertices)[valid,None]).any(axis=1).all()
+    np.testing.assert_array_equal(parents, np.arange(n_faces)//4)
+
+def _Centers(faces, vertices):
+    return vertices[faces].mean(axis=1)
+
+def _Assert_contains(faces, vertices, faces_low, vertices_low, ind):
+    ## The center of each face projects inside the spherical triangle of face ind
+    p = _Centers(faces, vertices)
+    a, b, c = np.rollaxis(vertices_low[faces_low[ind]], 1)
+    orient = np.sign((np.cross(a, b)*c).sum(axis=1))
+    for u, v in ((a, b), (b, c), (c, a)):
+        assert ((np.cross(u, v)*p).sum(axis=1)*orient > 0).all()
+
+@pytest.mark.parametrize('n', [1, 2, 3])
+def test_make_geodesic_parents_contain_children(n):
+    _, _, faces, vertices, _, parents = Tessellation.Make_geodesic(n, parents=True)
+    _, _, faces_low, vertices_low, _ = Tessellation.Make_geodesic(n-1)
+    ## The vertices of the coarser tessellation are kept, with the same indices
+    np.testing.assert_array_equal(vertices[:vertices_low.shape[0]], vertices_low)
+    _Assert_contains(faces, vertices, faces_low, vertices_low, parents)
+
+@pytest.mark.parametrize('n_high, n_low', [(1, 0), (2, 1), (3, 2), (4, 3), (2, 0), (3, 1), (3, 3)])
+def test_parent_faces(n_high, n_low):
+    _, _, faces_high, vertices_high, _ = Tessellation.Make_geodesic(n_high)
+    _, _, faces_low, vertices_low, _ = Tessellation.Make_geodesic(n_low)
+    ind = Tessellation.Parent_faces(n_high, n_low)
+    ## The parent of the parent...
+    expected = np.arange(faces_high.shape[0])
+    for i in range(n_high-n_low):
+        expected = expected // 4
+    np.testing.assert_array_equal(ind, expected)
+    assert (np.bincount(ind) == 4**(n_high-n_low)).all()
+    ## ...is the face found by the KD-tree search of Match_triangles
+    high = _Centers(faces_high, vertices_high)
+    low = _Centers(faces_low, vertices_low)
+    np.testing.assert_array_equal(Tessellation.Match_triangles(high[:,0], high[:,1], high[:,2], low[:,0], low[:,1], low[:,2]), ind)
+
+@pytest.mark.parametrize('n_high, n_low', [(4, 2), (5, 3)])
+def test_parent_faces_contain_children(n_high, n_low):
+    ## Over several levels of fine tessellations, the nearest face center
+    ## used by Match_triangles is that of a neighbour for a few faces,
+    ## whereas the face given by Parent_faces always contains them
+    _, _, faces_high, vertices_high, _ = Tessellation.Make_geodesic(n_high)
+    _, _, faces_low, vertices_low, _ = Tessellation.Make_geodesic(n_low)
+    _Assert_contains(faces_high, vertices_high, faces_low, vertices_low, Tessellation.Parent_faces(n_high, n_low))
+
+def test_parent_faces_invalid():
+    with pytest.raises(ValueError):
+        Tessellation.Parent_faces(2, 3)